@@ -0,0 +1,119 @@
+"""
+同结构任务的批量混合
+
+大量小尺寸变体任务（例如几百个 512×512、图层相同只有权重不同的任务）逐个混合时，
+每个任务都要把所有图层完整遍历一遍。Normal 和 Add 模式对输入是线性的：
+混合结果是各层输入的线性组合 sum(c_k * a_k) / 累积权重，系数只取决于权重和模式顺序。
+因此输入相同（路径和顺序一致）、只包含这两种模式的任务可以组成一批：
+各层输入按 (K, 像素数) 堆叠一次，所有任务的系数组成 (N, K) 矩阵，
+一次矩阵乘法得到 (N, 像素数) 的全部结果，每层输入只读取一次。
+
+Multiply、Overlay 和法线贴图模式是非线性的，按 (N, H, W, C) 堆叠逐层计算反而
+因超出 CPU 缓存而更慢，这些任务仍由 engine.blend_task 逐个混合。
+带遮罩的图层系数逐像素变化，无法组成系数矩阵，同样逐个混合。
+"""
+from collections import defaultdict
+
+import numpy as np
+
+import engine
+import image_cache
+import kernels
+import profiling
+
+# 可以批量混合的（线性）模式
+LINEAR_MODES = ("Normal", "Add")
+
+# 每次矩阵乘法产生的结果占用的内存上限（MB），超出时分段计算。
+# 分段较小时结果留在 CPU 缓存中，之后的截断和位深转换明显更快
+DEFAULT_BATCH_MB = 16
+
+
+def batch_key(task, precision="8bit", size="first", interpolation="auto"):
+    """返回可以与 task 一起批量混合的任务共有的键，不能批量混合时返回 None"""
+    if not task.items:
+        return None
+    layers = [item for item in task.items if item.enabled]
+    if any(item.blend_mode not in LINEAR_MODES or engine.has_mask(item) for item in layers):
+        return None
+    return (engine.reference_item(task).path, tuple(item.path for item in layers), precision,
+            size, interpolation)
+
+
+def group_jobs(tasks, settings):
+    """将任务按 batch_key 分组，返回 序号 -> 同组所有序号（升序）；只包含两个以上任务的组
+    
+    settings 为每个任务的 (精度, 尺寸策略, 插值方式)，None 表示设置无效（不参与批量混合）。
+    """
+    groups = defaultdict(list)
+    for index, (task, setting) in enumerate(zip(tasks, settings)):
+        key = None if setting is None else batch_key(task, *setting)
+        if key is not None:
+            groups[key].append(index)
+    return {index: members for members in groups.values() if len(members) > 1
+            for index in members}
+
+
+def layer_coefficients(task, readable):
+    """计算任务各启用图层的线性系数和累积权重
+    
+    readable 为每个启用图层的输入能否读取；无法读取的图层与 engine.blend_task 一样被跳过。
+    """
+    layers = [item for item in task.items if item.enabled]
+    coefficients = np.zeros(len(layers), dtype=np.float32)
+    total_weight = 0
+    for index, item in enumerate(layers):
+        if not readable[index]:
+            continue
+        if item.blend_mode == "Add":
+            coefficients *= 2
+        coefficients[index] += item.weight
+        total_weight += item.weight
+    return coefficients, total_weight
+
+
+def blend_batch(tasks, cache=None, precision="8bit", max_mb=DEFAULT_BATCH_MB, size="first",
+                interpolation="auto"):
+    """批量混合 batch_key 相同的一组任务，返回按顺序逐个产出结果的生成器
+    
+    结果与 engine.blend_task 相同（求和顺序不同，8 位输出可能相差 1）。
+    输入在调用时立即读取，第一张启用的贴图无法读取时直接抛出 BlendError。
+    """
+    tasks = [engine.as_task(task) for task in tasks]
+    if cache is None:
+        cache = image_cache.default_cache
+    flags = engine.READ_FLAGS[precision]
+    
+    first = tasks[0]
+    first_map, (width, height) = engine.load_reference(first, cache, flags, size)
+    channels = engine.image_channels(first_map)
+    shape = (height, width, channels)
+    
+    # 各层输入缩放到 [0, 1] 后按行堆叠
+    layers = [item for item in first.items if item.enabled]
+    inputs = np.zeros((len(layers), height * width * channels), dtype=np.float32)
+    readable = []
+    for index, item in enumerate(layers):
+        img = engine.read_resampled(cache, item.path, (width, height), interpolation, flags)
+        readable.append(img is not None)
+        if img is not None:
+            img = engine.match_channels(img, channels)
+            np.multiply(img, kernels.input_scale(img), out=inputs[index].reshape(shape),
+                        casting='unsafe')
+    
+    # 系数预先除以累积权重，矩阵乘法的结果直接是归一化后的值
+    matrix = np.zeros((len(tasks), len(layers)), dtype=np.float32)
+    for row, task in enumerate(tasks):
+        coefficients, total_weight = layer_coefficients(task, readable)
+        matrix[row] = coefficients / total_weight if total_weight > 0 else coefficients
+    
+    chunk = max(1, int(max_mb * 1024 * 1024) // max(1, inputs.shape[1] * 4))
+    return _blend_chunks(matrix, inputs, shape, precision, chunk)
+
+
+def _blend_chunks(matrix, inputs, shape, precision, chunk):
+    for start in range(0, matrix.shape[0], chunk):
+        with profiling.stage("blend:batch"):
+            results = np.matmul(matrix[start:start + chunk], inputs)
+        results = kernels.normalize(results.reshape((-1,) + shape), 1, precision)
+        yield from results
@@ -0,0 +1,73 @@
+"""
+批量混合基准：对比逐个 engine.blend_task 与 batch.blend_batch 的变体任务吞吐量
+
+    python benchmarks/bench_batch.py --size 512 --variants 200 --layers 4 8 16
+
+变体任务使用相同的输入和 Normal/Add 模式，只有权重不同。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch
+import engine
+import image_cache
+from bench_blend import prepare_inputs
+from models import BlendItem, BlendTask
+
+
+def build_variants(paths, layers, count, seed=0):
+    """生成 count 个图层相同、权重随机的任务"""
+    rng = np.random.default_rng(seed)
+    tasks = []
+    for index in range(count):
+        task = BlendTask(f"variant-{index}")
+        for layer in range(layers):
+            item = BlendItem(f"layer{layer}", paths[layer % len(paths)])
+            item.weight = float(rng.uniform(0.1, 1.0))
+            item.blend_mode = "Add" if layer == layers - 1 else "Normal"
+            task.items.append(item)
+        tasks.append(task)
+    return tasks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量混合基准")
+    parser.add_argument("--size", type=int, default=512, help="图像边长（像素）")
+    parser.add_argument("--variants", type=int, default=200, help="变体任务数")
+    parser.add_argument("--layers", type=int, nargs="+", default=[4, 8, 16], help="图层数")
+    parser.add_argument("--work-dir", help="合成贴图的存放目录（默认在系统临时目录）")
+    args = parser.parse_args(argv)
+    
+    work_dir = args.work_dir or os.path.join(tempfile.gettempdir(), "img-blender-bench")
+    os.makedirs(work_dir, exist_ok=True)
+    paths = prepare_inputs(args.size, work_dir)
+    cache = image_cache.ImageCache()
+    
+    print(f"{'图层':>4}{'逐个(任务/s)':>14}{'批量(任务/s)':>14}{'加速':>8}")
+    for layers in args.layers:
+        tasks = build_variants(paths, layers, args.variants)
+        engine.blend_task(tasks[0], cache=cache)  # 预热缓存
+        
+        start = time.perf_counter()
+        for task in tasks:
+            engine.blend_task(task, cache=cache)
+        single = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        for _ in batch.blend_batch(tasks, cache=cache):
+            pass
+        batched = time.perf_counter() - start
+        
+        print(f"{layers:>4}{len(tasks) / single:>14.1f}{len(tasks) / batched:>14.1f}"
+              f"{single / batched:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
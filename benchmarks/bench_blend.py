@@ -0,0 +1,210 @@
+"""
+混合引擎基准测试
+
+离线生成合成法线贴图，按混合模式、分辨率和图层数测量 engine.blend_task 的
+耗时、吞吐量（MP/s，按 分辨率 × 图层数 计算）和 numpy 分配的峰值内存，
+结果保存为 JSON 基线；compare 子命令对比两份结果并标记超过阈值的退化。
+
+    python benchmarks/bench_blend.py run -o baseline.json
+    python benchmarks/bench_blend.py run --sizes 512 1024 --layers 1 4 -o current.json
+    python benchmarks/bench_blend.py run --masked -o masked.json
+    python benchmarks/bench_blend.py compare baseline.json current.json --threshold 0.1
+
+--masked 为每个图层加上同一张灰度遮罩（逐像素权重），用于对比带遮罩与标量权重的开销。
+compare 发现退化时退出码为 1。
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine
+import image_cache
+from models import BLEND_MODES, BlendItem, BlendTask
+
+DEFAULT_SIZES = [512, 1024, 2048, 4096, 8192]
+DEFAULT_LAYERS = [1, 4, 8, 16, 32]
+# 每种分辨率生成的不同贴图数量，图层循环使用
+VARIANTS = 4
+
+
+def synthetic_normal_map(size, seed):
+    """生成一张切线空间法线贴图（BGR uint8）：随机起伏的高度场求梯度后编码"""
+    rng = np.random.default_rng(seed)
+    coarse = rng.standard_normal((max(2, size // 32),) * 2).astype(np.float32)
+    height = cv2.resize(coarse, (size, size), interpolation=cv2.INTER_CUBIC)
+    height += 0.05 * rng.standard_normal((size, size)).astype(np.float32)
+    
+    dy, dx = np.gradient(height)
+    normal = np.dstack([-dx * 8, -dy * 8, np.ones_like(height)])
+    normal /= np.linalg.norm(normal, axis=2, keepdims=True)
+    rgb = ((normal * 0.5 + 0.5) * 255).astype(np.uint8)
+    return np.ascontiguousarray(rgb[..., ::-1])
+
+
+def prepare_inputs(size, work_dir):
+    """为某个分辨率生成（或复用）合成贴图文件，返回路径列表"""
+    paths = []
+    for variant in range(VARIANTS):
+        path = os.path.join(work_dir, f"normal_{size}_{variant}.png")
+        if not os.path.exists(path):
+            cv2.imwrite(path, synthetic_normal_map(size, variant),
+                        [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        paths.append(path)
+    return paths
+
+
+def prepare_mask(size, work_dir):
+    """生成（或复用）一张水平渐变的灰度遮罩，返回路径"""
+    path = os.path.join(work_dir, f"mask_{size}.png")
+    if not os.path.exists(path):
+        ramp = np.linspace(0, 255, size).astype(np.uint8)
+        cv2.imwrite(path, np.tile(ramp, (size, 1)), [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    return path
+
+
+def build_task(paths, blend_mode, layers, mask=None):
+    """第一层为 Normal 底图，其余各层使用被测模式；mask 为所有图层共用的遮罩贴图"""
+    task = BlendTask(f"{blend_mode}-{layers}")
+    for index in range(layers):
+        item = BlendItem(f"layer{index}", paths[index % len(paths)])
+        item.blend_mode = "Normal" if index == 0 and layers > 1 else blend_mode
+        item.weight = 0.5 + 0.5 * (index % 2)
+        item.mask = mask
+        task.items.append(item)
+    return task
+
+
+def measure(task, cache, repeat):
+    """返回 (最短耗时秒, numpy 峰值分配字节)；输入已解码并缓存，只测混合本身"""
+    engine.blend_task(task, cache=cache)  # 预热缓存
+    best = float('inf')
+    tracemalloc.start()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        engine.blend_task(task, cache=cache)
+        best = min(best, time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def run(args):
+    work_dir = args.work_dir or os.path.join(tempfile.gettempdir(), "img-blender-bench")
+    os.makedirs(work_dir, exist_ok=True)
+    
+    results = []
+    for size in args.sizes:
+        paths = prepare_inputs(size, work_dir)
+        mask = prepare_mask(size, work_dir) if args.masked else None
+        # 缓存足够放下该分辨率的所有输入，避免测到解码；
+        # 有遮罩时还要放下遮罩、它的通道副本和它与各输入的乘积（float32，见 engine.layer_mask）
+        cache_mb = size * size * 4 * VARIANTS * 2 / 2**20 + 64
+        if mask is not None:
+            cache_mb += size * size * 4 * (3 * VARIANTS + 4) / 2**20
+        cache = image_cache.ImageCache(max_mb=cache_mb)
+        for blend_mode in args.modes:
+            for layers in args.layers:
+                task = build_task(paths, blend_mode, layers, mask)
+                seconds, peak = measure(task, cache, args.repeat)
+                entry = {
+                    'mode': blend_mode,
+                    'size': size,
+                    'layers': layers,
+                    'masked': args.masked,
+                    'seconds': round(seconds, 6),
+                    'mp_per_s': round(size * size * layers / seconds / 1e6, 2),
+                    'peak_mb': round(peak / 2**20, 2),
+                }
+                results.append(entry)
+                print(f"{blend_mode:<10}{size:>6}px {layers:>3} 层 "
+                      f"{seconds * 1000:>10.1f} ms {entry['mp_per_s']:>9.1f} MP/s "
+                      f"{entry['peak_mb']:>9.1f} MB")
+        cache.clear()
+    
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存到 {args.output}")
+    return 0
+
+
+def compare(args):
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+    
+    def key(entry):
+        return entry['mode'], entry['size'], entry['layers'], entry.get('masked', False)
+    
+    baseline_results = {key(entry): entry for entry in baseline['results']}
+    regressions = 0
+    for entry in current['results']:
+        old = baseline_results.get(key(entry))
+        if old is None:
+            continue
+        change = entry['seconds'] / old['seconds'] - 1
+        flag = ""
+        if change > args.threshold:
+            flag = "  <-- 退化"
+            regressions += 1
+        print(f"{entry['mode']:<10}{entry['size']:>6}px {entry['layers']:>3} 层 "
+              f"{old['seconds'] * 1000:>10.1f} -> {entry['seconds'] * 1000:>10.1f} ms "
+              f"{change:>+8.1%}{flag}")
+    
+    print(f"{regressions} 项超过阈值 {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="混合引擎基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    run_parser = subparsers.add_parser("run", help="运行基准并保存结果")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                            help="图像边长（像素）")
+    run_parser.add_argument("--layers", type=int, nargs="+", default=DEFAULT_LAYERS,
+                            help="图层数")
+    run_parser.add_argument("--modes", nargs="+", choices=BLEND_MODES, default=BLEND_MODES,
+                            help="混合模式")
+    run_parser.add_argument("--masked", action="store_true",
+                            help="每个图层使用同一张灰度遮罩（逐像素权重）")
+    run_parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最短耗时")
+    run_parser.add_argument("--work-dir", help="合成贴图的存放目录（默认在系统临时目录）")
+    run_parser.add_argument("-o", "--output", help="结果 JSON 文件")
+    run_parser.set_defaults(func=run)
+    
+    compare_parser = subparsers.add_parser("compare", help="对比两份结果")
+    compare_parser.add_argument("baseline", help="基线结果 JSON")
+    compare_parser.add_argument("current", help="当前结果 JSON")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="耗时增加超过该比例视为退化（默认 0.1）")
+    compare_parser.set_defaults(func=compare)
+    
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+任务配置读写基准：对比 JSON 与二进制 .blendpack 配置的保存、读取耗时、文件大小和读取时的峰值内存
+
+    python benchmarks/bench_config.py --tasks 10000 --items 10 --paths 200
+
+生成的任务随机组合少量贴图路径（与实际项目中大量任务共用底图的情况相同），
+部分子项带有遮罩（同样取自这些路径）或 alpha 权重，
+两种格式读回的任务都与原任务逐个比较 to_dict()，不一致时退出码为 1。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from models import BLEND_MODES, BlendItem, BlendTask
+
+
+def build_tasks(task_count, item_count, path_count, base_dir, seed=0):
+    """生成 task_count 个任务，每个任务 item_count 个子项，贴图从 path_count 个路径中选取"""
+    rng = np.random.default_rng(seed)
+    paths = [os.path.join(base_dir, "textures", f"normal_{index:04d}.png")
+             for index in range(path_count)]
+    tasks = []
+    for index in range(task_count):
+        task = BlendTask(f"task-{index}")
+        task.enabled = bool(index % 7)
+        if index % 5 == 0:
+            task.output_options = {'format': "tif", 'tiff_compression': "zstd"}
+        for layer, path_index in enumerate(rng.integers(0, path_count, item_count)):
+            path = paths[path_index]
+            item = BlendItem(os.path.basename(path), path)
+            item.weight = float(rng.uniform(0, 1))
+            item.blend_mode = BLEND_MODES[(index + layer) % len(BLEND_MODES)]
+            item.enabled = bool((index + layer) % 3)
+            if (index + layer) % 4 == 0:
+                item.mask = paths[(path_index + 1) % path_count]
+            item.alpha_weight = (index + layer) % 6 == 1
+            task.items.append(item)
+        tasks.append(task)
+    return tasks
+
+
+def timed(func):
+    """返回 (结果, 耗时秒)"""
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def peak_memory(func):
+    """单独运行一次，返回 Python 分配的峰值内存 MB（tracemalloc 会明显拖慢运行，不与计时同时进行）"""
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="任务配置读写基准")
+    parser.add_argument("--tasks", type=int, default=10000, help="任务数")
+    parser.add_argument("--items", type=int, default=10, help="每个任务的子项数")
+    parser.add_argument("--paths", type=int, default=200, help="不同贴图路径的数量")
+    parser.add_argument("--work-dir", help="配置文件的存放目录（默认在系统临时目录）")
+    args = parser.parse_args(argv)
+    
+    work_dir = args.work_dir or os.path.join(tempfile.gettempdir(), "img-blender-bench")
+    os.makedirs(work_dir, exist_ok=True)
+    tasks = build_tasks(args.tasks, args.items, args.paths, work_dir)
+    expected = [task.to_dict() for task in tasks]
+    
+    print(f"{args.tasks} 个任务，{args.tasks * args.items} 个子项")
+    print(f"{'格式':<12}{'保存(s)':>10}{'读取(s)':>10}{'读取峰值(MB)':>14}{'大小(MB)':>10}")
+    failed = False
+    for suffix in (".json", config.PACKED_SUFFIX):
+        path = os.path.join(work_dir, f"bench_config{suffix}")
+        _, save_time = timed(lambda: config.save_config(tasks, path))
+        loaded, load_time = timed(lambda: config.load_config(path))
+        peak = peak_memory(lambda: config.load_config(path))
+        size = os.path.getsize(path) / (1024 * 1024)
+        print(f"{suffix:<12}{save_time:>10.3f}{load_time:>10.3f}{peak:>14.1f}{size:>10.2f}")
+        if [task.to_dict() for task in loaded] != expected:
+            print(f"{suffix} 读回的任务与原任务不一致", file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
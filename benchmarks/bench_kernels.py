@@ -0,0 +1,90 @@
+"""
+混合内核基准：对比逐层分配临时数组的旧实现与 kernels 模块的原地内核
+
+    python benchmarks/bench_kernels.py --size 2048 --repeat 5
+
+输出每种混合模式每层的耗时和 numpy 分配的峰值内存（tracemalloc 统计）。
+法线贴图模式（RNM、UDN、Whiteout）没有旧实现，只输出内核的数据。
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kernels
+
+
+def legacy_layer(result, img, blend_mode, weight):
+    """旧版 blend_task_maps 中的逐层计算，作为对照"""
+    if blend_mode == "Normal":
+        weighted_img = img.astype(np.float32) * weight
+    elif blend_mode == "Multiply":
+        weighted_img = (img.astype(np.float32) / 255.0) * result
+        weighted_img *= weight
+    elif blend_mode == "Add":
+        weighted_img = result + (img.astype(np.float32) * weight)
+    else:
+        mask = result <= 127
+        weighted_img = np.where(mask,
+                              (2 * result * img.astype(np.float32)) / 255.0,
+                              255 - (2 * (255 - result) * (255 - img.astype(np.float32))) / 255.0)
+        weighted_img *= weight
+    result += weighted_img
+
+
+def measure(layer_fn, result, img, repeat):
+    """返回 (每层平均耗时秒, 峰值额外分配字节)"""
+    layer_fn(result, img)  # 预热，让缓冲区完成分配
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        layer_fn(result, img)
+    elapsed = (time.perf_counter() - start) / repeat
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="混合内核基准")
+    parser.add_argument("--size", type=int, default=2048, help="图像边长（像素）")
+    parser.add_argument("--repeat", type=int, default=5, help="每种模式重复次数")
+    args = parser.parse_args(argv)
+    
+    rng = np.random.default_rng(0)
+    shape = (args.size, args.size, 3)
+    img = rng.integers(0, 256, shape, dtype=np.uint8)
+    base = rng.uniform(0, 255, shape).astype(np.float32)
+    
+    print(f"{'模式':<10}{'旧实现(ms)':>12}{'内核(ms)':>12}{'加速':>8}{'旧峰值(MB)':>12}{'内核峰值(MB)':>14}")
+    for blend_mode in kernels.BLEND_KERNELS:
+        scratch = kernels.Scratch()
+        kernel = kernels.get_kernel(blend_mode)
+        # 每次从相同的初始结果开始，避免 Add/Multiply 累积到溢出
+        legacy_time, legacy_peak = measure(
+            lambda result, img: legacy_layer(result, img, blend_mode, 0.5),
+            base.copy(), img, args.repeat)
+        # 内核在 [0, 1] 范围内累积
+        kernel_time, kernel_peak = measure(
+            lambda result, img: kernel(result, img, 0.5, scratch),
+            base / 255, img, args.repeat)
+        print(f"{blend_mode:<10}{legacy_time * 1000:>12.1f}{kernel_time * 1000:>12.1f}"
+              f"{legacy_time / kernel_time:>7.1f}x"
+              f"{legacy_peak / 2**20:>12.1f}{kernel_peak / 2**20:>14.1f}")
+    
+    for blend_mode in kernels.NORMAL_MAP_KERNELS:
+        scratch = kernels.Scratch()
+        kernel_time, kernel_peak = measure(
+            lambda result, img: kernels.apply_layer(result, img, blend_mode, 0.5, 1.0, scratch),
+            base / 255, img, args.repeat)
+        print(f"{blend_mode:<10}{'-':>12}{kernel_time * 1000:>12.1f}{'-':>8}"
+              f"{'-':>12}{kernel_peak / 2**20:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+启动耗时基准：在新的 Python 进程中测量各入口的冷启动耗时和导入开销，并可与基线对比
+
+    python benchmarks/bench_startup.py run -o startup.json
+    python benchmarks/bench_startup.py compare baseline.json startup.json --threshold 0.2
+
+场景：
+- gui: 导入 main 并显示主窗口（使用 Qt 的 offscreen 平台，不需要显示器）
+- cli_help: python cli.py --help
+- headless_blend: 导入 exporter，混合一个任务并写出（不经过命令行解析）
+- cli_export: python cli.py 导出一个任务
+
+每个场景运行 --runs 次取中位数（包含解释器启动），另外用 python -X importtime 运行一次，
+统计导入的总耗时和加载了哪些较重的模块（cv2、numpy、PyQt6、tifffile、PIL）。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import config
+from bench_blend import prepare_inputs
+from models import BlendItem, BlendTask
+
+# 输入贴图的边长，足够小以便耗时主要来自启动
+INPUT_SIZE = 256
+SCENARIOS = ["gui", "cli_help", "headless_blend", "cli_export"]
+HEAVY_MODULES = ["cv2", "numpy", "PyQt6.QtWidgets", "tifffile", "PIL"]
+
+GUI_CODE = """
+import sys
+from PyQt6.QtWidgets import QApplication
+import main
+app = QApplication(sys.argv)
+window = main.NormalMapBlender()
+window.show()
+app.processEvents()
+"""
+
+HEADLESS_CODE = """
+import json
+import sys
+import exporter
+exporter.export_task(json.loads(sys.argv[1]), sys.argv[2])
+"""
+
+
+def build_commands(work_dir):
+    """各场景的命令行（不含解释器和 -X importtime）"""
+    paths = prepare_inputs(INPUT_SIZE, work_dir)
+    task = BlendTask("startup")
+    for index, blend_mode in enumerate(("Normal", "Overlay", "RNM")):
+        item = BlendItem(f"layer{index}", paths[index % len(paths)])
+        item.blend_mode = blend_mode
+        task.items.append(item)
+    config_path = os.path.join(work_dir, "startup_tasks.json")
+    config.save_config([task], config_path)
+    output_dir = os.path.join(work_dir, "startup_output")
+    cli = os.path.join(REPO_ROOT, "cli.py")
+    return {
+        'gui': ["-c", GUI_CODE],
+        'cli_help': [cli, "--help"],
+        'headless_blend': ["-c", HEADLESS_CODE, json.dumps(task.to_dict()),
+                           os.path.join(work_dir, "startup_headless.png")],
+        'cli_export': [cli, config_path, "-o", output_dir, "-j", "1", "--force"],
+    }
+
+
+def run_once(arguments, env, import_time=False):
+    """在新进程中运行一次，返回 (耗时秒, 标准错误输出)"""
+    command = [sys.executable] + (["-X", "importtime"] if import_time else []) + arguments
+    start = time.perf_counter()
+    completed = subprocess.run(command, cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(arguments[:2])[:80]} 退出码 {completed.returncode}：\n"
+                           f"{completed.stderr[-1000:]}")
+    return seconds, completed.stderr
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 的输出，返回 (顶层导入的总耗时秒, 模块名 -> 累计耗时秒)"""
+    total = 0.0
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        seconds = int(cumulative) / 1e6
+        # 模块名前只有一个空格的是顶层导入，缩进更多的是被其他模块导入的
+        if len(name) - len(name.lstrip()) == 1:
+            total += seconds
+        modules.setdefault(name.strip(), seconds)
+    return total, modules
+
+
+def run(args):
+    work_dir = args.work_dir or os.path.join(tempfile.gettempdir(), "img-blender-bench")
+    os.makedirs(work_dir, exist_ok=True)
+    commands = build_commands(work_dir)
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    
+    print(f"{'场景':<16}{'中位数(ms)':>12}{'最短(ms)':>10}{'导入(ms)':>10}  加载的较重模块")
+    results = []
+    for scenario in args.scenarios:
+        arguments = commands[scenario]
+        run_once(arguments, env)  # 预热磁盘缓存和 __pycache__
+        times = [run_once(arguments, env)[0] for _ in range(args.runs)]
+        import_seconds, modules = parse_importtime(run_once(arguments, env, import_time=True)[1])
+        heavy = {name: round(modules[name] * 1000, 1) for name in HEAVY_MODULES if name in modules}
+        entry = {
+            'scenario': scenario,
+            'median_ms': round(statistics.median(times) * 1000, 1),
+            'min_ms': round(min(times) * 1000, 1),
+            'import_ms': round(import_seconds * 1000, 1),
+            'heavy_modules_ms': heavy,
+        }
+        results.append(entry)
+        print(f"{scenario:<16}{entry['median_ms']:>12.1f}{entry['min_ms']:>10.1f}"
+              f"{entry['import_ms']:>10.1f}  {', '.join(heavy) or '-'}")
+    
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'runs': args.runs,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存到 {args.output}")
+    return 0
+
+
+def compare(args):
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+    
+    baseline_results = {entry['scenario']: entry for entry in baseline['results']}
+    regressions = 0
+    for entry in current['results']:
+        old = baseline_results.get(entry['scenario'])
+        if old is None:
+            continue
+        change = entry['median_ms'] / old['median_ms'] - 1
+        flag = ""
+        if change > args.threshold:
+            flag = "  <-- 退化"
+            regressions += 1
+        print(f"{entry['scenario']:<16}{old['median_ms']:>10.1f} -> {entry['median_ms']:>10.1f} ms "
+              f"{change:>+8.1%}{flag}")
+    
+    print(f"{regressions} 项超过阈值 {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="启动耗时基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    run_parser = subparsers.add_parser("run", help="运行基准并保存结果")
+    run_parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS,
+                            help="测量的场景")
+    run_parser.add_argument("--runs", type=int, default=5, help="每个场景的运行次数，取中位数")
+    run_parser.add_argument("--work-dir", help="合成贴图和输出的存放目录（默认在系统临时目录）")
+    run_parser.add_argument("-o", "--output", help="结果 JSON 文件")
+    run_parser.set_defaults(func=run)
+    
+    compare_parser = subparsers.add_parser("compare", help="对比两份结果")
+    compare_parser.add_argument("baseline", help="基线结果 JSON")
+    compare_parser.add_argument("current", help="当前结果 JSON")
+    compare_parser.add_argument("--threshold", type=float, default=0.2,
+                                help="中位数耗时增加超过该比例视为退化（默认 0.2）")
+    compare_parser.set_defaults(func=compare)
+    
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
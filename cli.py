@@ -0,0 +1,221 @@
+"""
+命令行批量导出
+
+不启动图形界面，直接执行任务配置文件中所有启用的任务：
+
+    python cli.py tasks.json other.json -o output -j 8 --format png
+
+加上 --watch 时导出完成后继续运行，输入贴图或配置文件改变时只重新导出受影响的任务，
+按 Ctrl+C 结束。
+
+退出码：0 全部成功；1 有任务失败；2 参数或配置文件错误。
+混合和导出模块（exporter 及其依赖的 cv2、numpy）在读取配置后才导入，
+--help 和参数错误可以立即返回。
+"""
+import argparse
+import os
+import sys
+
+import config
+import encoders
+import image_cache
+import output_cache
+import profiling
+import watcher
+
+EXIT_OK = 0
+EXIT_TASK_FAILED = 1
+EXIT_USAGE = 2
+
+
+def parse_size(value):
+    """--size 的取值：尺寸策略或 宽x高（例如 2048x2048）"""
+    if value in encoders.SIZE_POLICIES:
+        return value
+    width, separator, height = value.lower().partition("x")
+    if separator and width.isdigit() and height.isdigit() and int(width) > 0 and int(height) > 0:
+        return [int(width), int(height)]
+    raise argparse.ArgumentTypeError(
+        f"应为 {', '.join(encoders.SIZE_POLICIES)} 或 宽x高: {value}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="批量执行贴图混合任务配置")
+    parser.add_argument("configs", nargs="+", help="任务配置文件（JSON）")
+    parser.add_argument("-o", "--output-dir", required=True, help="输出目录")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="并行进程数（默认为CPU核心数）")
+    parser.add_argument("--format", choices=encoders.OUTPUT_FORMATS, default="png",
+                        help="输出图像格式（默认 png），任务配置中的 output.format 优先")
+    parser.add_argument("--precision", choices=encoders.PRECISIONS,
+                        help="输出精度（默认 8bit）：16bit 适用于 png/tif/npy，float 适用于 tif/exr/npy")
+    parser.add_argument("--size", type=parse_size,
+                        help="图层尺寸不同时的输出尺寸：first（第一个启用的图层，默认）、largest、"
+                             "smallest 或 宽x高，任务配置中的 output.size 优先")
+    parser.add_argument("--interpolation", choices=encoders.INTERPOLATIONS,
+                        help="缩放图层的插值方式（默认 auto：缩小用 area，放大用 lanczos）")
+    parser.add_argument("--png-compression", type=int, choices=range(10), metavar="0-9",
+                        help="PNG 压缩级别，越低编码越快、文件越大")
+    parser.add_argument("--webp-lossy", action="store_true",
+                        help="WebP 使用有损压缩（默认无损）")
+    parser.add_argument("--jpeg-quality", type=int, help="JPEG 质量 0-100")
+    parser.add_argument("--tiff-compression", choices=encoders.TIFF_COMPRESSIONS,
+                        help="TIFF 压缩方式（zstd 需要安装 tifffile 和 imagecodecs）")
+    parser.add_argument("--cache-mb", type=int, default=image_cache.DEFAULT_CACHE_MB,
+                        help="每个导出批次的解码图像缓存大小（MB）")
+    parser.add_argument("--max-memory-mb", type=int, default=None,
+                        help="使用分块引擎，限制每个进程混合时的峰值内存（MB），用于超大贴图")
+    parser.add_argument("--force", action="store_true",
+                        help="忽略输出清单，重新导出所有任务")
+    parser.add_argument("--hash-inputs", action="store_true",
+                        help="按输入文件内容（而不是修改时间）判断任务是否改变")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="记录各阶段（解码、缩放、混合、编码、写出）耗时和计数器，"
+                             "写出到 PATH（.csv 或 .json）")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="只列出将要执行的任务，不进行混合")
+    parser.add_argument("--watch", action="store_true",
+                        help="导出后继续监视输入贴图和配置文件，改变时重新导出受影响的任务")
+    parser.add_argument("--debounce", type=float, default=watcher.DEFAULT_DEBOUNCE,
+                        help="监视模式下文件最后一次改变后等待的秒数")
+    parser.add_argument("--poll-interval", type=float, default=watcher.DEFAULT_POLL_INTERVAL,
+                        help="监视模式下轮询文件的间隔秒数（未安装 watchdog 或使用 --poll 时）")
+    parser.add_argument("--poll", action="store_true",
+                        help="监视模式下始终轮询文件（例如网络磁盘上收不到文件通知时）")
+    return parser
+
+
+def export_options(args):
+    """命令行参数中的编码设置"""
+    return {
+        'format': args.format,
+        'precision': args.precision,
+        'size': args.size,
+        'interpolation': args.interpolation,
+        'png_compression': args.png_compression,
+        'webp_lossless': False if args.webp_lossy else None,
+        'jpeg_quality': args.jpeg_quality,
+        'tiff_compression': args.tiff_compression,
+    }
+
+
+def collect_jobs(config_paths, output_dir, options):
+    """读取所有配置文件，返回启用任务的 (task, output_path) 列表"""
+    import exporter
+    jobs = []
+    for config_path in config_paths:
+        tasks = config.load_config(config_path)
+        for index, task in enumerate(tasks):
+            if not task.enabled or not task.items:
+                continue
+            output_name = exporter.task_output_name(task, index, options)
+            jobs.append((task, os.path.join(output_dir, output_name)))
+    return jobs
+
+
+def export_jobs(jobs, args, options, manifest, force=False, profiler=None):
+    """导出输入或参数改变了的作业，返回 (失败数, 跳过的未改变作业数)"""
+    import exporter
+    pending, skipped = manifest.split(jobs, force, args.hash_inputs,
+                                      extra=encoders.resolve_options(options))
+    failed_count = 0
+    try:
+        for (task, output_path), written, error in exporter.run_exports(
+                pending, max(1, args.workers), cache_mb=args.cache_mb,
+                max_memory_mb=args.max_memory_mb, export_options=options, profiler=profiler):
+            if error is not None:
+                failed_count += 1
+                print(f"任务 '{task.name}' 失败：{str(error)}", file=sys.stderr)
+            elif written:
+                manifest.mark_done(output_path)
+                print(f"任务 '{task.name}' => {output_path}")
+    finally:
+        manifest.save()
+    return failed_count, len(skipped)
+
+
+def watch(jobs, args, options, manifest, failed=False):
+    """监视输入贴图和配置文件，改变时重新导出受影响的任务，直到按 Ctrl+C
+    
+    failed 表示首次导出有失败的任务。首次导出或之后任何一轮有任务失败（或重新读取配置出错）时
+    返回 EXIT_TASK_FAILED，与单次导出一致。
+    """
+    task_watcher = watcher.TaskWatcher(jobs, args.configs, args.debounce, args.poll_interval,
+                                       args.poll)
+    try:
+        print(f"正在监视 {len(task_watcher.index)} 个输入文件"
+              f"（{task_watcher.backend_name}），按 Ctrl+C 结束")
+        for directory in task_watcher.unwatched:
+            print(f"目录不存在，无法监视：{directory}", file=sys.stderr)
+        for paths, affected in task_watcher.changes():
+            if affected is None:
+                try:
+                    affected = collect_jobs(args.configs, args.output_dir, options)
+                except Exception as e:
+                    print(f"重新读取任务配置时出错：{str(e)}", file=sys.stderr)
+                    failed = True
+                    continue
+                task_watcher.set_jobs(affected)
+                print(f"任务配置已改变，检查全部 {len(affected)} 个任务")
+            else:
+                print(f"{len(paths)} 个输入文件已改变，重新导出 {len(affected)} 个任务")
+            failed_count, skipped_count = export_jobs(affected, args, options, manifest)
+            failed = failed or failed_count > 0
+            print(f"完成 {len(affected) - failed_count}/{len(affected)} 个任务"
+                  f"（跳过未改变的 {skipped_count} 个）")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        task_watcher.close()
+    return EXIT_TASK_FAILED if failed else EXIT_OK
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    options = export_options(args)
+    
+    try:
+        jobs = collect_jobs(args.configs, args.output_dir, options)
+    except Exception as e:
+        print(f"读取任务配置时出错：{str(e)}", file=sys.stderr)
+        return EXIT_USAGE
+    
+    # 提前报告不存在或无法读取的输入（混合时这些图层会被跳过）
+    problems = config.check_inputs(config.task_input_paths(task for task, _ in jobs))
+    if problems:
+        print(f"{len(problems)} 个输入文件不存在或无法读取：\n"
+              f"{config.format_input_report(problems)}", file=sys.stderr)
+    
+    # 跳过输入和参数都没有变化的任务
+    manifest = output_cache.OutputManifest(args.output_dir)
+    if args.dry_run:
+        pending, skipped = manifest.split(jobs, args.force, args.hash_inputs,
+                                          extra=encoders.resolve_options(options))
+        for task, output_path in pending:
+            print(f"{task.name} => {output_path}")
+        for task, output_path in skipped:
+            print(f"{task.name} => {output_path}（未改变，跳过）")
+        print(f"共 {len(jobs)} 个任务，需要导出 {len(pending)} 个")
+        return EXIT_OK
+    
+    os.makedirs(args.output_dir, exist_ok=True)
+    
+    profiler = profiling.Profiler() if args.profile else None
+    try:
+        failed_count, skipped_count = export_jobs(jobs, args, options, manifest, args.force,
+                                                  profiler)
+    finally:
+        if profiler is not None:
+            profiler.finish()
+            profiler.write(args.profile)
+    
+    if profiler is not None:
+        print(f"性能记录已写出到 {args.profile}：\n{profiler.summary()}")
+    print(f"完成 {len(jobs) - failed_count}/{len(jobs)} 个任务（跳过未改变的 {skipped_count} 个）")
+    if args.watch:
+        return watch(jobs, args, options, manifest, failed_count > 0)
+    return EXIT_TASK_FAILED if failed_count else EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
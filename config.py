@@ -0,0 +1,333 @@
+"""
+任务配置文件（JSON 或二进制 .blendpack）的读写
+
+图形界面的导入/导出和命令行批量导出共用这里的路径处理规则：
+相对路径相对于配置文件所在目录解析，导出时尽可能转换为相对路径。
+
+读取时按块解析 tasks 列表，每解析出一个任务就检查其结构和取值并立即产出，
+几十万个任务的配置文件不必整个读入内存，界面也可以边读边显示。
+输入文件是否存在由 check_inputs 并行检查，而不是等到混合时才被跳过。
+"""
+import json
+import os
+import re
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import encoders
+from models import BLEND_MODES, BlendTask
+
+# 二进制配置的扩展名
+PACKED_SUFFIX = ".blendpack"
+# 每次从配置文件读取的字符数
+READ_CHUNK_CHARS = 1 << 20
+# 并行检查输入文件的线程数（stat 在网络磁盘上主要是等待）
+STAT_WORKERS = 16
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER_START = "-0123456789"
+_NUMBER_CHARS = "0123456789.eE+-"
+
+
+class ConfigError(Exception):
+    """配置文件格式错误或内容无效"""
+
+
+class _JSONStream:
+    """按块读取文本，逐个解码 JSON 值（只保留尚未解码的部分）"""
+    
+    def __init__(self, f, chunk_chars):
+        self.f = f
+        self.chunk_chars = chunk_chars
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.line = 1  # buffer 开头所在的行号
+        self.eof = False
+    
+    def _fill(self):
+        """丢弃已解码的部分并读入下一块，文件已读完时返回 False"""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_chars)
+        if not chunk:
+            self.eof = True
+            return False
+        self.line += self.buffer.count("\n", 0, self.pos)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+    
+    def peek(self):
+        """跳过空白，返回下一个字符（文件结束时返回空字符串）"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+    
+    def expect(self, char):
+        if self.peek() != char:
+            raise self.error(f"此处应为 '{char}'")
+        self.pos += 1
+    
+    def value(self):
+        """解码下一个完整的 JSON 值"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                # 值可能被块边界截断，读入更多内容后重试
+                if self._fill():
+                    continue
+                raise self.error(e.msg, e.pos)
+            # 数字在块末尾时可能还没有结束（例如 "3." 之后是下一块的 "14"）
+            truncated = end == len(self.buffer) or (
+                self.buffer[self.pos] in _NUMBER_START and self.buffer[end] in _NUMBER_CHARS)
+            if truncated and self._fill():
+                continue
+            self.pos = end
+            return value
+    
+    def error(self, message, pos=None):
+        pos = self.pos if pos is None else pos
+        line = self.line + self.buffer.count("\n", 0, pos)
+        return ConfigError(f"配置文件格式错误（第 {line} 行）：{message}")
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_task(task_data):
+    """检查任务字典的结构和取值，有问题时抛出 ConfigError"""
+    if not isinstance(task_data, dict):
+        raise ConfigError("任务应为对象")
+    if not isinstance(task_data.get('name'), str):
+        raise ConfigError("缺少任务名称 name（字符串）")
+    if not isinstance(task_data.get('enabled', True), bool):
+        raise ConfigError("enabled 应为 true 或 false")
+    output = task_data.get('output', {})
+    if not isinstance(output, dict):
+        raise ConfigError("output 应为对象")
+    unknown = [key for key in output if key not in encoders.DEFAULT_OPTIONS]
+    if unknown:
+        raise ConfigError(f"output 中有未知的设置项: {', '.join(map(str, unknown))}，"
+                          f"可用: {', '.join(encoders.DEFAULT_OPTIONS)}")
+    items = task_data.get('items', [])
+    if not isinstance(items, list):
+        raise ConfigError("items 应为列表")
+    for index, item in enumerate(items):
+        where = f"第 {index + 1} 个子项"
+        if not isinstance(item, dict):
+            raise ConfigError(f"{where}应为对象")
+        if not isinstance(item.get('name'), str):
+            raise ConfigError(f"{where}缺少名称 name（字符串）")
+        if not isinstance(item.get('path'), str) or not item['path']:
+            raise ConfigError(f"{where}缺少贴图路径 path（字符串）")
+        weight = item.get('weight', 1.0)
+        if not _is_number(weight) or weight < 0:
+            raise ConfigError(f"{where}的权重 weight 应为非负数值: {weight!r}")
+        if item.get('blend_mode', "Normal") not in BLEND_MODES:
+            raise ConfigError(f"{where}的混合模式无效: {item['blend_mode']!r}，"
+                              f"可用: {', '.join(BLEND_MODES)}")
+        if not isinstance(item.get('enabled', True), bool):
+            raise ConfigError(f"{where}的 enabled 应为 true 或 false")
+        mask = item.get('mask')
+        if mask is not None and (not isinstance(mask, str) or not mask):
+            raise ConfigError(f"{where}的遮罩 mask 应为贴图路径（字符串）: {mask!r}")
+        if not isinstance(item.get('alpha_weight', False), bool):
+            raise ConfigError(f"{where}的 alpha_weight 应为 true 或 false")
+
+
+def is_packed(file_path):
+    """按扩展名判断是否为二进制配置（见 packed_config 模块）"""
+    return Path(file_path).suffix.lower() == PACKED_SUFFIX
+
+
+def resolve_path(path, base_dir):
+    """相对路径相对于 base_dir（配置文件所在目录）解析，绝对路径保持不变"""
+    item_path = Path(path)
+    if item_path.is_absolute():
+        return path
+    return str(Path(base_dir) / item_path)
+
+
+def relative_path(path, base_dir):
+    """尽可能将路径转换为相对于 base_dir 的相对路径"""
+    item_path = Path(path)
+    try:
+        # 尝试转换为相对路径
+        return str(item_path.relative_to(base_dir))
+    except ValueError:
+        # 如果无法转换为相对路径，保持原样
+        return str(item_path)
+
+
+def resolve_item_paths(task_data, base_dir, resolved=None):
+    """将任务字典中子项（及其遮罩）的相对路径解析为相对于 base_dir 的路径（原地修改）
+    
+    resolved 为 原路径 -> 解析结果 的字典，在多个任务之间共用时每个不同的路径只解析一次。
+    """
+    if resolved is None:
+        resolved = {}
+    for item in task_data.get('items', []):
+        for key in ('path', 'mask'):
+            path = item.get(key)
+            if path is None:
+                continue
+            if path not in resolved:
+                resolved[path] = resolve_path(path, base_dir)
+            item[key] = resolved[path]
+    return task_data
+
+
+def iter_tasks(file_path, chunk_chars=READ_CHUNK_CHARS):
+    """逐个读取配置文件中的任务，检查后产出 BlendTask
+    
+    格式错误或取值无效时抛出 ConfigError（之前产出的任务不受影响）。
+    二进制配置（.blendpack）整体读取后同样逐个检查（见 validate_task）并产出。
+    """
+    base_dir = str(Path(file_path).parent)
+    if is_packed(file_path):
+        import packed_config
+        try:
+            tasks = packed_config.read(file_path, lambda path: resolve_path(path, base_dir))
+        except packed_config.PackFormatError as e:
+            raise ConfigError(str(e)) from None
+        for index, task in enumerate(tasks):
+            _check_task(task.to_dict(), index)
+            yield task
+        return
+    with open(file_path, 'r', encoding='utf-8') as f:
+        stream = _JSONStream(f, chunk_chars)
+        found = False
+        count = 0
+        stream.expect("{")
+        while stream.peek() != "}":
+            if count:
+                stream.expect(",")
+            key = stream.value()
+            if not isinstance(key, str):
+                raise stream.error("键应为字符串")
+            stream.expect(":")
+            if key != 'tasks':
+                stream.value()  # 其他顶层字段不使用
+            else:
+                found = True
+                yield from _iter_task_list(stream, base_dir)
+            count += 1
+        stream.pos += 1
+        # 与 json.load 一样，顶层对象之后只允许空白
+        if stream.peek():
+            raise stream.error("顶层对象之后有多余的内容")
+    if not found:
+        raise ConfigError("配置文件中没有 tasks 列表")
+
+
+def _check_task(task_data, index):
+    """validate_task，错误信息前加上任务的序号和名称"""
+    try:
+        validate_task(task_data)
+    except ConfigError as e:
+        name = task_data.get('name') if isinstance(task_data, dict) else None
+        label = f" '{name}'" if isinstance(name, str) else ""
+        raise ConfigError(f"第 {index + 1} 个任务{label}：{e}") from None
+
+
+def _iter_task_list(stream, base_dir):
+    stream.expect("[")
+    resolved = {}
+    index = 0
+    while stream.peek() != "]":
+        if index:
+            stream.expect(",")
+        task_data = stream.value()
+        _check_task(task_data, index)
+        yield BlendTask.from_dict(resolve_item_paths(task_data, base_dir, resolved))
+        index += 1
+    stream.pos += 1
+
+
+def load_config(file_path):
+    """读取任务配置文件，返回 BlendTask 列表"""
+    return list(iter_tasks(file_path))
+
+
+def task_input_paths(tasks):
+    """所有任务引用的贴图和遮罩路径（去重并保持顺序）"""
+    return list(dict.fromkeys(path for task in tasks for item in task.items
+                              for path in item.input_paths()))
+
+
+def _input_problem(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return "文件不存在"
+    except OSError as e:
+        return f"无法访问（{e.strerror}）"
+    if not stat.S_ISREG(st.st_mode):
+        return "不是文件"
+    if not os.access(path, os.R_OK):
+        return "没有读取权限"
+    return None
+
+
+def check_inputs(paths, workers=STAT_WORKERS):
+    """并行检查输入文件，返回 路径 -> 问题说明（按路径顺序，只包含有问题的文件）"""
+    paths = list(dict.fromkeys(paths))
+    if not paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths)))) as pool:
+        problems = list(pool.map(_input_problem, paths))
+    return {path: problem for path, problem in zip(paths, problems) if problem}
+
+
+def format_input_report(problems, limit=20):
+    """将 check_inputs 的结果整理为每行一个文件的文本，最多列出 limit 个"""
+    lines = [f"{path}：{problem}" for path, problem in list(problems.items())[:limit]]
+    if len(problems) > limit:
+        lines.append(f"……另有 {len(problems) - limit} 个文件")
+    return "\n".join(lines)
+
+
+def save_config(tasks, file_path):
+    """将任务保存为配置文件，路径尽可能转换为相对于配置文件的相对路径
+    
+    扩展名为 .blendpack 时保存为二进制配置，否则保存为 JSON。
+    """
+    # 获取配置文件的目标目录
+    base_dir = str(Path(file_path).parent)
+    
+    if is_packed(file_path):
+        import packed_config
+        packed_config.write(tasks, file_path, lambda path: relative_path(path, base_dir))
+        return
+    
+    # 准备导出数据
+    export_data = {
+        'tasks': []
+    }
+    
+    relative = {}  # 每个不同的路径只转换一次
+    for task in tasks:
+        task_data = task.to_dict()
+        # 将文件路径转换为相对路径
+        for item in task_data['items']:
+            for key in ('path', 'mask'):
+                path = item.get(key)
+                if path is None:
+                    continue
+                if path not in relative:
+                    relative[path] = relative_path(path, base_dir)
+                item[key] = relative[path]
+        
+        export_data['tasks'].append(task_data)
+    
+    # 保存为JSON
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(export_data, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,193 @@
+"""
+输出编码设置
+
+导出时可以整体指定、也可以在任务配置中单独指定输出格式和编码参数，
+任务的设置优先。中间结果可以选择编码更快的格式（低压缩级别 PNG、.npy），
+最终资源可以选择体积更小的格式。
+
+支持的设置项：
+- format: png、webp、tif、npy、jpg、bmp、exr
+- precision: 输出精度（见下）
+- png_compression: PNG 压缩级别 0-9（None 表示使用 OpenCV 默认值）
+- webp_lossless: WebP 是否无损（默认 True）
+- jpeg_quality: JPEG 质量 0-100
+- tiff_compression: none、lzw、deflate、zstd（zstd 需要安装 tifffile 和 imagecodecs）
+- size: 输出尺寸，first（第一个启用的图层，默认）、largest / smallest（像素数最多 / 最少的
+  启用图层）或 [宽, 高]
+- interpolation: 尺寸与输出不同的图层的插值方式，auto（缩小用 area、放大用 lanczos，默认）、
+  nearest、linear、cubic、area、lanczos
+
+精度与内存：
+混合始终在 [0, 1] 范围的 float32 中进行（每像素每通道 4 字节的累积结果，另有
+Overlay 等模式使用的两块同样大小的临时缓冲区），precision 决定输入的读取方式和输出的位深：
+- 8bit: 与旧版本相同，输入按 8 位三通道读取，输出 uint8。解码缓存占用最小
+- 16bit: 输入按原始位深和通道数读取（保留 16 位和 alpha），输出 uint16，
+  适用于 png、tif、npy。16 位输入在解码缓存中占用 8 位的两倍
+- float: 输入同 16bit（float 的 EXR/TIFF 按原值读取），输出 [0, 1] 的 float32，
+  适用于 tif、exr、npy。输出文件和写出前的结果都是 8 位的四倍
+
+cv2、numpy 和 tifffile 在第一次编码时才导入，只需要读取设置的入口
+（图形界面的窗口、命令行参数解析）不必等待它们加载。
+"""
+import io
+import os
+
+# OpenCV 默认禁用 EXR 编解码，需要在首次读写 EXR 之前通过环境变量启用
+# （各入口都会导入本模块，读取 EXR 输入也依赖这里的设置）
+os.environ.setdefault("OPENCV_IO_ENABLE_OPENEXR", "1")
+
+import profiling
+
+OUTPUT_FORMATS = ["png", "webp", "tif", "npy", "jpg", "bmp", "exr"]
+TIFF_COMPRESSIONS = ["none", "lzw", "deflate", "zstd"]
+PRECISIONS = ["8bit", "16bit", "float"]
+SIZE_POLICIES = ["first", "largest", "smallest"]
+INTERPOLATIONS = ["auto", "nearest", "linear", "cubic", "area", "lanczos"]
+
+# 各输出格式支持的精度
+FORMAT_PRECISIONS = {
+    "png": ["8bit", "16bit"],
+    "webp": ["8bit"],
+    "tif": ["8bit", "16bit", "float"],
+    "npy": ["8bit", "16bit", "float"],
+    "jpg": ["8bit"],
+    "bmp": ["8bit"],
+    "exr": ["float"],
+}
+
+DEFAULT_OPTIONS = {
+    'format': "png",
+    'precision': "8bit",
+    'png_compression': None,
+    'webp_lossless': True,
+    'jpeg_quality': 95,
+    'tiff_compression': "deflate",
+    'size': "first",
+    'interpolation': "auto",
+}
+
+# OpenCV 内置的 TIFF 压缩方式（cv2 中的常量名）
+_CV2_TIFF_COMPRESSION = {
+    "none": "IMWRITE_TIFF_COMPRESSION_NONE",
+    "lzw": "IMWRITE_TIFF_COMPRESSION_LZW",
+    "deflate": "IMWRITE_TIFF_COMPRESSION_ADOBE_DEFLATE",
+}
+
+
+class EncodeError(Exception):
+    """编码设置无效或无法写出图像"""
+
+
+def load_tifffile():
+    """导入 tifffile，没有安装时返回 None"""
+    try:
+        import tifffile
+    except ImportError:
+        return None
+    return tifffile
+
+
+def _is_explicit_size(size):
+    return (isinstance(size, (list, tuple)) and len(size) == 2
+            and all(isinstance(n, int) and not isinstance(n, bool) and n > 0 for n in size))
+
+
+def _check_level(options, key, low, high):
+    """检查整数编码参数 key 在 [low, high] 范围内（None 表示使用默认值）"""
+    value = options[key]
+    if value is None:
+        return
+    if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+        raise EncodeError(f"无效的 {key}: {value!r}，应为 {low}-{high} 的整数")
+
+
+def resolve_options(export_options=None, task=None):
+    """合并默认设置、导出设置和任务自身的设置（后者优先）
+    
+    明确指定的尺寸统一为 (宽, 高) 元组。
+    """
+    options = dict(DEFAULT_OPTIONS)
+    options.update({key: value for key, value in (export_options or {}).items()
+                    if value is not None})
+    if task is not None and task.output_options:
+        options.update(task.output_options)
+    if options['format'] not in OUTPUT_FORMATS:
+        raise EncodeError(f"不支持的输出格式: {options['format']}")
+    if options['tiff_compression'] not in TIFF_COMPRESSIONS:
+        raise EncodeError(f"不支持的 TIFF 压缩方式: {options['tiff_compression']}")
+    if options['precision'] not in PRECISIONS:
+        raise EncodeError(f"不支持的输出精度: {options['precision']}")
+    if _is_explicit_size(options['size']):
+        options['size'] = tuple(options['size'])
+    elif options['size'] not in SIZE_POLICIES:
+        raise EncodeError(f"无效的输出尺寸: {options['size']!r}，"
+                          f"可用: {', '.join(SIZE_POLICIES)} 或 [宽, 高]")
+    if options['interpolation'] not in INTERPOLATIONS:
+        raise EncodeError(f"不支持的插值方式: {options['interpolation']}")
+    _check_level(options, 'png_compression', 0, 9)
+    _check_level(options, 'jpeg_quality', 0, 100)
+    if options['precision'] not in FORMAT_PRECISIONS[options['format']]:
+        raise EncodeError(f"{options['format']} 格式不支持 {options['precision']} 精度，"
+                          f"可用: {', '.join(FORMAT_PRECISIONS[options['format']])}")
+    return options
+
+
+def imwrite_params(options):
+    """将编码设置转换为 cv2.imwrite 的参数列表"""
+    import cv2
+    fmt = options['format']
+    if fmt == "png" and options['png_compression'] is not None:
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(options['png_compression'])]
+    if fmt == "webp":
+        # 质量大于 100 时 OpenCV 使用无损编码
+        return [cv2.IMWRITE_WEBP_QUALITY, 101 if options['webp_lossless'] else 90]
+    if fmt == "jpg":
+        return [cv2.IMWRITE_JPEG_QUALITY, int(options['jpeg_quality'])]
+    if fmt == "tif" and options['tiff_compression'] in _CV2_TIFF_COMPRESSION:
+        return [cv2.IMWRITE_TIFF_COMPRESSION,
+                getattr(cv2, _CV2_TIFF_COMPRESSION[options['tiff_compression']])]
+    return []
+
+
+def encode_image(img, options):
+    """按编码设置将图像编码为文件内容（bytes 或 numpy 缓冲区）"""
+    import cv2
+    import numpy as np
+    fmt = options['format']
+    if fmt == "npy":
+        buffer = io.BytesIO()
+        np.save(buffer, img)
+        return buffer.getbuffer()
+    if fmt == "tif" and options['tiff_compression'] == "zstd":
+        tifffile = load_tifffile()
+        if tifffile is None:
+            raise EncodeError("TIFF zstd 压缩需要安装 tifffile 和 imagecodecs")
+        rgb = img[..., [2, 1, 0, 3][:img.shape[2]]] if img.ndim == 3 and img.shape[2] >= 3 else img
+        buffer = io.BytesIO()
+        tifffile.imwrite(buffer, np.ascontiguousarray(rgb), compression="zstd",
+                         photometric="rgb" if rgb.ndim == 3 else "minisblack")
+        return buffer.getbuffer()
+    try:
+        encoded, data = cv2.imencode("." + fmt, img, imwrite_params(options))
+    except cv2.error as e:
+        if fmt == "exr":
+            raise EncodeError("当前 OpenCV 构建不支持写出 EXR") from e
+        raise EncodeError(f"无法编码为 {fmt}") from e
+    if not encoded:
+        raise EncodeError(f"无法编码为 {fmt}")
+    return data
+
+
+def write_image(path, img, options):
+    """按编码设置写出图像（img 为 OpenCV 的 BGR(A) 顺序，位深与 options['precision'] 一致）
+    
+    先在内存中编码再写入文件，两个阶段分别计入 profiling 的 encode 和 write。
+    """
+    with profiling.stage("encode"):
+        data = encode_image(img, options)
+    try:
+        with profiling.stage("write"), open(path, 'wb') as f:
+            f.write(data)
+    except OSError as e:
+        raise EncodeError(f"无法写入图像: {path}") from e
+    profiling.count("bytes_written", data.nbytes)
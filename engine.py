@@ -0,0 +1,332 @@
+"""
+混合引擎
+
+不依赖 PyQt6，可在无界面的渲染节点、命令行或子进程中直接使用。
+图形界面的预览和导出也通过这里完成混合。
+"""
+import threading
+
+import cv2
+import numpy as np
+
+import image_cache
+import kernels
+import profiling
+from models import BlendTask
+
+
+# 输出精度 -> cv2.imread 的读取方式；8 位与旧版本相同，按 8 位三通道读取
+READ_FLAGS = {
+    "8bit": cv2.IMREAD_COLOR,
+    "16bit": cv2.IMREAD_UNCHANGED,
+    "float": cv2.IMREAD_UNCHANGED,
+}
+
+# 遮罩贴图的读取方式：单通道，保留 16 位和 float
+MASK_FLAGS = cv2.IMREAD_GRAYSCALE | cv2.IMREAD_ANYDEPTH
+
+# 插值方式（见 encoders 模块的 interpolation 设置）-> cv2 的插值方式
+INTERPOLATIONS = {
+    "nearest": cv2.INTER_NEAREST,
+    "linear": cv2.INTER_LINEAR,
+    "cubic": cv2.INTER_CUBIC,
+    "area": cv2.INTER_AREA,
+    "lanczos": cv2.INTER_LANCZOS4,
+}
+
+
+class BlendError(Exception):
+    """混合过程中出现的错误（例如无法读取图像）"""
+
+
+class BlendCancelled(Exception):
+    """混合被调用方取消（例如预览参数已经改变）"""
+
+
+def as_task(task):
+    """接受 BlendTask 或其 to_dict() 字典，统一返回 BlendTask"""
+    if isinstance(task, dict):
+        return BlendTask.from_dict(task)
+    return task
+
+
+class PrefixCache:
+    """缓存逐层累积的混合结果
+    
+    Multiply、Overlay 等模式依赖之前各层累积的结果，因此修改第 k 层时，
+    前 k-1 层的累积结果可以直接复用，只需从第 k 层重新计算。
+    每层的签名包含贴图（和遮罩）文件的修改时间、权重、混合模式和启用状态，
+    任何一项变化都会使该层及其后的缓存失效。
+    内存不足以保存每一层时，按固定间隔保存检查点。
+    """
+    
+    def __init__(self, max_mb=512):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.reused_layers = 0  # 上一次混合复用的层数
+        self._signatures = []
+        self._states = {}  # 层序号 -> (累积结果, 累积权重)，表示该层混合完成后的状态
+        self._lock = threading.Lock()
+    
+    def clear(self):
+        with self._lock:
+            self._signatures = []
+            self._states = {}
+    
+    def restore(self, signatures):
+        """返回可复用的 (起始层序号, 累积结果副本, 累积权重)，没有可复用的状态时返回 None"""
+        with self._lock:
+            common = 0
+            for old, new in zip(self._signatures, signatures):
+                if old != new:
+                    break
+                common += 1
+            
+            # 丢弃失效的状态
+            self._signatures = list(signatures)
+            self._states = {index: state for index, state in self._states.items()
+                            if index < common}
+            if not self._states:
+                return None
+            
+            index = max(self._states)
+            result, total_weight = self._states[index]
+            return index + 1, result.copy(), _copy_weight(total_weight)
+    
+    def record(self, index, result, total_weight, layer_count):
+        """保存第 index 层混合完成后的状态"""
+        with self._lock:
+            if result.nbytes > self.max_bytes:
+                return
+            stride = -(-(layer_count * result.nbytes) // self.max_bytes)
+            if stride > 1 and index % stride != stride - 1:
+                return
+            self._states[index] = (result.copy(), _copy_weight(total_weight))
+
+
+def _copy_weight(total_weight):
+    """累积权重的副本：逐像素的累积权重数组会被之后的图层原地更新（见 kernels.apply_layer）"""
+    return total_weight.copy() if isinstance(total_weight, np.ndarray) else total_weight
+
+
+def layer_signatures(task, width, height, precision="8bit", interpolation="auto"):
+    """计算每一层的签名，用于判断 PrefixCache 中的状态是否仍然有效"""
+    return [(image_cache.file_key(item.path), width, height, precision, interpolation,
+             item.weight, item.blend_mode, item.enabled,
+             None if item.mask is None else image_cache.file_key(item.mask), item.alpha_weight)
+            for item in task.items]
+
+
+def reference_item(task):
+    """决定结果通道数（size 为 first 时还决定尺寸）的图层：第一个启用的子项，
+    全部禁用时为第一个子项"""
+    return next((item for item in task.items if item.enabled), task.items[0])
+
+
+def target_size(sizes, size="first"):
+    """按尺寸策略计算输出的 (宽, 高)
+    
+    sizes 为各启用图层的 (宽, 高)，第一个为参考图层；size 见 encoders 模块。
+    """
+    if size == "first":
+        return tuple(sizes[0])
+    if size == "largest":
+        return tuple(max(sizes, key=lambda pair: pair[0] * pair[1]))
+    if size == "smallest":
+        return tuple(min(sizes, key=lambda pair: pair[0] * pair[1]))
+    return tuple(size)
+
+
+def resample_flag(interpolation, source_size, size):
+    """插值方式对应的 cv2 常量；auto 在缩小时使用 area，放大时使用 lanczos"""
+    if interpolation != "auto":
+        return INTERPOLATIONS[interpolation]
+    if size[0] * size[1] < source_size[0] * source_size[1]:
+        return cv2.INTER_AREA
+    return cv2.INTER_LANCZOS4
+
+
+def load_reference(task, cache, flags, size="first"):
+    """读取参考图层，返回 (参考图层的图像, 输出的 (宽, 高))
+    
+    size 为 largest 或 smallest 时读取所有启用的图层以确定尺寸（无法读取的图层不计入）。
+    参考图层无法读取时抛出 BlendError。
+    """
+    reference = reference_item(task)
+    first_map = cache.get(reference.path, flags=flags)
+    if first_map is None:
+        raise BlendError(f"无法读取图像: {reference.path}")
+    sizes = [first_map.shape[1::-1]]
+    if size in ("largest", "smallest"):
+        for item in task.items:
+            if item.enabled and item is not reference:
+                img = cache.get(item.path, flags=flags)
+                if img is not None:
+                    sizes.append(img.shape[1::-1])
+    return first_map, target_size(sizes, size)
+
+
+def read_resampled(cache, path, size, interpolation="auto", flags=cv2.IMREAD_COLOR):
+    """通过 cache 读取图像并按插值方式缩放到 size=(宽, 高)，缩放结果同样被缓存"""
+    if interpolation != "auto":
+        return cache.get(path, size, INTERPOLATIONS[interpolation], flags)
+    img = cache.get(path, flags=flags)
+    if img is None or img.shape[1::-1] == tuple(size):
+        return img
+    return cache.get(path, size, resample_flag(interpolation, img.shape[1::-1], size), flags)
+
+
+def has_mask(item):
+    """子项是否使用逐像素权重（遮罩贴图或贴图自身的 alpha）"""
+    return item.mask is not None or item.alpha_weight
+
+
+def mask_plane(img, channel=None):
+    """遮罩图像（或它的第 channel 个通道）-> [0, 1] 的 float32 (H, W) 数组，没有该通道时返回 None"""
+    if channel is not None:
+        if img.ndim < 3 or img.shape[2] <= channel:
+            return None
+        img = img[..., channel]
+    elif img.ndim == 3:
+        img = img[..., 0]
+    plane = np.multiply(img, np.float32(kernels.input_scale(img)), dtype=np.float32)
+    return np.clip(plane, 0, 1, out=plane)
+
+
+def read_mask(cache, item, size, interpolation="auto"):
+    """读取子项的逐像素权重系数（见 kernels.apply_layer 的 mask），缩放到 size=(宽, 高)
+    
+    遮罩贴图按灰度读取；alpha_weight 时取贴图自身的 alpha（没有 alpha 时视为不透明），
+    两者都有时相乘。遮罩贴图无法读取时返回 None。
+    """
+    mask = None
+    if item.mask is not None:
+        img = read_resampled(cache, item.mask, size, interpolation, MASK_FLAGS)
+        if img is None:
+            return None
+        mask = mask_plane(img)
+    if item.alpha_weight:
+        img = read_resampled(cache, item.path, size, interpolation, cv2.IMREAD_UNCHANGED)
+        alpha = None if img is None else mask_plane(img, 3)
+        if alpha is not None:
+            mask = alpha if mask is None else np.multiply(mask, alpha, out=mask)
+    if mask is None:
+        mask = np.ones((size[1], size[0]), dtype=np.float32)
+    return mask
+
+
+def layer_mask(cache, item, img, flags, size, interpolation="auto"):
+    """子项的 kernels.LayerMask，遮罩贴图无法读取时返回 None
+    
+    img 为按 flags 读取并已转换通道数的贴图，size 和 interpolation 与 read_resampled 相同。
+    遮罩（见 read_mask）、它的通道副本和它与贴图的乘积都与权重无关，保存在 cache 中
+    （见 image_cache.ImageCache.derived）：共用同一遮罩的图层只读取一次，
+    调整权重或混合模式后重复预览时不再重新计算。
+    """
+    mask_paths = [item.mask] if item.mask is not None else []
+    if item.alpha_weight:
+        mask_paths.append(item.path)
+    key = ('mask', bool(item.alpha_weight), tuple(size), interpolation)
+    plane = cache.derived(mask_paths, key, lambda: read_mask(cache, item, size, interpolation))
+    if plane is None:
+        return None
+    channels = img.shape[2]
+    broadcast = cache.derived(mask_paths, key + (channels,),
+                              lambda: kernels.mask_broadcast(plane, channels))
+    product = cache.derived(mask_paths + [item.path], key + (channels, flags),
+                            lambda: kernels.mask_product(img, broadcast))
+    return kernels.LayerMask(plane, img, broadcast, product)
+
+
+def image_channels(img):
+    """混合结果的通道数：灰度图按 BGR 三通道处理"""
+    return 3 if img.ndim == 2 else img.shape[2]
+
+
+def match_channels(img, channels):
+    """将灰度、BGR 或 BGRA 图像转换为 channels 个通道（补充的 alpha 为不透明）"""
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR if channels == 3 else cv2.COLOR_GRAY2BGRA)
+    if img.shape[2] == channels:
+        return img
+    return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR if channels == 3 else cv2.COLOR_BGR2BGRA)
+
+
+def proxy_size(size, max_size):
+    """按比例缩小 (宽, 高) 使其不超过 max_size，不会放大"""
+    width, height = size
+    scale = min(max_size[0] / width, max_size[1] / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def blend_task(task, cache=None, prefix_cache=None, max_size=None, is_cancelled=None,
+               precision="8bit", size="first", interpolation="auto"):
+    """混合指定任务的所有贴图
+    
+    task 可以是 BlendTask 或 to_dict() 的结果。
+    图像通过 cache（默认为进程内共享的 image_cache.default_cache）读取。
+    提供 prefix_cache 时复用未改变的前若干层的累积结果（用于交互预览）。
+    提供 max_size=(宽, 高) 时先将各层缩小到不超过该尺寸的代理图再混合，
+    用于快速预览；结果与全分辨率混合后再缩小的结果近似但不完全相同。
+    is_cancelled 为可调用对象，每层混合前检查，返回 True 时抛出 BlendCancelled。
+    precision 为 "8bit"、"16bit" 或 "float"（见 encoders 模块）：后两者按原始位深读取输入
+    并保留 alpha，通道数与第一张启用的贴图相同，其他贴图的通道数按它转换。
+    size 和 interpolation 为输出尺寸策略和尺寸不同的图层的插值方式（见 encoders 模块），
+    缩放后的输入保存在 cache 中，重复预览和导出时不会再次缩放。
+    设置了遮罩（mask 或 alpha_weight）的子项按逐像素权重混合（见 layer_mask），
+    遮罩贴图无法读取时与无法读取的贴图一样跳过该层。
+    返回 precision 对应位深的 BGR(A) 数组；任务没有子项时返回 None。
+    第一张启用的贴图无法读取时抛出 BlendError。
+    """
+    task = as_task(task)
+    if not task.items:
+        return None
+    if cache is None:
+        cache = image_cache.default_cache
+    
+    flags = READ_FLAGS[precision]
+    
+    # 读取第一张启用的图确定通道数，按尺寸策略确定输出尺寸
+    first_map, (width, height) = load_reference(task, cache, flags, size)
+    channels = image_channels(first_map)
+    if max_size is not None and proxy_size((width, height), max_size) != (width, height):
+        width, height = proxy_size((width, height), max_size)
+        interpolation = "area"
+    
+    # 初始化结果数组
+    start = 0
+    result = None
+    total_weight = 0
+    if prefix_cache is not None:
+        signatures = layer_signatures(task, width, height, precision, interpolation)
+        restored = prefix_cache.restore(signatures)
+        if restored is not None:
+            start, result, total_weight = restored
+        prefix_cache.reused_layers = start
+        profiling.count("reused_layers", start)
+    if result is None:
+        result = np.zeros((height, width, channels), dtype=np.float32)
+    
+    # 混合所有启用的法线贴图
+    scratch = kernels.Scratch()
+    layer_count = len(task.items)
+    for index in range(start, layer_count):
+        if is_cancelled is not None and is_cancelled():
+            raise BlendCancelled()
+        item = task.items[index]
+        if item.enabled:
+            img = read_resampled(cache, item.path, (width, height), interpolation, flags)
+            mask = None
+            if img is not None:
+                img = match_channels(img, channels)
+                if has_mask(item):
+                    mask = layer_mask(cache, item, img, flags, (width, height), interpolation)
+                    if mask is None:
+                        img = None
+            if img is not None:
+                total_weight = kernels.apply_layer(result, img, item.blend_mode, item.weight,
+                                                   total_weight, scratch, mask)
+        
+        if prefix_cache is not None:
+            prefix_cache.record(index, result, total_weight, layer_count)
+    
+    return kernels.normalize(result, total_weight, precision)
@@ -0,0 +1,235 @@
+"""
+批量导出：混合任务并写出结果图像（不依赖 PyQt6）
+"""
+import multiprocessing
+import queue
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import batch
+import encoders
+import engine
+import profiling
+import scheduler
+import tiled
+
+# 写出线程最多积压的结果数，避免内存中同时持有过多整张结果
+MAX_PENDING_WRITES = 1
+
+
+def task_output_name(task, index, export_options=None):
+    """根据任务名称生成合法的输出文件名，名称为空时使用任务序号
+    
+    扩展名由输出格式决定（任务自身的设置优先于 export_options）。
+    """
+    fmt = encoders.resolve_options(export_options, task)['format']
+    safe_name = "".join(c for c in task.name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    if not safe_name:
+        safe_name = f"blende-task-{index + 1}"
+    return f"{safe_name}.{fmt}"
+
+
+def export_task(task, output_path, max_memory_mb=None, cache=None, export_options=None):
+    """混合单个任务并写出结果，返回是否写出了文件
+    
+    task 可以是 BlendTask 或 to_dict() 字典，便于在子进程中执行。
+    设置 max_memory_mb 时使用分块引擎，按条带混合并写出，峰值内存受该预算限制。
+    cache 为读取输入使用的图像缓存（默认为进程内共享的缓存）。
+    export_options 为导出的编码设置，任务自身的设置优先（见 encoders 模块）。
+    """
+    task = engine.as_task(task)
+    options = encoders.resolve_options(export_options, task)
+    if max_memory_mb is not None:
+        return tiled.blend_task_tiled(task, output_path, max_memory_mb, options=options)
+    
+    result = engine.blend_task(task, cache=cache, precision=options['precision'],
+                               size=options['size'], interpolation=options['interpolation'])
+    if result is None:
+        return False
+    encoders.write_image(output_path, result, options)
+    return True
+
+
+def _finished(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _write(output_path, result, options, profiler=None, task_name=None):
+    with profiling.activate(profiler, task_name):
+        encoders.write_image(output_path, result, options)
+    return True
+
+
+def _blend_settings(task, export_options):
+    """作业的 (精度, 尺寸策略, 插值方式)，用于批量混合分组"""
+    try:
+        options = encoders.resolve_options(export_options, task)
+    except encoders.EncodeError:
+        return None  # 设置无效的作业在执行时报告错误
+    return options['precision'], options['size'], options['interpolation']
+
+
+def _next_batch_result(streams, index, members, jobs, cache, options):
+    """取出作业所在组的下一个批量混合结果，组内第一个作业执行时进行批量混合
+    
+    组内最后一个作业取出结果后关闭并丢弃生成器，释放其中堆叠的输入和系数矩阵。
+    """
+    stream = streams.get(members[0])
+    if stream is None:
+        try:
+            stream = batch.blend_batch([jobs[index][0] for index in members], cache,
+                                       options['precision'], size=options['size'],
+                                       interpolation=options['interpolation'])
+        except Exception as e:
+            stream = e  # 组内其余作业报告同样的错误
+        streams[members[0]] = stream
+    try:
+        if isinstance(stream, Exception):
+            raise stream
+        return next(stream)
+    finally:
+        if index == members[-1]:
+            del streams[members[0]]
+            if not isinstance(stream, Exception):
+                stream.close()
+
+
+def export_batch(jobs, cache_mb=None, max_memory_mb=None, cancel_event=None, export_options=None,
+                 profiler=None):
+    """按顺序执行一批作业，逐个产出 (序号, written, error)
+    
+    批次内共用的输入通过 scheduler.SharedInputCache 只解码一次，
+    最后一个使用它的作业完成后释放。
+    输入相同、只使用线性模式的作业通过 batch 模块一次矩阵乘法批量混合。
+    编码和写出在单独的线程中进行，与下一个任务的混合重叠。
+    提供 profiler（profiling.Profiler）时按任务记录各阶段耗时。
+    """
+    jobs = [(engine.as_task(task), path) for task, path in jobs]
+    cache = scheduler.SharedInputCache([task for task, _ in jobs], cache_mb)
+    pending = deque()  # (序号, 写出结果的 Future)
+    groups = {}
+    if max_memory_mb is None:
+        groups = batch.group_jobs([task for task, _ in jobs],
+                                  [_blend_settings(task, export_options) for task, _ in jobs])
+    streams = {}  # 组内第一个作业的序号 -> 结果生成器（或批量混合时的异常）
+    
+    def finish(index, future):
+        try:
+            return index, future.result(), None
+        except Exception as e:
+            return index, False, e
+    
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        for index, (task, output_path) in enumerate(jobs):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            try:
+                options = encoders.resolve_options(export_options, task)
+                with profiling.activate(profiler, task.name):
+                    if max_memory_mb is not None:
+                        written = tiled.blend_task_tiled(task, output_path, max_memory_mb,
+                                                         options=options)
+                        pending.append((index, _finished(written)))
+                    else:
+                        if index in groups:
+                            result = _next_batch_result(streams, index, groups[index], jobs,
+                                                        cache, options)
+                        else:
+                            result = engine.blend_task(
+                                task, cache=cache, precision=options['precision'],
+                                size=options['size'], interpolation=options['interpolation'])
+                        if result is None:
+                            pending.append((index, _finished(False)))
+                        else:
+                            pending.append((index, writer.submit(_write, output_path, result,
+                                                                 options, profiler, task.name)))
+            except Exception as e:
+                yield index, False, e
+            finally:
+                cache.release(task)
+            
+            while pending and (pending[0][1].done() or len(pending) > MAX_PENDING_WRITES):
+                yield finish(*pending.popleft())
+        
+        while pending:
+            yield finish(*pending.popleft())
+
+
+def _export_batch_worker(jobs, cache_mb, max_memory_mb, export_options, cancel_event, results,
+                         batch_index, profile=False):
+    """进程池中执行一批作业，每完成一个就通过 results 队列通知主进程
+    
+    profile 为 True 时在最后发送 (batch_index, None, None, 性能记录)。
+    """
+    profiler = profiling.Profiler() if profile else None
+    for index, written, error in export_batch(jobs, cache_mb, max_memory_mb, cancel_event,
+                                              export_options, profiler):
+        # 异常对象不一定能跨进程传递，只传递错误信息
+        message = None if error is None else (str(error) or type(error).__name__)
+        results.put((batch_index, index, written, message))
+    if profiler is not None:
+        results.put((batch_index, None, None, profiler.records()))
+
+
+def run_exports(jobs, workers=1, cancel_event=None, cache_mb=None, max_memory_mb=None,
+                export_options=None, profiler=None):
+    """执行一组导出作业，按完成顺序逐个产出 (job, written, error)
+    
+    jobs 为 (task, output_path) 列表。作业先按输入依赖关系排序（见 scheduler），
+    workers 大于 1 时切成连续的批次交给进程池，每个子进程自行读取并解码输入、
+    直接写出结果，主进程只接收是否成功，因此不需要在进程间传递图像数据。
+    每个批次内共用的输入只解码一次。
+    cancel_event（threading.Event）被设置后不再启动新的作业，
+    已在执行的作业会完成并写出。
+    cache_mb 设置每个批次解码缓存的内存预算。
+    max_memory_mb 不为 None 时使用分块引擎，限制每个作业的峰值内存。
+    export_options 为导出的编码设置（见 encoders 模块）。
+    profiler（profiling.Profiler）不为 None 时记录各任务各阶段的耗时，子进程的记录合并到其中。
+    """
+    jobs = scheduler.order_jobs(list(jobs))
+    if workers <= 1 or len(jobs) <= 1:
+        for index, written, error in export_batch(jobs, cache_mb, max_memory_mb, cancel_event,
+                                                  export_options, profiler):
+            yield jobs[index], written, error
+        return
+    
+    batches = scheduler.split_batches(jobs, workers)
+    # 统一使用 spawn：与 Windows 行为一致，也避免在图形界面的多线程进程中 fork
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=len(batches), mp_context=context) as pool:
+        results = manager.Queue()
+        worker_cancel = manager.Event()
+        futures = [pool.submit(_export_batch_worker,
+                               [(task.to_dict(), path) for task, path in batch],
+                               cache_mb, max_memory_mb, export_options, worker_cancel,
+                               results, batch_index, profiler is not None)
+                   for batch_index, batch in enumerate(batches)]
+        
+        reported = set()
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                worker_cancel.set()
+            try:
+                batch_index, index, written, message = results.get(timeout=0.2)
+            except queue.Empty:
+                if all(future.done() for future in futures) and results.empty():
+                    break
+                continue
+            if index is None:
+                profiler.merge(message)  # 子进程结束时发送的性能记录
+                continue
+            reported.add((batch_index, index))
+            error = None if message is None else engine.BlendError(message)
+            yield batches[batch_index][index], written, error
+        
+        # 子进程异常退出时（例如内存不足被终止），该批次中未完成的作业全部报告为失败
+        for batch_index, future in enumerate(futures):
+            if future.cancelled() or future.exception() is None:
+                continue
+            error = engine.BlendError(f"导出进程异常退出：{future.exception()}")
+            for index, job in enumerate(batches[batch_index]):
+                if (batch_index, index) not in reported:
+                    yield job, False, error
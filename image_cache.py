@@ -0,0 +1,140 @@
+"""
+解码图像缓存
+
+按 (路径, 修改时间, 文件大小, 读取方式, 目标分辨率) 缓存解码（以及缩放）后的图像，
+预览和导出共用，调整参数时不再重复读取磁盘。超过内存预算时淘汰最久未使用的图像。
+cv2 在第一次读取图像时才导入，只用到 file_key 等的入口不必加载它。
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import profiling
+
+# 默认内存预算（MB）
+DEFAULT_CACHE_MB = 1024
+
+
+def file_key(path):
+    """返回标识文件当前内容的 (绝对路径, 修改时间, 文件大小)，文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+class ImageCache:
+    """线程安全的 LRU 图像缓存"""
+    
+    def __init__(self, max_mb=DEFAULT_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def set_budget(self, max_mb):
+        """设置内存预算（MB），超出部分立即淘汰"""
+        with self._lock:
+            self.max_bytes = int(max_mb * 1024 * 1024)
+            self._evict()
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+    
+    def get(self, path, target_size=None, interpolation=None, flags=None):
+        """读取图像，target_size 为 (宽, 高) 时按 interpolation 返回缩放后的图像
+        
+        interpolation 默认为 cv2.INTER_LINEAR。flags 为 cv2.imread 的读取方式，
+        默认为 IMREAD_COLOR（IMREAD_UNCHANGED 保留 16 位、float 和 alpha）。
+        返回只读数组；文件不存在或无法解码时返回 None（与 cv2.imread 一致）。
+        """
+        import cv2
+        if interpolation is None:
+            interpolation = cv2.INTER_LINEAR
+        if flags is None:
+            flags = cv2.IMREAD_COLOR
+        key = file_key(path)
+        if key is None:
+            return None
+        key += (flags,)
+        
+        img = self._lookup(key + (None,))
+        if img is None:
+            with profiling.stage("decode"):
+                img = cv2.imread(path, flags)
+            profiling.count("bytes_read", key[2])
+            if img is None:
+                return None
+            self._store(key + (None,), img)
+        
+        if target_size is None or img.shape[1::-1] == tuple(target_size):
+            return img
+        
+        resized_key = key + (tuple(target_size), interpolation)
+        resized = self._lookup(resized_key)
+        if resized is None:
+            with profiling.stage("resize"):
+                resized = cv2.resize(img, tuple(target_size), interpolation=interpolation)
+            self._store(resized_key, resized)
+        return resized
+    
+    def derived(self, paths, key, build):
+        """返回由 paths 这些文件派生的数组（如遮罩和它与贴图的乘积），key 区分不同的派生结果
+        
+        与解码的图像一样计入内存预算并按 LRU 淘汰，任一文件修改后自动失效。
+        build() 计算结果，返回 None 时不缓存；有文件不存在时直接返回 build() 的结果。
+        """
+        keys = tuple(file_key(path) for path in paths)
+        if None in keys:
+            return build()
+        key = ('derived', keys) + tuple(key)
+        value = self._lookup(key)
+        if value is None:
+            value = build()
+            if value is not None:
+                self._store(key, value)
+        return value
+    
+    def _lookup(self, key):
+        with self._lock:
+            img = self._entries.get(key)
+            if img is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        profiling.count("cache_miss" if img is None else "cache_hit")
+        return img
+    
+    def _store(self, key, img):
+        # 缓存中的图像会被多处共享，禁止原地修改
+        img.flags.writeable = False
+        with self._lock:
+            if img.nbytes > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+            self._entries[key] = img
+            self.current_bytes += img.nbytes
+            self._evict()
+    
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, img = self._entries.popitem(last=False)
+            self.current_bytes -= img.nbytes
+
+
+# 进程内共享的默认缓存
+default_cache = ImageCache()
+
+
+def configure(max_mb):
+    """设置默认缓存的内存预算（MB），也用作进程池的初始化函数"""
+    default_cache.set_budget(max_mb)
@@ -0,0 +1,420 @@
+"""
+混合模式内核
+
+每个内核把一层贴图按权重原地累加到 result（float32）中，
+中间结果使用预先分配的 Scratch 缓冲区，混合过程中不再为每层分配新数组；
+能用 cv2 的融合运算（addWeighted、带 scale 的 multiply 等）一步完成的计算不再拆成多次 numpy 运算。
+
+混合在 [0, 1] 范围内进行：输入可以是 uint8、uint16 或 float32，
+按位深的最大值缩放（s = 1/255、1/65535 或 1）后参与计算，缩放合并在 cv2 运算的系数中。
+数学上与逐层计算 weighted_img 再 result += weighted_img 等价（a = s * img）：
+- Normal:   result += w * a
+- Multiply: result += w * a * result，即 result *= 1 + w * a
+- Add:      result += result + w * a，即 result = 2 * result + w * a
+- Overlay:  result += w * overlay(result, a)
+
+法线贴图模式（RNM、UDN、Whiteout）把当前的合成结果 c = result / 累积权重 和该层都解码为
+切线空间向量 n = 2 * c - 1（B、G、R 通道依次为 z、y、x），按模式合成后重新归一化，
+再以权重为强度（截断到 0-1）与原合成结果做归一化线性插值并编码回 result。
+这些模式替换合成结果而不是叠加，因此不改变累积权重；没有之前的图层时按 Normal 处理。
+
+带遮罩的层（LayerMask）在每个像素使用各自的权重 w(x) = 权重 * 遮罩 m：上面的公式逐像素成立，
+只有 Add 的 result 项也按遮罩缩放（result = (1 + m) * result + w(x) * a），遮罩为 0 的像素
+在所有模式下都保持不变。累积权重随之变为 (H, W) 的数组，normalize 逐像素归一化。
+法线贴图模式的强度和"没有之前的图层"同样逐像素判断。没有遮罩的任务始终使用标量权重，计算方式不变。
+"""
+import cv2
+import numpy as np
+
+import profiling
+
+# 输入位深 -> 缩放到 [0, 1] 的系数；其他类型（float32 等）视为已在 [0, 1] 范围
+INPUT_SCALES = {
+    np.dtype(np.uint8): 1.0 / 255.0,
+    np.dtype(np.uint16): 1.0 / 65535.0,
+}
+
+# 输出精度 -> (数据类型, 最大值)
+OUTPUT_DTYPES = {
+    "8bit": (np.uint8, 255),
+    "16bit": (np.uint16, 65535),
+    "float": (np.float32, 1),
+}
+
+# Overlay 取暗部的阈值（与 8 位下的 result <= 127 一致）
+OVERLAY_THRESHOLD = float(np.float32(127 / 255))
+
+# 8 位输出按截断取整（与旧版本一致），补偿缩放带来的 float32 舍入误差
+_TRUNCATE_EPSILON = 1e-4
+
+# 逐像素归一化时累积权重的下限（float32 的最小正规数），避免除以 0
+_MIN_TOTAL_WEIGHT = float(np.finfo(np.float32).tiny)
+
+
+class Scratch:
+    """可复用的 float32 / uint8 掩码缓冲区，按需扩容"""
+    
+    def __init__(self):
+        self._float = []
+        self._mask = np.empty(0, dtype=np.uint8)
+    
+    def floats(self, shape, count, start=0):
+        """返回 count 个形状为 shape 的 float32 缓冲区（内容未初始化）
+        
+        同时使用多组缓冲区时用 start 区分，例如 floats(..., 2) 与 floats(..., 2, start=2)。
+        """
+        size = int(np.prod(shape))
+        while len(self._float) < start + count:
+            self._float.append(np.empty(0, dtype=np.float32))
+        views = []
+        for index in range(start, start + count):
+            if self._float[index].size < size:
+                self._float[index] = np.empty(size, dtype=np.float32)
+            views.append(self._float[index][:size].reshape(shape))
+        return views
+    
+    def mask(self, shape):
+        size = int(np.prod(shape))
+        if self._mask.size < size:
+            self._mask = np.empty(size, dtype=np.uint8)
+        return self._mask[:size].reshape(shape)
+
+
+class LayerMask:
+    """一个图层的逐像素权重系数 m（[0, 1]）
+    
+    plane 为 (H, W) 的系数，broadcast 为复制到 img 每个通道的 (H, W, C) 数组，
+    product 为 m * a（a 为缩放到 [0, 1] 的 img）。三者都与图层权重无关：
+    engine 把它们保存在图像缓存中，调整权重后重复预览时直接复用；没有提供的部分在这里计算。
+    """
+    
+    def __init__(self, plane, img, broadcast=None, product=None):
+        self.plane = plane
+        self.broadcast = mask_broadcast(plane, img.shape[2]) if broadcast is None else broadcast
+        self.product = mask_product(img, self.broadcast) if product is None else product
+
+
+def input_scale(img):
+    """将 img 缩放到 [0, 1] 的系数"""
+    return INPUT_SCALES.get(img.dtype, 1.0)
+
+
+def mask_broadcast(plane, channels):
+    """把 (H, W) 的遮罩复制到 channels 个通道（cv2 的逐元素运算不支持广播）"""
+    return cv2.merge([plane] * channels)
+
+
+def mask_product(img, broadcast):
+    """m * a 的 float32 数组，broadcast 为 mask_broadcast 的结果"""
+    return cv2.multiply(img, broadcast, scale=input_scale(img), dtype=cv2.CV_32F)
+
+
+# 下面的内核中 mask 为 LayerMask，None 表示整张图使用相同的权重；
+# 带遮罩时 w * m * a = w * mask.product，与标量权重一样一次 cv2 运算即可合入 result
+
+def blend_normal(result, img, weight, scratch, mask=None):
+    if mask is not None:
+        cv2.scaleAdd(mask.product, float(weight), result, dst=result)
+        return
+    scale = input_scale(img)
+    cv2.addWeighted(result, 1.0, img, weight * scale, 0.0, dst=result, dtype=cv2.CV_32F)
+
+
+def blend_multiply(result, img, weight, scratch, mask=None):
+    # factor = 1 + w * a
+    factor, = scratch.floats(result.shape, 1)
+    if mask is not None:
+        cv2.addWeighted(mask.product, float(weight), mask.product, 0.0, 1.0, dst=factor)
+    else:
+        cv2.addWeighted(img, weight * input_scale(img), img, 0.0, 1.0, dst=factor,
+                        dtype=cv2.CV_32F)
+    cv2.multiply(result, factor, dst=result)
+
+
+def blend_add(result, img, weight, scratch, mask=None):
+    if mask is not None:
+        # result * (1 + m) + w * m * a：遮罩为 0 的像素保持不变
+        cv2.accumulateProduct(result, mask.broadcast, result)
+        cv2.scaleAdd(mask.product, float(weight), result, dst=result)
+        return
+    scale = input_scale(img)
+    cv2.addWeighted(result, 2.0, img, weight * scale, 0.0, dst=result, dtype=cv2.CV_32F)
+
+
+def blend_overlay(result, img, weight, scratch, mask=None):
+    high, low = scratch.floats(result.shape, 2)
+    dark = scratch.mask(result.shape)
+    scale = input_scale(img)
+    
+    # 暗部：2 * result * a
+    cv2.multiply(result, img, dst=low, scale=2.0 * scale, dtype=cv2.CV_32F)
+    # 亮部：1 - 2 * (1 - result) * (1 - a)
+    #     = 2 * (result + a) - 1 - 暗部
+    cv2.addWeighted(result, 2.0, img, 2.0 * scale, -1.0, dst=high, dtype=cv2.CV_32F)
+    cv2.subtract(high, low, dst=high)
+    
+    # 取暗部的位置（cv2 的掩码拷贝比 np.where 快得多）
+    cv2.compare(result, OVERLAY_THRESHOLD, cv2.CMP_LE, dst=dark)
+    cv2.copyTo(low, dark, high)
+    
+    if mask is not None:
+        cv2.multiply(high, mask.broadcast, dst=high, scale=float(weight))
+        cv2.add(result, high, dst=result)
+    else:
+        cv2.scaleAdd(high, float(weight), result, dst=result)
+
+
+def _channel_sum(channels):
+    """cv2.transform 的矩阵：对前三个通道（向量的 x、y、z）求和，忽略 alpha"""
+    return np.array([[1.0, 1.0, 1.0, 0.0][:channels]], dtype=np.float32)
+
+
+def _broadcast(plane, like, dst):
+    """把 (H, W) 的 plane 复制到 like 的每个通道中（cv2 的逐元素运算不支持广播）"""
+    return cv2.merge([plane] * like.shape[2], dst=dst)
+
+
+def _normal_vectors(result, img, total_weight, scratch):
+    """解码为 [-1, 1] 的 (合成结果向量, 该层向量, 临时缓冲区)，均为 scratch 中的缓冲区"""
+    base, detail, temp = scratch.floats(result.shape, 3)
+    cv2.addWeighted(result, 2.0 / total_weight, result, 0.0, -1.0, dst=base)
+    cv2.addWeighted(img, 2.0 * input_scale(img), img, 0.0, -1.0, dst=detail, dtype=cv2.CV_32F)
+    return base, detail, temp
+
+
+def _renormalize(vectors, temp, planes):
+    """将 vectors 的前三个通道原地归一化"""
+    length = planes[0]
+    cv2.multiply(vectors, vectors, dst=temp)
+    cv2.transform(temp, _channel_sum(vectors.shape[2]), dst=length)
+    np.maximum(length, np.float32(1e-12), out=length)
+    cv2.sqrt(length, dst=length)
+    cv2.divide(vectors, _broadcast(length, vectors, temp), dst=vectors)
+
+
+# 下面的合成函数中 B、G、R 通道依次为 z、y、x，标量元组按通道作用
+
+def _combine_udn(base, detail, temp, planes):
+    # (x1 + x2, y1 + y2, z1)
+    cv2.multiply(detail, (0, 1, 1, 0), dst=temp)
+    cv2.add(base, temp, dst=base)
+
+
+def _combine_whiteout(base, detail, temp, planes):
+    # (x1 + x2, y1 + y2, z1 * z2)
+    cv2.multiply(detail, (1, 0, 0, 0), dst=temp)
+    cv2.add(temp, (0, 1, 1, 0), dst=temp)
+    cv2.multiply(base, temp, dst=base)
+    _combine_udn(base, detail, temp, planes)
+
+
+def _combine_rnm(base, detail, temp, planes):
+    # Reoriented Normal Mapping：t = n1 + (0, 0, 1)，u = n2 * (-1, -1, 1)，
+    # r = t * dot(t, u) - u * t.z（之后统一归一化，省去除以 t.z）
+    dot, t_z = planes
+    cv2.add(base, (1, 0, 0, 0), dst=base)
+    cv2.multiply(detail, (1, -1, -1, 0), dst=detail)
+    cv2.multiply(base, detail, dst=temp)
+    cv2.transform(temp, _channel_sum(base.shape[2]), dst=dot)
+    cv2.extractChannel(base, 0, dst=t_z)
+    cv2.multiply(base, _broadcast(dot, base, temp), dst=base)
+    cv2.multiply(detail, _broadcast(t_z, detail, temp), dst=detail)
+    cv2.subtract(base, detail, dst=base)
+
+
+def _blend_normal_map(combine, result, img, weight, total_weight, scratch):
+    """法线贴图模式的公共流程，返回新的累积权重"""
+    if total_weight <= 0:
+        blend_normal(result, img, weight, scratch)
+        return total_weight + weight
+    
+    strength = min(max(float(weight), 0.0), 1.0)
+    base, detail, temp = _normal_vectors(result, img, total_weight, scratch)
+    planes = scratch.floats(result.shape[:2], 2, start=3)
+    combine(base, detail, temp, planes)
+    _renormalize(base, temp, planes)
+    if strength < 1:
+        # 与原合成结果插值：strength * r + (1 - strength) * (2 * result / T - 1)
+        cv2.addWeighted(base, strength, result, (1 - strength) * 2.0 / total_weight,
+                        strength - 1, dst=base)
+        _renormalize(base, temp, planes)
+    
+    # alpha 等其他通道按强度线性插值
+    extra = None
+    if result.shape[2] > 3:
+        extra = planes[0]
+        np.multiply(img[..., 3], strength * total_weight * input_scale(img), out=extra,
+                    casting='unsafe')
+        extra += (1 - strength) * result[..., 3]
+    
+    # 编码回 result：T * (n / 2 + 0.5)
+    cv2.addWeighted(base, total_weight / 2.0, base, 0.0, total_weight / 2.0, dst=result)
+    if extra is not None:
+        result[..., 3] = extra
+    return total_weight
+
+
+def _blend_normal_map_per_pixel(combine, result, img, weight, mask, total_weight, scratch):
+    """逐像素权重的法线贴图模式：mask 为 LayerMask 或 None，total_weight 为 (H, W) 的数组
+    
+    与 _blend_normal_map 逐像素相同，累积权重为 0 的像素按 Normal 处理，
+    遮罩为 0 的像素保持不变。原地更新 total_weight。
+    """
+    shape = result.shape
+    scale = input_scale(img)
+    strength, totals, fallback = scratch.floats(shape, 3, start=5)
+    planes = scratch.floats(shape[:2], 2, start=3)
+    first = scratch.mask(shape[:2])
+    
+    # 没有之前图层的像素按 Normal 处理：fallback = result + w * a，累积权重加上 w；
+    # 遮罩为 0 的像素同样取 fallback，此时它与原结果相同
+    cv2.compare(total_weight, 0.0, cv2.CMP_LE, dst=first)
+    if mask is not None:
+        cv2.bitwise_or(first, cv2.compare(mask.plane, 0.0, cv2.CMP_LE), dst=first)
+        cv2.scaleAdd(mask.product, float(weight), result, dst=fallback)
+    else:
+        cv2.addWeighted(result, 1.0, img, weight * scale, 0.0, dst=fallback, dtype=cv2.CV_32F)
+    
+    # 这些像素的累积权重按 1 计算，结果最后被 fallback 覆盖
+    np.copyto(planes[0], total_weight)
+    np.copyto(planes[0], 1, where=first.view(bool))
+    _broadcast(planes[0], result, totals)
+    if mask is not None:
+        cv2.multiply(mask.broadcast, float(weight), dst=strength)
+        np.clip(strength, 0, 1, out=strength)
+    else:
+        strength.fill(min(max(float(weight), 0.0), 1.0))
+    
+    base, detail, temp = scratch.floats(shape, 3)
+    cv2.divide(result, totals, dst=base, scale=2.0)
+    cv2.addWeighted(base, 1.0, base, 0.0, -1.0, dst=base)
+    cv2.addWeighted(img, 2.0 * scale, img, 0.0, -1.0, dst=detail, dtype=cv2.CV_32F)
+    combine(base, detail, temp, planes)
+    _renormalize(base, temp, planes)
+    
+    # 与原合成结果逐像素插值：c + strength * (r - c)
+    cv2.divide(result, totals, dst=detail, scale=2.0)
+    cv2.addWeighted(detail, 1.0, detail, 0.0, -1.0, dst=detail)
+    cv2.subtract(base, detail, dst=base)
+    cv2.multiply(base, strength, dst=base)
+    cv2.add(base, detail, dst=base)
+    _renormalize(base, temp, planes)
+    
+    extra = None
+    if shape[2] > 3:
+        alpha_strength = strength[..., 3]
+        extra = (alpha_strength * totals[..., 3] * (img[..., 3] * np.float32(scale))
+                 + (1 - alpha_strength) * result[..., 3])
+    
+    # 编码回 result：T * (n / 2 + 0.5)
+    cv2.addWeighted(base, 0.5, base, 0.0, 0.5, dst=base)
+    cv2.multiply(base, totals, dst=result)
+    if extra is not None:
+        result[..., 3] = extra
+    cv2.copyTo(fallback, first, result)
+    
+    if mask is not None:
+        cv2.scaleAdd(mask.plane, float(weight), total_weight, dst=planes[0])
+        cv2.copyTo(planes[0], first, total_weight)
+    else:
+        cv2.add(total_weight, float(weight), dst=total_weight, mask=first)
+    return total_weight
+
+
+def blend_rnm(result, img, weight, total_weight, scratch):
+    return _blend_normal_map(_combine_rnm, result, img, weight, total_weight, scratch)
+
+
+def blend_udn(result, img, weight, total_weight, scratch):
+    return _blend_normal_map(_combine_udn, result, img, weight, total_weight, scratch)
+
+
+def blend_whiteout(result, img, weight, total_weight, scratch):
+    return _blend_normal_map(_combine_whiteout, result, img, weight, total_weight, scratch)
+
+
+# 混合模式 -> 内核；未知模式按 Normal 处理
+BLEND_KERNELS = {
+    "Normal": blend_normal,
+    "Multiply": blend_multiply,
+    "Add": blend_add,
+    "Overlay": blend_overlay,
+}
+
+# 法线贴图模式 -> 内核；内核需要当前的累积权重，并返回新的累积权重
+NORMAL_MAP_KERNELS = {
+    "RNM": blend_rnm,
+    "UDN": blend_udn,
+    "Whiteout": blend_whiteout,
+}
+
+# 法线贴图模式 -> 合成函数（逐像素权重时使用）
+_NORMAL_MAP_COMBINES = {
+    "RNM": _combine_rnm,
+    "UDN": _combine_udn,
+    "Whiteout": _combine_whiteout,
+}
+
+
+def get_kernel(blend_mode):
+    return BLEND_KERNELS.get(blend_mode, blend_normal)
+
+
+def apply_layer(result, img, blend_mode, weight, total_weight, scratch, mask=None):
+    """按混合模式将一层混合到 result 中，返回新的累积权重
+    
+    mask 为 LayerMask 时该层在各像素的权重为 weight * mask。之后累积权重为 (H, W) 的
+    float32 数组，后续各层都按逐像素累积，并原地更新该数组。
+    """
+    with profiling.stage("blend:" + blend_mode):
+        kernel = NORMAL_MAP_KERNELS.get(blend_mode)
+        per_pixel = isinstance(total_weight, np.ndarray)
+        if kernel is not None:
+            if mask is None and not per_pixel:
+                return kernel(result, img, weight, total_weight, scratch)
+            if not per_pixel:
+                total_weight = np.full(result.shape[:2], total_weight, dtype=np.float32)
+            return _blend_normal_map_per_pixel(_NORMAL_MAP_COMBINES[blend_mode], result, img,
+                                               weight, mask, total_weight, scratch)
+        
+        get_kernel(blend_mode)(result, img, weight, scratch, mask)
+        if mask is None:
+            if per_pixel:
+                cv2.add(total_weight, float(weight), dst=total_weight)
+                return total_weight
+            return total_weight + weight
+        if not per_pixel:
+            total_weight = np.full(result.shape[:2], total_weight, dtype=np.float32)
+        cv2.scaleAdd(mask.plane, float(weight), total_weight, dst=total_weight)
+        return total_weight
+
+
+def normalize(result, total_weight, precision="8bit"):
+    """按累积权重归一化到 [0, 1] 并转换为 precision 对应的位深（原地修改 result）
+    
+    total_weight 为数值或 (H, W) 的逐像素累积权重（见 apply_layer），为 0 的像素结果为 0。
+    8 位按截断取整（与旧版本一致），16 位四舍五入，float 直接返回 result。
+    """
+    dtype, max_value = OUTPUT_DTYPES[precision]
+    with profiling.stage("normalize"):
+        if isinstance(total_weight, np.ndarray):
+            # 权重非负，累积权重为 0 的像素结果也为 0，除以极小值后仍为 0，不必 np.where；
+            # 除法同时乘上输出的最大值
+            totals = cv2.max(total_weight, _MIN_TOTAL_WEIGHT)
+            cv2.divide(result, _broadcast(totals, result, None), dst=result,
+                       scale=float(max_value))
+            np.clip(result, 0, max_value, out=result)
+            if dtype is np.float32:
+                return result
+        else:
+            if total_weight > 0:
+                np.divide(result, np.float32(total_weight), out=result)
+            np.clip(result, 0, 1, out=result)
+            if dtype is np.float32:
+                return result
+            np.multiply(result, np.float32(max_value), out=result)
+        if dtype is np.uint8:
+            np.add(result, np.float32(_TRUNCATE_EPSILON), out=result)
+        else:
+            np.rint(result, out=result)
+        return result.astype(dtype)
@@ -1,66 +1,156 @@
 import sys
 import os
-import json
+import threading
+import time
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QLabel, QPushButton, QFileDialog, 
-                            QSpinBox, QDoubleSpinBox, QListWidget, QMessageBox,
-                            QTreeWidget, QTreeWidgetItem, QTableWidget, 
-                            QTableWidgetItem, QComboBox, QInputDialog)
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QPixmap, QImage
-import cv2
-import numpy as np
-from PIL import Image
-from pathlib import Path
+                            QSpinBox, QListWidget, QMessageBox,
+                            QTreeView, QTableView, QAbstractItemView,
+                            QComboBox, QInputDialog,
+                            QProgressDialog, QCheckBox)
+from PyQt6.QtCore import Qt, QThread, QThreadPool, QRunnable, QObject, QTimer, pyqtSignal
+from PyQt6.QtGui import QPixmap, QImage, QFontDatabase
 
-class BlendTask:
-    def __init__(self, name):
-        self.name = name
-        self.items = []  # 存储BlendItem对象
-        self.enabled = True
+from models import BlendTask, BlendItem
+from task_views import TaskTreeModel, ItemTableModel, WeightDelegate, BlendModeDelegate
+import config
+import encoders
+import image_cache
+import output_cache
+import profiling
+
+# engine 和 exporter（以及它们依赖的 cv2、numpy）在用到时才导入，窗口不必等待它们加载；
+# 窗口显示后由 preload_modules 在后台线程中提前导入
+
+def preload_modules():
+    """导入混合和导出用到的模块，避免第一次预览时等待"""
+    import engine
+    import exporter
+
+class ExportThread(QThread):
+    """在后台线程中执行批量导出，避免阻塞界面"""
+    task_done = pyqtSignal(str, str, str)  # 任务名称, 输出文件名, 错误信息（成功时为空）
     
-    def to_dict(self):
-        """将任务转换为字典格式"""
-        return {
-            'name': self.name,
-            'enabled': self.enabled,
-            'items': [item.to_dict() for item in self.items]
-        }
+    def __init__(self, jobs, workers, cache_mb, manifest, export_options, profile_path=None,
+                 parent=None):
+        super().__init__(parent)
+        self.jobs = jobs
+        self.manifest = manifest
+        self.workers = workers
+        self.cache_mb = cache_mb
+        self.export_options = export_options
+        self.cancel_event = threading.Event()
+        # 设置 profile_path 时记录各阶段耗时，导出结束后写出到该文件
+        self.profile_path = profile_path
+        self.profiler = profiling.Profiler() if profile_path else None
     
-    @classmethod
-    def from_dict(cls, data):
-        """从字典创建任务"""
-        task = cls(data['name'])
-        task.enabled = data.get('enabled', True)
-        task.items = [BlendItem.from_dict(item) for item in data.get('items', [])]
-        return task
+    def run(self):
+        import exporter
+        try:
+            for (task, output_path), written, error in exporter.run_exports(
+                    self.jobs, self.workers, self.cancel_event, self.cache_mb,
+                    export_options=self.export_options, profiler=self.profiler):
+                if error is not None:
+                    self.task_done.emit(task.name, "", str(error) or type(error).__name__)
+                elif written:
+                    self.manifest.mark_done(output_path)
+                    self.task_done.emit(task.name, os.path.basename(output_path), "")
+                else:
+                    self.task_done.emit(task.name, "", "")
+        finally:
+            self.manifest.save()
+            if self.profiler is not None:
+                self.profiler.finish()
+                self.profiler.write(self.profile_path)
+    
+    def cancel(self):
+        self.cancel_event.set()
+
+# 二进制配置在保存对话框中的文件类型
+PACKED_CONFIG_FILTER = f"紧凑项目文件 (*{config.PACKED_SUFFIX})"
+# 导入配置时向界面提交一批任务的最短间隔（秒）
+IMPORT_BATCH_INTERVAL = 0.05
 
-class BlendItem:
-    def __init__(self, name, path):
-        self.name = name
-        self.path = path
-        self.weight = 1.0
-        self.blend_mode = "Normal"
-        self.enabled = True
+class ConfigLoadThread(QThread):
+    """在后台线程中逐个解析任务配置，分批交给界面显示，最后并行检查输入文件"""
+    tasks_loaded = pyqtSignal(list)  # 新解析出的任务
+    inputs_checked = pyqtSignal(dict)  # 输入路径 -> 问题说明
+    failed = pyqtSignal(str)  # 错误信息（之前交出的任务仍然有效）
     
-    def to_dict(self):
-        """将项目转换为字典格式"""
-        return {
-            'name': self.name,
-            'path': self.path,
-            'weight': self.weight,
-            'blend_mode': self.blend_mode,
-            'enabled': self.enabled
-        }
+    def __init__(self, file_path, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+    
+    def run(self):
+        tasks = []
+        pending = []
+        last_emit = 0.0
+        try:
+            for task in config.iter_tasks(self.file_path):
+                tasks.append(task)
+                pending.append(task)
+                # 第一个任务立即显示，之后合并为批次，避免每个任务都让界面刷新一次
+                if time.monotonic() - last_emit >= IMPORT_BATCH_INTERVAL:
+                    self.tasks_loaded.emit(pending)
+                    pending = []
+                    last_emit = time.monotonic()
+        except Exception as e:
+            if pending:
+                self.tasks_loaded.emit(pending)
+            self.failed.emit(str(e))
+            return
+        if pending:
+            self.tasks_loaded.emit(pending)
+        self.inputs_checked.emit(config.check_inputs(config.task_input_paths(tasks)))
+
+# 预览区域尺寸
+PREVIEW_SIZE = (400, 400)
+# 参数连续变化时合并预览请求的间隔（毫秒）
+PREVIEW_DEBOUNCE_MS = 30
+
+# 导出性能记录的文件名（位于输出目录）
+EXPORT_PROFILE_NAME = "export-profile.json"
+
+class PreviewSignals(QObject):
+    finished = pyqtSignal(int, object, object)  # 预览序号, 混合结果, 各阶段耗时（profiling.Profiler）
+    failed = pyqtSignal(int, str)  # 预览序号, 错误信息
+
+class PreviewJob(QRunnable):
+    """在后台线程中混合预览，参数改变后过期的作业会被取消"""
+    
+    def __init__(self, task, generation, prefix_cache, max_size, is_current):
+        super().__init__()
+        self.task = task
+        self.generation = generation
+        self.prefix_cache = prefix_cache
+        self.max_size = max_size
+        self.is_current = is_current
+        self.signals = PreviewSignals()
     
-    @classmethod
-    def from_dict(cls, data):
-        """从字典创建项目"""
-        item = cls(data['name'], data['path'])
-        item.weight = data.get('weight', 1.0)
-        item.blend_mode = data.get('blend_mode', "Normal")
-        item.enabled = data.get('enabled', True)
-        return item
+    def run(self):
+        # 排队期间参数已经改变的作业直接放弃
+        if not self.is_current(self.generation):
+            return
+        import engine
+        profiler = profiling.Profiler()
+        try:
+            options = encoders.resolve_options(task=self.task)
+            with profiling.activate(profiler, self.task.name):
+                result = engine.blend_task(
+                    self.task,
+                    prefix_cache=self.prefix_cache,
+                    max_size=self.max_size,
+                    is_cancelled=lambda: not self.is_current(self.generation),
+                    size=options['size'],
+                    interpolation=options['interpolation']
+                )
+        except engine.BlendCancelled:
+            return
+        except Exception as e:
+            self.signals.failed.emit(self.generation, str(e))
+            return
+        profiler.finish()
+        self.signals.finished.emit(self.generation, result, profiler)
 
 class NormalMapBlender(QMainWindow):
     def __init__(self):
@@ -71,6 +161,24 @@ class NormalMapBlender(QMainWindow):
         # 数据存储
         self.tasks = []  # 存储BlendTask对象
         self.output_dir = ""
+        self.export_thread = None
+        self.import_thread = None
+        # 预览时缓存逐层累积结果（engine.PrefixCache，第一次预览时创建），
+        # 修改某一层只需重新计算该层及之后的层
+        self.preview_prefix_cache = None
+        self.refine_prefix_cache = None
+        # 预览序号：参数每次改变都会递增，用于丢弃过期的后台结果
+        self.preview_generation = 0
+        # 代理预览和全分辨率细化各自串行执行，避免多个过期作业同时占用内存
+        self.preview_pool = QThreadPool(self)
+        self.preview_pool.setMaxThreadCount(1)
+        self.refine_pool = QThreadPool(self)
+        self.refine_pool.setMaxThreadCount(1)
+        # 合并连续的参数变化（例如按住微调按钮），只混合最新的参数
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DEBOUNCE_MS)
+        self.preview_timer.timeout.connect(self.start_preview_job)
         
         self.init_ui()
     
@@ -83,9 +191,12 @@ class NormalMapBlender(QMainWindow):
         left_panel = QWidget()
         left_layout = QVBoxLayout(left_panel)
         
-        # 任务树
-        self.task_tree = QTreeWidget()
-        self.task_tree.setHeaderLabels(["混合任务"])
+        # 任务树（模型/视图：只为可见行查询数据，子项在展开时才加载）
+        self.task_model = TaskTreeModel(self.tasks, self)
+        self.task_tree = QTreeView()
+        self.task_tree.setModel(self.task_model)
+        self.task_tree.setUniformRowHeights(True)
+        self.task_tree.setEditTriggers(QAbstractItemView.EditTrigger.EditKeyPressed)
         left_layout.addWidget(QLabel("任务列表："))
         left_layout.addWidget(self.task_tree)
         
@@ -115,10 +226,18 @@ class NormalMapBlender(QMainWindow):
         middle_panel = QWidget()
         middle_layout = QVBoxLayout(middle_panel)
         
-        # 参数表格
-        self.param_table = QTableWidget()
-        self.param_table.setColumnCount(4)
-        self.param_table.setHorizontalHeaderLabels(["名称", "权重", "混合模式", "启用"])
+        # 参数表格（权重和混合模式通过委托在编辑时创建编辑控件）
+        self.param_model = ItemTableModel(self)
+        self.param_model.item_changed.connect(self.update_preview)
+        self.param_table = QTableView()
+        self.param_table.setModel(self.param_model)
+        self.param_table.setItemDelegateForColumn(ItemTableModel.WEIGHT, WeightDelegate(self))
+        self.param_table.setItemDelegateForColumn(ItemTableModel.BLEND_MODE, BlendModeDelegate(self))
+        self.param_table.horizontalHeader().setStretchLastSection(True)
+        self.param_table.doubleClicked.connect(self.on_param_double_clicked)
+        self.param_table.setEditTriggers(QAbstractItemView.EditTrigger.CurrentChanged |
+                                         QAbstractItemView.EditTrigger.SelectedClicked |
+                                         QAbstractItemView.EditTrigger.DoubleClicked)
         middle_layout.addWidget(QLabel("参数设置："))
         middle_layout.addWidget(self.param_table)
         
@@ -131,7 +250,7 @@ class NormalMapBlender(QMainWindow):
         # 预览区域
         right_layout.addWidget(QLabel("预览："))
         self.preview_label = QLabel()
-        self.preview_label.setMinimumSize(400, 400)
+        self.preview_label.setMinimumSize(*PREVIEW_SIZE)
         self.preview_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         right_layout.addWidget(self.preview_label)
         
@@ -144,6 +263,16 @@ class NormalMapBlender(QMainWindow):
         preview_controls.addWidget(btn_reset)
         preview_controls.addWidget(btn_update)
         right_layout.addLayout(preview_controls)
+        self.refine_check = QCheckBox("后台生成全分辨率预览")
+        self.refine_check.setChecked(True)
+        right_layout.addWidget(self.refine_check)
+        
+        # 上一次预览的各阶段耗时，用于判断任务受限于读取（解码、缩放）还是计算
+        right_layout.addWidget(QLabel("预览耗时："))
+        self.stats_label = QLabel("（尚未预览）")
+        self.stats_label.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        self.stats_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        right_layout.addWidget(self.stats_label)
         
         # 输出控制
         output_controls = QVBoxLayout()
@@ -151,6 +280,41 @@ class NormalMapBlender(QMainWindow):
         btn_output.clicked.connect(self.select_output_dir)
         btn_blend = QPushButton("导出全部混合图")
         btn_blend.clicked.connect(self.export_all_blended_maps)
+        workers_layout = QHBoxLayout()
+        workers_layout.addWidget(QLabel("导出进程数："))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, max(1, os.cpu_count() or 1))
+        self.workers_spin.setValue(max(1, os.cpu_count() or 1))
+        workers_layout.addWidget(self.workers_spin)
+        output_controls.addLayout(workers_layout)
+        cache_layout = QHBoxLayout()
+        cache_layout.addWidget(QLabel("图像缓存(MB)："))
+        self.cache_spin = QSpinBox()
+        self.cache_spin.setRange(0, 65536)
+        self.cache_spin.setSingleStep(256)
+        self.cache_spin.setValue(image_cache.DEFAULT_CACHE_MB)
+        self.cache_spin.valueChanged.connect(image_cache.configure)
+        cache_layout.addWidget(self.cache_spin)
+        output_controls.addLayout(cache_layout)
+        format_layout = QHBoxLayout()
+        format_layout.addWidget(QLabel("输出格式："))
+        self.format_combo = QComboBox()
+        self.format_combo.addItems(encoders.OUTPUT_FORMATS)
+        format_layout.addWidget(self.format_combo)
+        format_layout.addWidget(QLabel("精度："))
+        self.precision_combo = QComboBox()
+        self.precision_combo.addItems(encoders.PRECISIONS)
+        format_layout.addWidget(self.precision_combo)
+        format_layout.addWidget(QLabel("PNG压缩级别："))
+        self.png_compression_spin = QSpinBox()
+        self.png_compression_spin.setRange(0, 9)
+        self.png_compression_spin.setValue(1)  # 与 OpenCV 默认值一致
+        format_layout.addWidget(self.png_compression_spin)
+        output_controls.addLayout(format_layout)
+        self.force_export_check = QCheckBox("强制全部重新导出")
+        output_controls.addWidget(self.force_export_check)
+        self.profile_export_check = QCheckBox(f"记录导出性能数据（{EXPORT_PROFILE_NAME}）")
+        output_controls.addWidget(self.profile_export_check)
         output_controls.addWidget(btn_output)
         output_controls.addWidget(btn_blend)
         right_layout.addLayout(output_controls)
@@ -158,11 +322,11 @@ class NormalMapBlender(QMainWindow):
         main_layout.addWidget(right_panel)
         
         # 在 init_ui 中添加树的选择变更信号连接
-        self.task_tree.itemSelectionChanged.connect(self.on_selection_changed)
+        self.task_tree.selectionModel().currentChanged.connect(self.on_selection_changed)
         # 添加双击编辑支持
-        self.task_tree.itemDoubleClicked.connect(self.on_item_double_clicked)
-        # 在树控件初始化后添加这行
-        self.task_tree.itemChanged.connect(self.on_item_renamed)
+        self.task_tree.doubleClicked.connect(self.on_item_double_clicked)
+        # 重命名（F2 或双击对话框）由模型写回任务
+        self.task_model.dataChanged.connect(self.on_item_renamed)
         
         # 在工具栏或菜单中添加导入导出按钮
         file_menu = self.menuBar().addMenu("文件")
@@ -180,19 +344,17 @@ class NormalMapBlender(QMainWindow):
         self.update_param_table()
         self.update_preview()
 
-    def on_item_renamed(self, item, column):
-        """处理任务重命名（包括F2和双击）"""
-        if not item.parent():  # 只处理任务项（不是子项）
-            new_name = item.text(0)
-            task_index = self.task_tree.indexOfTopLevelItem(item)
-            if task_index >= 0 and task_index < len(self.tasks):
-                self.tasks[task_index].name = new_name
-                print(f"Task renamed to: {new_name} (via any rename method)")  # 调试输出
+    def on_item_renamed(self, top_left, bottom_right, roles=()):
+        """处理任务重命名（包括F2和双击），模型已经更新了任务名称"""
+        task_index, item_index = self.task_model.locate(top_left)
+        if item_index is None and task_index < len(self.tasks):  # 只处理任务项（不是子项）
+            new_name = self.tasks[task_index].name
+            print(f"Task renamed to: {new_name} (via any rename method)")  # 调试输出
 
-    def on_item_double_clicked(self, item, column):
+    def on_item_double_clicked(self, index):
         """处理项目双击事件"""
-        if not item.parent():  # 只允许编辑任务名称
-            current_name = item.text(0)
+        if not index.parent().isValid():  # 只允许编辑任务名称
+            current_name = index.data()
             new_name, ok = QInputDialog.getText(
                 self,
                 "重命名任务",
@@ -201,23 +363,33 @@ class NormalMapBlender(QMainWindow):
             )
             
             if ok and new_name:
-                # 更新树项显示
-                item.setText(0, new_name)
-                # 注意：不需要在这里更新task.name，因为setText会触发itemChanged信号
-                # 更新会通过on_item_renamed处理
+                # 通过模型更新任务名称和树的显示
+                self.task_model.setData(index, new_name)
+
+    def on_param_double_clicked(self, index):
+        """双击遮罩列时选择遮罩贴图，取消选择时可以清除已有的遮罩"""
+        if index.column() != ItemTableModel.MASK:
+            return
+        file, _ = QFileDialog.getOpenFileName(
+            self,
+            "选择遮罩贴图",
+            "",
+            "图像文件 (*.png *.jpg *.jpeg *.tif *.tiff *.exr)"
+        )
+        if file:
+            self.param_model.setData(index, file)
+        elif index.data(Qt.ItemDataRole.EditRole) is not None:
+            answer = QMessageBox.question(self, "遮罩", "是否清除该子项的遮罩？")
+            if answer == QMessageBox.StandardButton.Yes:
+                self.param_model.setData(index, None)
 
     def add_task(self):
         task_name = f"blende-task-{len(self.tasks) + 1}"
         task = BlendTask(task_name)  # 确保创建任务时设置了名称
-        self.tasks.append(task)
-        
-        task_item = QTreeWidgetItem(self.task_tree)
-        task_item.setText(0, task_name)
-        task_item.setFlags(task_item.flags() | Qt.ItemFlag.ItemIsEditable)
-        self.task_tree.addTopLevelItem(task_item)
+        task_index = self.task_model.append_task(task)
         
         # 选中新添加的任务
-        self.task_tree.setCurrentItem(task_item)
+        self.task_tree.setCurrentIndex(task_index)
         print(f"New task created: {task_name}")  # 添加调试输出
     
     def add_item(self):
@@ -236,62 +408,41 @@ class NormalMapBlender(QMainWindow):
         if not files:
             return
             
-        current_tree_item = self.task_tree.currentItem()
-        # 如果当前选中的是子项，获取其父项
-        if current_tree_item.parent():
-            current_tree_item = current_tree_item.parent()
-        
-        for file in files:
-            # 使用文件名作为项目名称
-            file_name = os.path.basename(file)
-            blend_item = BlendItem(file_name, file)
-            current_task.items.append(blend_item)
-            
-            # 创建新的树项目，只显示文件名
-            item = QTreeWidgetItem(current_tree_item)
-            item.setText(0, file_name)
+        # 如果当前选中的是子项，添加到其所属的任务
+        task_index, _ = self.task_model.locate(self.task_tree.currentIndex())
+        
+        # 使用文件名作为项目名称，树中只显示文件名
+        blend_items = [BlendItem(os.path.basename(file), file) for file in files]
+        self.task_model.append_items(task_index, blend_items)
     
         # 更新界面
         self.update_param_table()
         self.update_preview()
     
     def remove_task(self):
-        current_item = self.task_tree.currentItem()
-        if current_item:
-            index = self.task_tree.indexOfTopLevelItem(current_item)
-            if index >= 0:
-                self.task_tree.takeTopLevelItem(index)
-                self.tasks.pop(index)
+        current_index = self.task_tree.currentIndex()
+        if current_index.isValid():
+            index, item_index = self.task_model.locate(current_index)
+            if item_index is None:
+                self.task_model.remove_task(index)
     
     def remove_item(self):
         """删除选中的任务或子项"""
-        current_item = self.task_tree.currentItem()
-        if not current_item:
+        current_index = self.task_tree.currentIndex()
+        if not current_index.isValid():
             QMessageBox.warning(self, "警告", "请先选择要删除的项目")
             return
         
-        # 获取父项（如果是子项的话）
-        parent_item = current_item.parent()
-        
-        if parent_item:  # 如果是子项
-            # 找到对应的任务
-            task_index = self.task_tree.indexOfTopLevelItem(parent_item)
-            if task_index >= 0 and task_index < len(self.tasks):
-                task = self.tasks[task_index]
-                # 获取子项在父项中的索引
-                item_index = parent_item.indexOfChild(current_item)
-                if item_index >= 0 and item_index < len(task.items):
-                    # 从数据模型中移除
-                    task.items.pop(item_index)
-                    # 从树中移除
-                    parent_item.removeChild(current_item)
+        # 找到对应的任务和子项在任务中的索引
+        task_index, item_index = self.task_model.locate(current_index)
+        
+        if item_index is not None:  # 如果是子项
+            if item_index < len(self.tasks[task_index].items):
+                # 从数据和树中移除
+                self.task_model.remove_item(task_index, item_index)
         else:  # 如果是任务项
-            task_index = self.task_tree.indexOfTopLevelItem(current_item)
-            if task_index >= 0:
-                # 从数据模型中移除
-                self.tasks.pop(task_index)
-                # 从树中移除
-                self.task_tree.takeTopLevelItem(task_index)
+            # 从数据和树中移除
+            self.task_model.remove_task(task_index)
         
         # 更新参数表格
         self.update_param_table()
@@ -315,174 +466,130 @@ class NormalMapBlender(QMainWindow):
             QMessageBox.warning(self, "警告", "请先选择输出目录")
             return
         
-        try:
-            success_count = 0
-            export_info = []  # 用于收集导出信息
-            
-            for task in self.tasks:
-                if not task.items:
-                    continue
-                
-                # 生成该任务的混合结果
-                result = self.blend_task_maps(task)
-                if result is not None:
-                    # 使用任务名称作为文件名，确保文件名合法
-                    safe_name = "".join(c for c in task.name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                    if not safe_name:
-                        safe_name = f"blende-task-{self.tasks.index(task) + 1}"
-                    
-                    output_filename = f"{safe_name}.png"
-                    output_path = os.path.join(self.output_dir, output_filename)
-                    
-                    # 保存混合结果
-                    cv2.imwrite(output_path, result)
-                    success_count += 1
-                    export_info.append(f"任务 '{task.name}' => {output_filename}")
-                    print(f"Exporting task '{task.name}' to {output_filename}")  # 添加调试输出
-            
-            if success_count > 0:
-                export_details = "\n".join(export_info)
-                QMessageBox.information(
-                    self,
-                    "导出成功",
-                    f"成功导出 {success_count} 个混合图像：\n\n{export_details}\n\n保存位置：\n{self.output_dir}"
-                )
-            else:
-                QMessageBox.warning(self, "警告", "没有可导出的混合结果")
-            
-        except Exception as e:
-            QMessageBox.critical(self, "导出错误", f"导出过程中出错：{str(e)}")
-
-    def blend_task_maps(self, task):
-        """混合指定任务的所有法线贴图"""
-        if not task.items:
-            return None
+        if self.export_thread is not None and self.export_thread.isRunning():
+            return
         
+        export_options = {
+            'format': self.format_combo.currentText(),
+            'precision': self.precision_combo.currentText(),
+            'png_compression': self.png_compression_spin.value(),
+        }
+        
+        import exporter
+        
+        # 先检查全局的输出设置（格式与精度的组合等），无效时不开始导出
         try:
-            # 读取第一张图确定尺寸
-            first_map = cv2.imread(task.items[0].path)
-            if first_map is None:
-                raise Exception(f"无法读取图像: {task.items[0].path}")
-            
-            height, width = first_map.shape[:2]
-            
-            # 初始化结果数组
-            result = np.zeros_like(first_map, dtype=np.float32)
-            total_weight = 0
-            
-            # 混合所有启用的法线贴图
-            for item in task.items:
-                if not item.enabled:
-                    continue
-                
-                img = cv2.imread(item.path)
-                if img is None:
-                    continue
-                
-                if img.shape[:2] != (height, width):
-                    img = cv2.resize(img, (width, height))
-                
-                # 根据混合模式处理
-                if item.blend_mode == "Normal":
-                    weighted_img = img.astype(np.float32) * item.weight
-                elif item.blend_mode == "Multiply":
-                    weighted_img = (img.astype(np.float32) / 255.0) * result
-                    weighted_img *= item.weight
-                elif item.blend_mode == "Add":
-                    weighted_img = result + (img.astype(np.float32) * item.weight)
-                elif item.blend_mode == "Overlay":
-                    mask = result <= 127
-                    weighted_img = np.where(mask,
-                                          (2 * result * img.astype(np.float32)) / 255.0,
-                                          255 - (2 * (255 - result) * (255 - img.astype(np.float32))) / 255.0)
-                    weighted_img *= item.weight
-                else:
-                    weighted_img = img.astype(np.float32) * item.weight
-                
-                result += weighted_img
-                total_weight += item.weight
-            
-            # 归一化
-            if total_weight > 0:
-                result = np.clip(result / total_weight, 0, 255)
-            
-            return result.astype(np.uint8)
+            resolved_options = encoders.resolve_options(export_options)
+        except encoders.EncodeError as e:
+            QMessageBox.warning(self, "警告", f"输出设置无效：{str(e)}")
+            return
         
-        except Exception as e:
-            QMessageBox.critical(self, "混合错误", f"混合过程中出错：{str(e)}")
-            return None
+        # 复制任务数据，导出期间修改参数不会影响正在进行的导出
+        jobs = []
+        for index, task in enumerate(self.tasks):
+            if not task.items:
+                continue
+            try:
+                output_filename = exporter.task_output_name(task, index, export_options)
+            except encoders.EncodeError as e:
+                QMessageBox.warning(self, "警告", f"任务 '{task.name}' 的输出设置无效：{str(e)}")
+                return
+            jobs.append((BlendTask.from_dict(task.to_dict()),
+                         os.path.join(self.output_dir, output_filename)))
+        
+        if not jobs:
+            QMessageBox.warning(self, "警告", "没有可导出的混合结果")
+            return
+        
+        # 跳过输入和参数都没有变化的任务
+        manifest = output_cache.OutputManifest(self.output_dir)
+        jobs, skipped = manifest.split(jobs, force=self.force_export_check.isChecked(),
+                                       extra=resolved_options)
+        self.skipped_count = len(skipped)
+        if not jobs:
+            QMessageBox.information(self, "无需导出", f"全部 {self.skipped_count} 个任务均未改变，已跳过")
+            return
+        
+        self.export_info = []  # 用于收集导出信息
+        self.failed_info = []  # 用于收集失败信息
+        
+        self.export_progress = QProgressDialog("正在导出混合图...", "取消", 0, len(jobs), self)
+        self.export_progress.setWindowTitle("导出")
+        self.export_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.export_progress.setMinimumDuration(0)
+        self.export_progress.setAutoClose(False)
+        self.export_progress.setAutoReset(False)
+        
+        profile_path = None
+        if self.profile_export_check.isChecked():
+            profile_path = os.path.join(self.output_dir, EXPORT_PROFILE_NAME)
+        self.export_thread = ExportThread(jobs, self.workers_spin.value(), self.cache_spin.value(),
+                                          manifest, export_options, profile_path, self)
+        self.export_thread.task_done.connect(self.on_export_task_done)
+        self.export_thread.finished.connect(self.on_export_finished)
+        self.export_progress.canceled.connect(self.export_thread.cancel)
+        self.export_thread.start()
+    
+    def on_export_task_done(self, task_name, output_filename, error):
+        """单个任务导出完成"""
+        if error:
+            self.failed_info.append(f"任务 '{task_name}'：{error}")
+        elif output_filename:
+            self.export_info.append(f"任务 '{task_name}' => {output_filename}")
+            print(f"Exporting task '{task_name}' to {output_filename}")  # 添加调试输出
+        
+        done = len(self.export_info) + len(self.failed_info)
+        self.export_progress.setValue(done)
+        self.export_progress.setLabelText(f"正在导出混合图... {done}/{self.export_progress.maximum()}")
+    
+    def on_export_finished(self):
+        """全部导出完成或已取消"""
+        cancelled = self.export_thread.cancel_event.is_set()
+        profiler = self.export_thread.profiler
+        profile_path = self.export_thread.profile_path
+        self.export_progress.close()
+        self.export_thread = None
+        
+        if profiler is not None:
+            QMessageBox.information(self, "导出性能数据",
+                                    f"已写出到 {profile_path}\n\n{profiler.summary()}")
+        
+        if cancelled:
+            QMessageBox.information(self, "导出已取消", f"已取消导出，完成 {len(self.export_info)} 个混合图像")
+        
+        if self.failed_info:
+            QMessageBox.warning(self, "部分任务失败", "以下任务未能导出：\n\n" + "\n".join(self.failed_info))
+        
+        success_count = len(self.export_info)
+        if success_count > 0:
+            export_details = "\n".join(self.export_info)
+            QMessageBox.information(
+                self,
+                "导出成功",
+                f"成功导出 {success_count} 个混合图像：\n\n{export_details}\n\n"
+                f"跳过未改变的任务：{self.skipped_count} 个\n\n保存位置：\n{self.output_dir}"
+            )
+        elif self.skipped_count > 0:
+            QMessageBox.information(self, "导出完成", f"跳过未改变的任务：{self.skipped_count} 个")
+        elif not cancelled:
+            QMessageBox.warning(self, "警告", "没有可导出的混合结果")
 
     def get_selected_task(self):
         """获取当前选中的任务"""
-        current_item = self.task_tree.currentItem()
-        if not current_item:
+        current_index = self.task_tree.currentIndex()
+        if not current_index.isValid():
             return None
         
-        # 如果选中的是子项，获取其父任务项
-        parent = current_item.parent()
-        task_item = parent if parent else current_item
-        
-        # 获取任务索引
-        task_index = self.task_tree.indexOfTopLevelItem(task_item)
+        # 如果选中的是子项，获取其父任务
+        task_index, _ = self.task_model.locate(current_index)
         if task_index >= 0 and task_index < len(self.tasks):
             return self.tasks[task_index]
         
         return None
 
     def update_param_table(self):
-        """更新参数表格"""
-        self.param_table.setRowCount(0)  # 清空表格
-        
-        current_task = self.get_selected_task()
-        if not current_task:
-            return
-        
-        # 更新表格内容
-        for index, item in enumerate(current_task.items):
-            self.param_table.insertRow(index)
-            
-            # 名称（使用文件名）
-            name_item = QTableWidgetItem(os.path.basename(item.path))
-            name_item.setFlags(name_item.flags() & ~Qt.ItemFlag.ItemIsEditable)  # 禁止编辑
-            self.param_table.setItem(index, 0, name_item)
-            
-            # 权重
-            weight_spin = QDoubleSpinBox()
-            weight_spin.setRange(0, 1)
-            weight_spin.setSingleStep(0.1)
-            weight_spin.setValue(item.weight)
-            weight_spin.valueChanged.connect(lambda value, row=index: self.update_item_weight(row, value))
-            self.param_table.setCellWidget(index, 1, weight_spin)
-            
-            # 混合模式
-            blend_mode_combo = QComboBox()
-            blend_modes = ["Normal", "Multiply", "Add", "Overlay"]
-            blend_mode_combo.addItems(blend_modes)
-            blend_mode_combo.setCurrentText(item.blend_mode)
-            blend_mode_combo.currentTextChanged.connect(lambda text, row=index: self.update_item_blend_mode(row, text))
-            self.param_table.setCellWidget(index, 2, blend_mode_combo)
-            
-            # 启用状态
-            enabled_item = QTableWidgetItem()
-            enabled_item.setCheckState(Qt.CheckState.Checked if item.enabled else Qt.CheckState.Unchecked)
-            enabled_item.setFlags(enabled_item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
-            self.param_table.setItem(index, 3, enabled_item)
-        
-        self.param_table.resizeColumnsToContents()
-
-    def update_item_weight(self, row, value):
-        """更新子项权重"""
-        current_task = self.get_selected_task()
-        if current_task and row < len(current_task.items):
-            current_task.items[row].weight = value
-            self.update_preview()
-
-    def update_item_blend_mode(self, row, mode):
-        """更新子项混合模式"""
-        current_task = self.get_selected_task()
-        if current_task and row < len(current_task.items):
-            current_task.items[row].blend_mode = mode
-            self.update_preview()
+        """更新参数表格（只重置模型，视图按可见行查询数据）"""
+        self.param_model.set_task(self.get_selected_task())
 
     def reset_preview(self):
         """重置所有参数到默认值"""
@@ -494,44 +601,98 @@ class NormalMapBlender(QMainWindow):
             item.weight = 1.0
             item.blend_mode = "Normal"
             item.enabled = True
+            item.mask = None
+            item.alpha_weight = False
         
         self.update_param_table()
         self.update_preview()
 
     def update_preview(self):
-        """更新预览图像"""
+        """请求更新预览图像
+        
+        混合在后台线程中进行：先用缩小到预览尺寸的代理图快速混合并显示，
+        再（可选）按全分辨率混合，完成后替换显示。
+        短时间内的多次请求会合并，新的请求会取消尚未完成的旧作业。
+        """
+        self.preview_generation += 1
+        self.preview_timer.start()
+    
+    def start_preview_job(self):
+        """启动代理预览作业"""
         current_task = self.get_selected_task()
         if not current_task or not current_task.items:
             self.preview_label.clear()
             return
-        
-        try:
-            # 使用通用的混合方法获取结果
-            result = self.blend_task_maps(current_task)
-            if result is None:
-                self.preview_label.clear()
-                return
-            
-            # 转换为RGB格式（OpenCV使用BGR格式）
-            result = cv2.cvtColor(result, cv2.COLOR_BGR2RGB)
-            
-            # 创建QImage并显示
-            height, width = result.shape[:2]
-            bytes_per_line = 3 * width
-            q_img = QImage(result.data, width, height, bytes_per_line, QImage.Format.Format_RGB888)
-            
-            # 保持纵横比缩放到预览区域
-            scaled_pixmap = QPixmap.fromImage(q_img).scaled(
-                400, 400,
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation
-            )
-            
-            self.preview_label.setPixmap(scaled_pixmap)
-            
-        except Exception as e:
-            QMessageBox.critical(self, "预览错误", f"更新预览时出错：{str(e)}")
+        if self.preview_prefix_cache is None:
+            import engine
+            self.preview_prefix_cache = engine.PrefixCache()
+            self.refine_prefix_cache = engine.PrefixCache()
+        
+        # 复制任务数据，后台混合期间修改参数不会影响该作业
+        job = PreviewJob(BlendTask.from_dict(current_task.to_dict()),
+                         self.preview_generation, self.preview_prefix_cache,
+                         PREVIEW_SIZE, self.is_current_preview)
+        job.signals.finished.connect(self.on_preview_finished)
+        job.signals.failed.connect(self.on_preview_failed)
+        self.preview_pool.start(job)
+    
+    def is_current_preview(self, generation):
+        """判断预览序号是否仍是最新的"""
+        return generation == self.preview_generation
+    
+    def on_preview_finished(self, generation, result, profiler):
+        """代理预览完成"""
+        if not self.is_current_preview(generation):
+            return
+        if result is None:
             self.preview_label.clear()
+            return
+        
+        self.show_preview(result)
+        self.show_stats("代理预览", profiler)
+        
+        # 代理图没有被缩小（原图小于预览区域）时无需细化
+        downscaled = result.shape[1] >= PREVIEW_SIZE[0] or result.shape[0] >= PREVIEW_SIZE[1]
+        current_task = self.get_selected_task()
+        if self.refine_check.isChecked() and downscaled and current_task:
+            job = PreviewJob(BlendTask.from_dict(current_task.to_dict()),
+                             generation, self.refine_prefix_cache,
+                             None, self.is_current_preview)
+            job.signals.finished.connect(self.on_refine_finished)
+            self.refine_pool.start(job)
+    
+    def on_preview_failed(self, generation, error):
+        """代理预览出错"""
+        if not self.is_current_preview(generation):
+            return
+        QMessageBox.critical(self, "预览错误", f"更新预览时出错：{error}")
+        self.preview_label.clear()
+    
+    def on_refine_finished(self, generation, result, profiler):
+        """全分辨率预览完成"""
+        if self.is_current_preview(generation) and result is not None:
+            self.show_preview(result)
+            self.show_stats("全分辨率预览", profiler)
+    
+    def show_stats(self, title, profiler):
+        """在统计面板中显示预览的各阶段耗时"""
+        self.stats_label.setText(f"{title}，共 {profiler.elapsed * 1000:.0f} ms\n{profiler.summary()}")
+    
+    def show_preview(self, result):
+        """在预览区域显示混合结果"""
+        # 创建QImage并显示（OpenCV使用BGR格式）
+        height, width = result.shape[:2]
+        bytes_per_line = 3 * width
+        q_img = QImage(result.data, width, height, bytes_per_line, QImage.Format.Format_BGR888)
+        
+        # 保持纵横比缩放到预览区域
+        scaled_pixmap = QPixmap.fromImage(q_img).scaled(
+            *PREVIEW_SIZE,
+            Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation
+        )
+        
+        self.preview_label.setPixmap(scaled_pixmap)
 
     def import_tasks(self):
         """导入任务配置"""
@@ -539,55 +700,51 @@ class NormalMapBlender(QMainWindow):
             self,
             "选择任务配置文件",
             "",
-            "JSON文件 (*.json)"
+            "任务配置 (*.json *.blendpack)"
         )
         
         if not file_path:
             return
-            
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # 检查文件路径是否需要调整
-            base_dir = str(Path(file_path).parent)
-            
-            # 清空现有任务
-            self.tasks.clear()
-            self.task_tree.clear()
-            
-            # 创建新任务
-            for task_data in data['tasks']:
-                # 调整项目中的文件路径
-                for item in task_data.get('items', []):
-                    item_path = Path(item['path'])
-                    if not item_path.is_absolute():
-                        # 如果是相对路径，则相对于JSON文件位置解析
-                        item['path'] = str(Path(base_dir) / item_path)
-                
-                task = BlendTask.from_dict(task_data)
-                self.tasks.append(task)
-                
-                # 创建树项
-                task_item = QTreeWidgetItem(self.task_tree)
-                task_item.setText(0, task.name)
-                task_item.setFlags(task_item.flags() | Qt.ItemFlag.ItemIsEditable)
-                
-                # 创建子项
-                for blend_item in task.items:
-                    item = QTreeWidgetItem(task_item)
-                    item.setText(0, blend_item.name)
-            
-            # 更新界面
-            if self.tasks:
-                self.task_tree.setCurrentItem(self.task_tree.topLevelItem(0))
-                self.update_param_table()
-                self.update_preview()
-            
+        
+        if self.import_thread is not None and self.import_thread.isRunning():
+            QMessageBox.warning(self, "警告", "正在导入任务配置，请等待完成")
+            return
+        
+        # 清空现有任务，解析出的任务分批加入树中（子项在展开时才加载）
+        self.task_model.set_tasks([])
+        self.update_param_table()
+        self.update_preview()
+        
+        self.import_thread = ConfigLoadThread(file_path, self)
+        self.import_thread.tasks_loaded.connect(self.on_tasks_loaded)
+        self.import_thread.inputs_checked.connect(self.on_import_finished)
+        self.import_thread.failed.connect(self.on_import_failed)
+        self.import_thread.start()
+
+    def on_tasks_loaded(self, tasks):
+        """后台解析出的一批任务"""
+        first_batch = not self.tasks
+        self.task_model.extend_tasks(tasks)
+        if first_batch and self.tasks:
+            # 选中第一个任务（同时更新参数表格和预览）
+            self.task_tree.setCurrentIndex(self.task_model.index(0, 0))
+
+    def on_import_finished(self, problems):
+        """全部任务解析完成，problems 为有问题的输入文件"""
+        if problems:
+            QMessageBox.warning(
+                self, "导入完成",
+                f"成功导入 {len(self.tasks)} 个任务，"
+                f"{len(problems)} 个输入文件不存在或无法读取：\n{config.format_input_report(problems)}"
+            )
+        else:
             QMessageBox.information(self, "导入成功", f"成功导入 {len(self.tasks)} 个任务")
-            
-        except Exception as e:
-            QMessageBox.critical(self, "导入错误", f"导入任务配置时出错：{str(e)}")
+
+    def on_import_failed(self, error):
+        message = f"导入任务配置时出错：{error}"
+        if self.tasks:
+            message += f"\n已导入之前的 {len(self.tasks)} 个任务"
+        QMessageBox.critical(self, "导入错误", message)
 
     def export_tasks(self):
         """导出任务配置"""
@@ -595,43 +752,21 @@ class NormalMapBlender(QMainWindow):
             QMessageBox.warning(self, "警告", "没有可导出的任务")
             return
             
-        file_path, _ = QFileDialog.getSaveFileName(
+        file_path, selected_filter = QFileDialog.getSaveFileName(
             self,
             "保存任务配置",
             "",
-            "JSON文件 (*.json)"
+            f"JSON文件 (*.json);;{PACKED_CONFIG_FILTER}"
         )
         
         if not file_path:
             return
+        # 选择紧凑格式但没有输入扩展名时补上，否则会按 JSON 保存
+        if selected_filter == PACKED_CONFIG_FILTER and not config.is_packed(file_path):
+            file_path += config.PACKED_SUFFIX
             
         try:
-            # 获取JSON文件的目标目录
-            base_dir = str(Path(file_path).parent)
-            
-            # 准备导出数据
-            export_data = {
-                'tasks': []
-            }
-            
-            for task in self.tasks:
-                task_data = task.to_dict()
-                # 将文件路径转换为相对路径
-                for item in task_data['items']:
-                    item_path = Path(item['path'])
-                    try:
-                        # 尝试转换为相对路径
-                        rel_path = item_path.relative_to(base_dir)
-                        item['path'] = str(rel_path)
-                    except ValueError:
-                        # 如果无法转换为相对路径，保持原样
-                        item['path'] = str(item_path)
-                
-                export_data['tasks'].append(task_data)
-            
-            # 保存为JSON
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, indent=2, ensure_ascii=False)
+            config.save_config(self.tasks, file_path)
             
             QMessageBox.information(self, "导出成功", f"成功导出 {len(self.tasks)} 个任务配置")
             
@@ -642,4 +777,5 @@ if __name__ == '__main__':
     app = QApplication(sys.argv)
     window = NormalMapBlender()
     window.show()
+    threading.Thread(target=preload_modules, daemon=True).start()
     sys.exit(app.exec())
\ No newline at end of file
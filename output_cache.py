@@ -0,0 +1,105 @@
+"""
+导出结果缓存
+
+每个任务的输出由 任务的完整 to_dict() + 每个输入文件的修改时间/大小（或内容哈希）
+计算出一个键，记录在输出目录的清单文件中。再次导出时键没有变化且输出文件仍然存在的任务
+直接跳过，只重新混合修改过的任务。
+"""
+import hashlib
+import json
+import os
+
+import image_cache
+
+# 清单文件名（位于输出目录中）
+MANIFEST_NAME = ".img-blender-manifest.json"
+
+# 混合结果的计算方式改变时递增，使旧清单全部失效
+CACHE_VERSION = 3
+
+# 每记录多少个结果保存一次清单，导出中断时不至于丢失全部进度
+SAVE_INTERVAL = 50
+
+
+def file_digest(path):
+    """计算文件内容的 SHA-256，文件不存在时返回 None"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def task_key(task, hash_inputs=False, extra=None):
+    """计算任务输出的缓存键
+    
+    hash_inputs 为 True 时按输入文件内容计算（较慢，但不受修改时间变化影响），
+    否则按修改时间和文件大小计算。extra 为影响输出的其他设置（例如编码参数）；
+    导出设置应先经过 encoders.resolve_options 补全默认值，图形界面和命令行的同一设置才得到相同的键。
+    """
+    inputs = []
+    for path in (path for item in task.items for path in item.input_paths()):
+        if hash_inputs:
+            inputs.append(file_digest(path))
+        else:
+            key = image_cache.file_key(path)
+            inputs.append(key[1:] if key else None)
+    
+    payload = json.dumps({
+        'version': CACHE_VERSION,
+        'task': task.to_dict(),
+        'inputs': inputs,
+        'extra': extra,
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class OutputManifest:
+    """输出目录中的清单：输出文件名 -> 缓存键"""
+    
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.entries = {}
+        self._pending_keys = {}
+        self._unsaved = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('outputs', {})
+        except (OSError, ValueError):
+            self.entries = {}  # 清单不存在或已损坏时全部重新导出
+    
+    def split(self, jobs, force=False, hash_inputs=False, extra=None):
+        """将 (task, output_path) 作业分为 (需要导出的, 可以跳过的) 两个列表"""
+        pending, skipped = [], []
+        for task, output_path in jobs:
+            key = task_key(task, hash_inputs, extra)
+            name = os.path.basename(output_path)
+            if not force and self.entries.get(name) == key and os.path.exists(output_path):
+                skipped.append((task, output_path))
+            else:
+                self._pending_keys[name] = key
+                pending.append((task, output_path))
+        return pending, skipped
+    
+    def mark_done(self, output_path):
+        """记录某个作业已成功导出"""
+        name = os.path.basename(output_path)
+        key = self._pending_keys.pop(name, None)
+        if key is None:
+            return
+        self.entries[name] = key
+        self._unsaved += 1
+        if self._unsaved >= SAVE_INTERVAL:
+            self.save()
+    
+    def save(self):
+        """写入清单（先写临时文件再替换，避免中断时损坏）"""
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'outputs': self.entries}, f,
+                      indent=2, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        self._unsaved = 0
@@ -0,0 +1,211 @@
+"""
+混合和导出的性能分析
+
+各热点路径在关键阶段调用 stage() / count()：
+- decode: 读取并解码输入（计数器 bytes_read 为读取的文件字节数）
+- resize: 将输入缩放到目标尺寸
+- blend:<模式>: 各混合模式的内核，批量混合为 blend:batch
+- normalize: 归一化并转换位深
+- encode / write: 编码输出图像、写入文件（计数器 bytes_written）
+- 计数器 cache_hit / cache_miss: 解码缓存（含缩放结果）的命中情况
+- 计数器 reused_layers: 预览时从 engine.PrefixCache 复用的层数
+
+默认不记录任何数据，这些调用几乎没有开销。需要分析时创建 Profiler，
+用 activate() 在当前线程中启用，例如：
+
+    profiler = profiling.Profiler()
+    with profiling.activate(profiler, task.name):
+        engine.blend_task(task)
+    profiler.write("trace.json")
+
+exporter.run_exports 和 cli.py 的 --profile 选项会为每个任务启用同一个 Profiler
+（包括写出线程和子进程，子进程的记录在结束时合并到主进程）。
+Profiler 的 callback(任务, 阶段, 秒) 在每个阶段结束时调用，可用于实时显示。
+"""
+import csv
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+# 输入相关的阶段，其余阶段视为计算或输出
+INPUT_STAGES = ("decode", "resize")
+
+_state = threading.local()
+_NULL_STAGE = nullcontext()
+
+
+class Profiler:
+    """按 (任务, 阶段) 累积耗时和调用次数，按 (任务, 名称) 累积计数器；线程安全"""
+    
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.started = time.perf_counter()
+        self.elapsed = None  # finish() 后为整个运行的耗时（秒）
+        self._stages = defaultdict(lambda: [0, 0.0])  # (任务, 阶段) -> [次数, 秒]
+        self._counters = defaultdict(int)  # (任务, 名称) -> 值
+        self._lock = threading.Lock()
+    
+    def add_time(self, task, stage, seconds, calls=1):
+        with self._lock:
+            entry = self._stages[(task, stage)]
+            entry[0] += calls
+            entry[1] += seconds
+        if self.callback is not None:
+            self.callback(task, stage, seconds)
+    
+    def add_count(self, task, name, value=1):
+        with self._lock:
+            self._counters[(task, name)] += value
+    
+    def finish(self):
+        """记录整个运行的耗时"""
+        self.elapsed = time.perf_counter() - self.started
+    
+    def records(self):
+        """返回可跨进程传递的记录列表：(类型, 任务, 名称, 次数或值, 秒)"""
+        with self._lock:
+            rows = [("stage", task, stage, calls, seconds)
+                    for (task, stage), (calls, seconds) in self._stages.items()]
+            rows.extend(("counter", task, name, value, None)
+                        for (task, name), value in self._counters.items())
+        return rows
+    
+    def merge(self, records):
+        """合并其他 Profiler（例如子进程中的）的 records()"""
+        with self._lock:
+            for kind, task, name, value, seconds in records:
+                if kind == "stage":
+                    entry = self._stages[(task, name)]
+                    entry[0] += value
+                    entry[1] += seconds
+                else:
+                    self._counters[(task, name)] += value
+    
+    def stage_totals(self):
+        """所有任务合计的 阶段 -> (次数, 秒)，按耗时从大到小排列"""
+        totals = defaultdict(lambda: [0, 0.0])
+        with self._lock:
+            for (_, stage), (calls, seconds) in self._stages.items():
+                totals[stage][0] += calls
+                totals[stage][1] += seconds
+        return dict(sorted(((stage, tuple(entry)) for stage, entry in totals.items()),
+                           key=lambda pair: -pair[1][1]))
+    
+    def counter_totals(self):
+        """所有任务合计的 计数器 -> 值"""
+        totals = defaultdict(int)
+        with self._lock:
+            for (_, name), value in self._counters.items():
+                totals[name] += value
+        return dict(totals)
+    
+    def input_fraction(self):
+        """输入（解码和缩放）占全部阶段耗时的比例，没有记录时返回 None"""
+        totals = self.stage_totals()
+        measured = sum(seconds for _, seconds in totals.values())
+        if measured <= 0:
+            return None
+        return sum(totals.get(stage, (0, 0.0))[1] for stage in INPUT_STAGES) / measured
+    
+    def summary(self):
+        """多行文本：各阶段的次数、耗时和占比，计数器，以及输入所占的比例"""
+        totals = self.stage_totals()
+        measured = sum(seconds for _, seconds in totals.values())
+        if measured <= 0:
+            return "没有记录"
+        lines = [f"{stage:<16}{calls:>6} 次{seconds * 1000:>10.1f} ms{seconds / measured:>7.0%}"
+                 for stage, (calls, seconds) in totals.items()]
+        counters = self.counter_totals()
+        if counters.get('bytes_read'):
+            lines.append(f"读取 {counters['bytes_read'] / (1024 * 1024):.1f} MB")
+        if counters.get('bytes_written'):
+            lines.append(f"写出 {counters['bytes_written'] / (1024 * 1024):.1f} MB")
+        lookups = counters.get('cache_hit', 0) + counters.get('cache_miss', 0)
+        if lookups:
+            lines.append(f"缓存命中 {counters.get('cache_hit', 0)}/{lookups}")
+        if counters.get('reused_layers'):
+            lines.append(f"复用已缓存的前 {counters['reused_layers']} 层")
+        lines.append(f"输入（解码、缩放）占 {self.input_fraction():.0%}")
+        return "\n".join(lines)
+    
+    def to_dict(self):
+        tasks = defaultdict(lambda: {'stages': {}, 'counters': {}})
+        for kind, task, name, value, seconds in self.records():
+            if kind == "stage":
+                tasks[task]['stages'][name] = {'calls': value, 'seconds': seconds}
+            else:
+                tasks[task]['counters'][name] = value
+        return {
+            'elapsed_seconds': self.elapsed,
+            'stages': {stage: {'calls': calls, 'seconds': seconds}
+                       for stage, (calls, seconds) in self.stage_totals().items()},
+            'counters': self.counter_totals(),
+            'tasks': dict(tasks),
+        }
+    
+    def write(self, path):
+        """写出分析结果：扩展名为 .csv 时每行一条记录，否则为 JSON"""
+        if str(path).lower().endswith(".csv"):
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(["kind", "task", "name", "count", "seconds"])
+                writer.writerows(sorted(self.records(),
+                                        key=lambda row: (row[0], str(row[1]), row[2])))
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+
+
+class _Stage:
+    __slots__ = ('profiler', 'task', 'name', 'start')
+    
+    def __init__(self, profiler, task, name):
+        self.profiler = profiler
+        self.task = task
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.profiler.add_time(self.task, self.name, time.perf_counter() - self.start)
+        return False
+
+
+@contextmanager
+def activate(profiler, task=None):
+    """在当前线程中启用 profiler，之后的记录归属于 task；profiler 为 None 时不记录"""
+    previous = getattr(_state, 'active', None)
+    _state.active = None if profiler is None else (profiler, task)
+    try:
+        yield profiler
+    finally:
+        _state.active = previous
+
+
+def current():
+    """当前线程启用的 (profiler, task)，没有时为 (None, None)；用于把记录延续到其他线程"""
+    return getattr(_state, 'active', None) or (None, None)
+
+
+def enabled():
+    """当前线程是否启用了 Profiler（用于跳过只为记录而进行的额外计算）"""
+    return getattr(_state, 'active', None) is not None
+
+
+def stage(name):
+    """记录一个阶段耗时的上下文管理器；当前线程没有启用 Profiler 时不做任何事"""
+    active = getattr(_state, 'active', None)
+    if active is None:
+        return _NULL_STAGE
+    return _Stage(active[0], active[1], name)
+
+
+def count(name, value=1):
+    """累加计数器；当前线程没有启用 Profiler 时不做任何事"""
+    active = getattr(_state, 'active', None)
+    if active is not None:
+        active[0].add_count(active[1], name, value)
@@ -0,0 +1,180 @@
+"""
+导出调度
+
+同一张底图常常出现在几十个任务中。这里根据 输入路径 -> 任务 的依赖关系安排导出顺序：
+共用输入的任务被排在一起执行，每个输入（及其每个目标分辨率的缩放结果）只解码、缩放一次，
+最后一个使用它的任务完成后立即从内存中释放。
+"""
+import os
+from collections import OrderedDict, defaultdict, deque
+
+import cv2
+
+import engine
+import profiling
+
+
+def input_paths(task):
+    """任务读取的输入路径（去重并保持顺序）：参考图层（用于确定尺寸）和所有启用的子项及其遮罩"""
+    paths = [engine.reference_item(task).path] if task.items else []
+    paths.extend(path for item in task.items if item.enabled for path in item.input_paths())
+    return list(dict.fromkeys(paths))
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def order_jobs(jobs):
+    """按输入依赖关系排列 (task, output_path) 作业
+    
+    从被最多任务使用的输入开始，在 输入 - 任务 二部图上广度优先遍历，
+    使共用输入的任务相邻，输入在内存中保持"热"的时间最短。
+    """
+    users = defaultdict(list)
+    job_paths = []
+    for index, (task, _) in enumerate(jobs):
+        paths = input_paths(task)
+        job_paths.append(paths)
+        for path in paths:
+            users[path].append(index)
+    
+    visited_jobs = set()
+    visited_paths = set()
+    order = []
+    for start in sorted(users, key=lambda path: -len(users[path])):
+        if start in visited_paths:
+            continue
+        visited_paths.add(start)
+        queue = deque([start])
+        while queue:
+            path = queue.popleft()
+            for index in users[path]:
+                if index in visited_jobs:
+                    continue
+                visited_jobs.add(index)
+                order.append(index)
+                for other in job_paths[index]:
+                    if other not in visited_paths:
+                        visited_paths.add(other)
+                        queue.append(other)
+    
+    # 没有任何输入的作业放在最后
+    order.extend(index for index in range(len(jobs)) if index not in visited_jobs)
+    return [jobs[index] for index in order]
+
+
+def split_batches(jobs, count):
+    """将排好序的作业切成 count 段连续的批次，各批次作业数尽量相等"""
+    count = max(1, min(count, len(jobs)))
+    size, extra = divmod(len(jobs), count)
+    batches = []
+    start = 0
+    for index in range(count):
+        end = start + size + (1 if index < extra else 0)
+        batches.append(jobs[start:end])
+        start = end
+    return batches
+
+
+def _uses_path(key, path):
+    """SharedInputCache 的条目是否来自 path：解码结果的 key[0] 为路径，派生结果为路径元组"""
+    return key[0] == path or (isinstance(key[0], tuple) and path in key[0])
+
+
+class SharedInputCache:
+    """按引用计数管理的解码缓存
+    
+    与 image_cache.ImageCache 的 get 接口相同，可直接传给 engine.blend_task。
+    每个输入在首次使用时解码，所有引用它的任务都 release 之后释放。
+    超出内存预算时先淘汰最久未使用的图像（之后如有需要会重新解码）。
+    """
+    
+    def __init__(self, tasks, max_mb=None):
+        self.max_bytes = None if max_mb is None else int(max_mb * 1024 * 1024)
+        self.current_bytes = 0
+        self.decode_count = 0
+        self.resize_count = 0
+        self._refs = defaultdict(int)
+        for task in tasks:
+            for path in input_paths(task):
+                self._refs[path] += 1
+        # (path, 读取方式, 目标尺寸, 插值方式) -> 图像，None 表示无法读取；
+        # 派生结果（见 derived）的键为 (路径元组, 'derived', ...)
+        self._entries = OrderedDict()
+    
+    def get(self, path, target_size=None, interpolation=cv2.INTER_LINEAR, flags=cv2.IMREAD_COLOR):
+        img = self._lookup((path, flags, None, None))
+        if img is None:
+            return None
+        if target_size is None or img.shape[1::-1] == tuple(target_size):
+            return img
+        
+        key = (path, flags, tuple(target_size), interpolation)
+        resized = self._entries.get(key)
+        if resized is None:
+            profiling.count("cache_miss")
+            with profiling.stage("resize"):
+                resized = cv2.resize(img, tuple(target_size), interpolation=interpolation)
+            resized.flags.writeable = False
+            self.resize_count += 1
+            self._store(key, resized)
+        else:
+            profiling.count("cache_hit")
+            self._entries.move_to_end(key)
+        return resized
+    
+    def derived(self, paths, key, build):
+        """与 image_cache.ImageCache.derived 相同，paths 中任一输入被释放时一同释放"""
+        key = (tuple(paths), 'derived') + tuple(key)
+        value = self._entries.get(key)
+        if value is not None:
+            profiling.count("cache_hit")
+            self._entries.move_to_end(key)
+            return value
+        profiling.count("cache_miss")
+        value = build()
+        if value is not None:
+            value.flags.writeable = False
+            self._store(key, value)
+        return value
+    
+    def release(self, task):
+        """任务完成后调用，释放不再被后续任务使用的输入"""
+        for path in input_paths(task):
+            self._refs[path] -= 1
+            if self._refs[path] <= 0:
+                for key in [key for key in self._entries if _uses_path(key, path)]:
+                    self._drop(key)
+    
+    def _lookup(self, key):
+        if key in self._entries:
+            profiling.count("cache_hit")
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        profiling.count("cache_miss")
+        with profiling.stage("decode"):
+            img = cv2.imread(key[0], key[1])
+        if profiling.enabled():
+            profiling.count("bytes_read", _file_size(key[0]))
+        self.decode_count += 1
+        if img is not None:
+            img.flags.writeable = False
+        self._store(key, img)
+        return img
+    
+    def _store(self, key, img):
+        self._entries[key] = img
+        if img is not None:
+            self.current_bytes += img.nbytes
+        while (self.max_bytes is not None and self.current_bytes > self.max_bytes
+               and len(self._entries) > 1):
+            self._drop(next(iter(self._entries)))
+    
+    def _drop(self, key):
+        img = self._entries.pop(key)
+        if img is not None:
+            self.current_bytes -= img.nbytes
@@ -0,0 +1,321 @@
+"""
+本地混合服务
+
+常驻进程接收 BlendTask 的 JSON（to_dict() 的格式）并在工作线程池中混合，
+流水线中的各个工具不必每次启动 Python、导入 cv2 和 numpy：
+
+    python server.py -o output -j 4 --port 8765
+    python server.py -o output --socket /tmp/img-blender.sock
+
+接口：
+- POST /blend：请求体为任务 JSON，返回 {"output_path": ...} 等信息；
+  加上 ?return=bytes 时直接返回编码后的图像，不写出文件
+- GET /status：队列长度、正在执行的作业数、延迟统计和解码缓存的使用情况
+
+所有工作线程共用一个解码缓存，不同请求中相同的贴图只解码一次。
+完全相同（参数和输入文件都相同）的任务正在执行时，新的请求直接等待同一个结果。
+贴图和遮罩的路径必须是绝对路径：服务的工作目录对客户端没有意义，相对路径的任务视为无效。
+写出的文件名包含任务的缓存键（见 output_cache.task_key），同一任务再次请求时直接返回已有的文件。
+"""
+import argparse
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import config
+import encoders
+import engine
+import exporter
+import image_cache
+import output_cache
+from models import BlendTask
+
+DEFAULT_PORT = 8765
+# 延迟统计使用最近多少个作业
+LATENCY_WINDOW = 1000
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "jpg": "image/jpeg",
+    "bmp": "image/bmp",
+    "tif": "image/tiff",
+    "exr": "image/x-exr",
+    "npy": "application/octet-stream",
+}
+
+
+def check_task(task_data):
+    """检查任务字典（见 config.validate_task），贴图和遮罩路径不是绝对路径时同样抛出 ConfigError"""
+    config.validate_task(task_data)
+    for index, item in enumerate(task_data.get('items', [])):
+        for key in ('path', 'mask'):
+            path = item.get(key)
+            if path is not None and not os.path.isabs(path):
+                raise config.ConfigError(f"第 {index + 1} 个子项的 {key} 应为绝对路径: {path!r}")
+
+
+class BlendService:
+    """作业队列：常驻的工作线程池、共享的解码缓存，并合并相同的进行中任务"""
+    
+    def __init__(self, output_dir, workers=1, cache_mb=image_cache.DEFAULT_CACHE_MB):
+        self.output_dir = os.path.abspath(output_dir)
+        self.workers = workers
+        self.cache = image_cache.ImageCache(cache_mb)
+        self.started = time.monotonic()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="blend")
+        self._lock = threading.Lock()
+        self._in_flight = {}  # (缓存键, 是否写出文件) -> Future
+        self._latencies = deque(maxlen=LATENCY_WINDOW)  # (排队秒数, 总秒数)
+        self._counts = {'queued': 0, 'running': 0, 'completed': 0, 'failed': 0,
+                        'coalesced': 0, 'reused': 0}
+    
+    def submit(self, task_data, to_file=True):
+        """提交任务字典（或 BlendTask），返回 (Future, 是否合并到了进行中的相同任务)
+        
+        Future 的结果为 {'output_path', 'data', 'format', 'reused'}：to_file 为 True 时写出文件，
+        data 为 None；否则 data 为编码后的图像，output_path 为 None。
+        任务无效（见 check_task）时抛出 config.ConfigError。
+        """
+        if isinstance(task_data, BlendTask):
+            task_data = task_data.to_dict()
+        check_task(task_data)
+        task = engine.as_task(task_data)
+        key = (output_cache.task_key(task), to_file)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._counts['coalesced'] += 1
+                return future, True
+            self._counts['queued'] += 1
+            future = self._pool.submit(self._run, task, key[0], to_file, time.monotonic())
+            self._in_flight[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future, False
+    
+    def _forget(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+    
+    def output_path(self, task, key):
+        """任务的输出路径：任务名加缓存键的前 16 位，参数或输入改变后为新的文件"""
+        name, ext = os.path.splitext(exporter.task_output_name(task, 0))
+        return os.path.join(self.output_dir, f"{name}-{key[:16]}{ext}")
+    
+    def _run(self, task, key, to_file, submitted):
+        with self._lock:
+            self._counts['queued'] -= 1
+            self._counts['running'] += 1
+        start = time.monotonic()
+        succeeded = False
+        try:
+            result = self._blend(task, key, to_file)
+            succeeded = True
+            return result
+        finally:
+            end = time.monotonic()
+            with self._lock:
+                self._counts['running'] -= 1
+                self._counts['completed' if succeeded else 'failed'] += 1
+                self._latencies.append((start - submitted, end - submitted))
+    
+    def _blend(self, task, key, to_file):
+        options = encoders.resolve_options(task=task)
+        output_path = self.output_path(task, key) if to_file else None
+        if output_path is not None and os.path.exists(output_path):
+            with self._lock:
+                self._counts['reused'] += 1
+            return {'output_path': output_path, 'data': None, 'format': options['format'],
+                    'reused': True}
+        
+        result = engine.blend_task(task, cache=self.cache, precision=options['precision'],
+                                   size=options['size'], interpolation=options['interpolation'])
+        if result is None:
+            raise engine.BlendError("任务没有子项")
+        if output_path is None:
+            return {'output_path': None, 'data': encoders.encode_image(result, options),
+                    'format': options['format'], 'reused': False}
+        
+        # 先写临时文件再改名，其他请求不会读到写了一半的文件
+        temp_path = f"{output_path}.{threading.get_ident()}.tmp"
+        try:
+            encoders.write_image(temp_path, result, options)
+            os.replace(temp_path, output_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return {'output_path': output_path, 'data': None, 'format': options['format'],
+                'reused': False}
+    
+    def status(self):
+        with self._lock:
+            counts = dict(self._counts)
+            latencies = list(self._latencies)
+        status = {
+            'workers': self.workers,
+            'queue_depth': counts.pop('queued'),
+            'in_flight': counts.pop('running'),
+            'uptime_seconds': round(time.monotonic() - self.started, 1),
+            'cache': {
+                'bytes': self.cache.current_bytes,
+                'max_bytes': self.cache.max_bytes,
+                'hits': self.cache.hits,
+                'misses': self.cache.misses,
+            },
+            'latency_ms': _latency_summary([total for _, total in latencies]),
+            'queue_wait_ms': _latency_summary([wait for wait, _ in latencies]),
+        }
+        status.update(counts)
+        return status
+    
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+def _latency_summary(seconds):
+    """最近作业的 次数、平均值、中位数、95 分位和最大值（毫秒）"""
+    if not seconds:
+        return {'count': 0}
+    ordered = sorted(seconds)
+    
+    def at(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 1)
+    
+    return {
+        'count': len(ordered),
+        'mean': round(sum(ordered) / len(ordered) * 1000, 1),
+        'p50': at(0.5),
+        'p95': at(0.95),
+        'max': round(ordered[-1] * 1000, 1),
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "img-blender"
+    
+    def do_GET(self):
+        if urlsplit(self.path).path == "/status":
+            self._send_json(200, self.server.service.status())
+        else:
+            self._send_json(404, {'error': "未知的路径"})
+    
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/blend":
+            self._send_json(404, {'error': "未知的路径"})
+            return
+        response = parse_qs(url.query).get('return', ["path"])[0]
+        if response not in ("path", "bytes"):
+            self._send_json(400, {'error': f"return 应为 path 或 bytes: {response!r}"})
+            return
+        
+        start = time.monotonic()
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            future, coalesced = self.server.service.submit(json.loads(body), response == "path")
+        except (ValueError, config.ConfigError) as e:
+            self._send_json(400, {'error': f"任务无效：{str(e)}"})
+            return
+        
+        try:
+            result = future.result()
+        except (engine.BlendError, encoders.EncodeError) as e:
+            self._send_json(422, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': str(e) or type(e).__name__})
+            return
+        
+        if response == "bytes":
+            data = memoryview(result['data']).cast('B')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPES[result['format']])
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self._send_json(200, {
+            'output_path': result['output_path'],
+            'format': result['format'],
+            'reused': result['reused'],
+            'coalesced': coalesced,
+            'seconds': round(time.monotonic() - start, 3),
+        })
+    
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', "application/json; charset=utf-8")
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def address_string(self):
+        # Unix 套接字的客户端地址不是 (主机, 端口)
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(service, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None):
+    """创建 HTTP 服务（socket_path 不为 None 时监听 Unix 套接字）"""
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # 上次异常退出时遗留的套接字文件
+        server = _UnixHTTPServer(socket_path, _Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="本地贴图混合服务")
+    parser.add_argument("-o", "--output-dir", required=True, help="输出目录")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="工作线程数（默认为CPU核心数）")
+    parser.add_argument("--cache-mb", type=int, default=image_cache.DEFAULT_CACHE_MB,
+                        help="共享解码缓存的大小（MB）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认只接受本机连接）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="监听端口")
+    parser.add_argument("--socket", help="改为监听该路径的 Unix 套接字")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+    service = BlendService(args.output_dir, max(1, args.workers), args.cache_mb)
+    try:
+        server = create_server(service, args.host, args.port, args.socket)
+    except OSError as e:
+        print(f"无法启动服务：{str(e)}", file=sys.stderr)
+        return 2
+    
+    where = args.socket or f"http://{args.host}:{server.server_address[1]}"
+    print(f"正在监听 {where}（{service.workers} 个工作线程），按 Ctrl+C 结束")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
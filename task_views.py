@@ -0,0 +1,326 @@
+"""
+任务树和参数表的 Qt 模型与委托
+
+模型直接引用 BlendTask / BlendItem 数据，不为每个任务、子项或单元格创建控件，
+视图只查询可见行的数据，导入几千个任务或切换选中的任务时开销与可见行数相关。
+参数表的权重和混合模式通过委托在编辑时才创建编辑控件。
+"""
+import os
+
+from PyQt6.QtCore import QAbstractItemModel, QAbstractTableModel, QModelIndex, Qt, pyqtSignal
+from PyQt6.QtWidgets import QComboBox, QDoubleSpinBox, QStyledItemDelegate
+
+from models import BLEND_MODES
+
+
+class TaskTreeModel(QAbstractItemModel):
+    """两级任务树：顶层为任务，子节点为贴图子项
+    
+    任务的子项在第一次展开时才报告给视图（canFetchMore / fetchMore）。
+    子项索引的 internalPointer 为所属的任务，顶层索引为 None。
+    """
+    
+    def __init__(self, tasks, parent=None):
+        super().__init__(parent)
+        self.tasks = tasks  # 与窗口共用同一个列表
+        self._rows = {}  # id(任务) -> 行号
+        self._fetched = {}  # id(任务) -> 已报告给视图的子项数
+        self._reindex()
+    
+    def _reindex(self):
+        self._rows = {id(task): row for row, task in enumerate(self.tasks)}
+    
+    # 结构
+    
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column)
+        return self.createIndex(row, column, self.tasks[parent.row()])
+    
+    def parent(self, index):
+        if not index.isValid() or index.internalPointer() is None:
+            return QModelIndex()
+        return self.createIndex(self._rows[id(index.internalPointer())], 0)
+    
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return len(self.tasks)
+        if parent.internalPointer() is not None:
+            return 0
+        return self._fetched.get(id(self.tasks[parent.row()]), 0)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+    
+    def hasChildren(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return bool(self.tasks)
+        if parent.internalPointer() is not None:
+            return False
+        return bool(self.tasks[parent.row()].items)
+    
+    def canFetchMore(self, parent):
+        if not parent.isValid() or parent.internalPointer() is not None:
+            return False
+        task = self.tasks[parent.row()]
+        return self._fetched.get(id(task), 0) < len(task.items)
+    
+    def fetchMore(self, parent):
+        task = self.tasks[parent.row()]
+        fetched = self._fetched.get(id(task), 0)
+        self.beginInsertRows(parent, fetched, len(task.items) - 1)
+        self._fetched[id(task)] = len(task.items)
+        self.endInsertRows()
+    
+    # 数据
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        task = index.internalPointer()
+        if task is None:
+            if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+                return self.tasks[index.row()].name
+            return None
+        item = task.items[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return item.name
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return item.path
+        return None
+    
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        """重命名任务（F2 或双击对话框）"""
+        if (not index.isValid() or index.internalPointer() is not None
+                or role != Qt.ItemDataRole.EditRole or not value):
+            return False
+        self.tasks[index.row()].name = value
+        self.dataChanged.emit(index, index)
+        return True
+    
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if index.internalPointer() is None:
+            flags |= Qt.ItemFlag.ItemIsEditable
+        return flags
+    
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return "混合任务"
+        return None
+    
+    # 修改
+    
+    def locate(self, index):
+        """返回索引对应的 (任务行号, 子项行号)，选中任务本身时子项行号为 None"""
+        task = index.internalPointer()
+        if task is None:
+            return index.row(), None
+        return self._rows[id(task)], index.row()
+    
+    def set_tasks(self, tasks):
+        """替换全部任务"""
+        self.beginResetModel()
+        self.tasks[:] = tasks
+        self._fetched.clear()
+        self._reindex()
+        self.endResetModel()
+    
+    def append_task(self, task):
+        """添加任务，返回其索引"""
+        row = len(self.tasks)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.tasks.append(task)
+        self._rows[id(task)] = row
+        self.endInsertRows()
+        return self.index(row, 0)
+    
+    def extend_tasks(self, tasks):
+        """在末尾添加多个任务（分批导入时使用）"""
+        if not tasks:
+            return
+        first = len(self.tasks)
+        self.beginInsertRows(QModelIndex(), first, first + len(tasks) - 1)
+        self.tasks.extend(tasks)
+        for row, task in enumerate(tasks, first):
+            self._rows[id(task)] = row
+        self.endInsertRows()
+    
+    def remove_task(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        task = self.tasks.pop(row)
+        self._fetched.pop(id(task), None)
+        self._reindex()
+        self.endRemoveRows()
+    
+    def append_items(self, row, items):
+        """向任务添加子项"""
+        task = self.tasks[row]
+        fetched = self._fetched.get(id(task), 0)
+        if fetched < len(task.items):
+            # 尚未展开过的任务只修改数据，展开时一并报告
+            task.items.extend(items)
+            return
+        first = len(task.items)
+        self.beginInsertRows(self.index(row, 0), first, first + len(items) - 1)
+        task.items.extend(items)
+        self._fetched[id(task)] = len(task.items)
+        self.endInsertRows()
+    
+    def remove_item(self, row, item_row):
+        task = self.tasks[row]
+        fetched = self._fetched.get(id(task), 0)
+        if item_row >= fetched:
+            task.items.pop(item_row)
+            return
+        self.beginRemoveRows(self.index(row, 0), item_row, item_row)
+        task.items.pop(item_row)
+        self._fetched[id(task)] = fetched - 1
+        self.endRemoveRows()
+
+
+class ItemTableModel(QAbstractTableModel):
+    """当前任务的子项参数表：名称、权重、混合模式、遮罩、Alpha 权重、启用
+    
+    遮罩列只显示遮罩贴图的文件名，由窗口在双击时选择文件后通过 setData 写入（None 表示清除）。
+    """
+    
+    COLUMNS = ["名称", "权重", "混合模式", "遮罩", "Alpha 权重", "启用"]
+    NAME, WEIGHT, BLEND_MODE, MASK, ALPHA_WEIGHT, ENABLED = range(6)
+    
+    item_changed = pyqtSignal()  # 任意参数被修改
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.task = None
+    
+    def set_task(self, task):
+        """显示另一个任务（或 None）的子项"""
+        self.beginResetModel()
+        self.task = task
+        self.endResetModel()
+    
+    def refresh(self):
+        """子项数据在模型之外被修改后调用"""
+        self.beginResetModel()
+        self.endResetModel()
+    
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() or self.task is None:
+            return 0
+        return len(self.task.items)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self.task.items[index.row()]
+        column = index.column()
+        if column == self.NAME:
+            if role == Qt.ItemDataRole.DisplayRole:
+                return os.path.basename(item.path)
+            if role == Qt.ItemDataRole.ToolTipRole:
+                return item.path
+        elif column == self.WEIGHT:
+            if role == Qt.ItemDataRole.DisplayRole:
+                return f"{item.weight:.2f}"
+            if role == Qt.ItemDataRole.EditRole:
+                return item.weight
+        elif column == self.BLEND_MODE:
+            if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+                return item.blend_mode
+        elif column == self.MASK:
+            if role == Qt.ItemDataRole.DisplayRole:
+                return "" if item.mask is None else os.path.basename(item.mask)
+            if role == Qt.ItemDataRole.EditRole:
+                return item.mask
+            if role == Qt.ItemDataRole.ToolTipRole:
+                return item.mask or "双击选择遮罩贴图（灰度值逐像素乘以权重）"
+        elif column == self.ALPHA_WEIGHT and role == Qt.ItemDataRole.CheckStateRole:
+            return Qt.CheckState.Checked if item.alpha_weight else Qt.CheckState.Unchecked
+        elif column == self.ENABLED and role == Qt.ItemDataRole.CheckStateRole:
+            return Qt.CheckState.Checked if item.enabled else Qt.CheckState.Unchecked
+        return None
+    
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if not index.isValid():
+            return False
+        item = self.task.items[index.row()]
+        column = index.column()
+        if column == self.WEIGHT and role == Qt.ItemDataRole.EditRole:
+            if item.weight == float(value):
+                return True
+            item.weight = float(value)
+        elif column == self.BLEND_MODE and role == Qt.ItemDataRole.EditRole:
+            if item.blend_mode == value:
+                return True
+            item.blend_mode = value
+        elif column == self.MASK and role == Qt.ItemDataRole.EditRole:
+            if item.mask == (value or None):
+                return True
+            item.mask = value or None
+        elif column == self.ALPHA_WEIGHT and role == Qt.ItemDataRole.CheckStateRole:
+            item.alpha_weight = Qt.CheckState(value) == Qt.CheckState.Checked
+        elif column == self.ENABLED and role == Qt.ItemDataRole.CheckStateRole:
+            item.enabled = Qt.CheckState(value) == Qt.CheckState.Checked
+        else:
+            return False
+        self.dataChanged.emit(index, index)
+        self.item_changed.emit()
+        return True
+    
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if index.column() in (self.WEIGHT, self.BLEND_MODE):
+            flags |= Qt.ItemFlag.ItemIsEditable
+        elif index.column() in (self.ALPHA_WEIGHT, self.ENABLED):
+            flags |= Qt.ItemFlag.ItemIsUserCheckable
+        return flags
+    
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.COLUMNS[section]
+        return super().headerData(section, orientation, role)
+
+
+class WeightDelegate(QStyledItemDelegate):
+    """权重列的编辑器：0-1 的数值框，数值变化立即写回模型（预览随之更新）"""
+    
+    def createEditor(self, parent, option, index):
+        editor = QDoubleSpinBox(parent)
+        editor.setRange(0, 1)
+        editor.setSingleStep(0.1)
+        editor.valueChanged.connect(lambda value: self.commitData.emit(editor))
+        return editor
+    
+    def setEditorData(self, editor, index):
+        editor.blockSignals(True)  # 载入数据不算修改
+        editor.setValue(index.data(Qt.ItemDataRole.EditRole))
+        editor.blockSignals(False)
+    
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.value(), Qt.ItemDataRole.EditRole)
+
+
+class BlendModeDelegate(QStyledItemDelegate):
+    """混合模式列的编辑器：下拉框，选择后立即写回模型"""
+    
+    def createEditor(self, parent, option, index):
+        editor = QComboBox(parent)
+        editor.addItems(BLEND_MODES)
+        editor.activated.connect(lambda row: self.commitData.emit(editor))
+        return editor
+    
+    def setEditorData(self, editor, index):
+        editor.setCurrentText(index.data(Qt.ItemDataRole.EditRole))
+    
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.currentText(), Qt.ItemDataRole.EditRole)
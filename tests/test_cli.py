@@ -0,0 +1,77 @@
+"""cli.py 的退出码"""
+import cv2
+import numpy as np
+import pytest
+
+import cli
+import config
+from models import BlendItem, BlendTask
+
+
+class FakeWatcher:
+    """按给定的轮次产出改变，之后模拟 Ctrl+C"""
+    
+    rounds = []
+    
+    def __init__(self, jobs, *args):
+        self.jobs = jobs
+        self.index = {}
+        self.unwatched = []
+        self.backend_name = "测试"
+    
+    def changes(self):
+        for paths, jobs in self.rounds:
+            yield paths, jobs
+        raise KeyboardInterrupt
+    
+    def set_jobs(self, jobs):
+        self.jobs = jobs
+    
+    def close(self):
+        pass
+
+
+def write_config(tmp_path, texture_exists):
+    texture = tmp_path / "base.png"
+    if texture_exists:
+        cv2.imwrite(str(texture), np.full((8, 8, 3), 128, dtype=np.uint8))
+    task = BlendTask("t")
+    task.items.append(BlendItem("base.png", str(texture)))
+    path = tmp_path / "tasks.json"
+    config.save_config([task], str(path))
+    return path
+
+
+def run_watch(monkeypatch, tmp_path, config_path, rounds):
+    FakeWatcher.rounds = rounds
+    monkeypatch.setattr(cli.watcher, "TaskWatcher", FakeWatcher)
+    return cli.main([str(config_path), "-o", str(tmp_path / "out"), "-j", "1", "--watch"])
+
+
+def test_watch_ok(monkeypatch, tmp_path):
+    assert run_watch(monkeypatch, tmp_path, write_config(tmp_path, True), []) == cli.EXIT_OK
+
+
+def test_watch_reports_initial_failure(monkeypatch, tmp_path):
+    # 第一张贴图不存在，首次导出失败
+    config_path = write_config(tmp_path, False)
+    assert run_watch(monkeypatch, tmp_path, config_path, []) == cli.EXIT_TASK_FAILED
+
+
+@pytest.mark.parametrize("broken", ["texture", "config"])
+def test_watch_reports_later_failure(monkeypatch, tmp_path, broken):
+    config_path = write_config(tmp_path, True)
+    jobs = cli.collect_jobs([str(config_path)], str(tmp_path / "out"),
+                            cli.export_options(cli.build_parser().parse_args(
+                                [str(config_path), "-o", str(tmp_path / "out")])))
+    
+    def rounds():
+        # 首次导出之后贴图被删除，或配置文件被改坏
+        if broken == "texture":
+            (tmp_path / "base.png").unlink()
+            yield {str(tmp_path / "base.png")}, jobs
+        else:
+            config_path.write_text("{", encoding='utf-8')
+            yield {str(config_path)}, None
+    
+    assert run_watch(monkeypatch, tmp_path, config_path, rounds()) == cli.EXIT_TASK_FAILED
@@ -0,0 +1,28 @@
+"""config 模块的流式读取"""
+import pytest
+
+import config
+
+
+def write(tmp_path, text):
+    path = tmp_path / "tasks.json"
+    path.write_text(text, encoding='utf-8')
+    return path
+
+
+@pytest.mark.parametrize("chunk_chars", [3, config.READ_CHUNK_CHARS])
+def test_trailing_whitespace_accepted(tmp_path, chunk_chars):
+    path = write(tmp_path, '{"tasks": [{"name": "t", "items": []}]}\n  \n')
+    assert [task.name for task in config.iter_tasks(path, chunk_chars)] == ["t"]
+
+
+@pytest.mark.parametrize("chunk_chars", [3, config.READ_CHUNK_CHARS])
+@pytest.mark.parametrize("text", [
+    '{"tasks": []} trailing',
+    '{"tasks": []}{"tasks": []}',
+    '{"tasks": [],}',
+    '{"other": 1 "tasks": []}',
+])
+def test_malformed_top_level_rejected(tmp_path, chunk_chars, text):
+    with pytest.raises(config.ConfigError):
+        list(config.iter_tasks(write(tmp_path, text), chunk_chars))
@@ -0,0 +1,103 @@
+"""encoders 模块的编码设置，以及 16 位和 float 精度的混合、写出和读回"""
+import cv2
+import numpy as np
+import pytest
+
+import encoders
+import engine
+import image_cache
+from models import BlendItem, BlendTask
+
+
+@pytest.mark.parametrize("options", [
+    {'png_compression': 10},
+    {'png_compression': -1},
+    {'png_compression': "9"},
+    {'png_compression': 6.5},
+    {'png_compression': True},
+    {'format': "jpg", 'jpeg_quality': 101},
+    {'format': "jpg", 'jpeg_quality': "high"},
+])
+def test_invalid_levels_rejected(options):
+    task = BlendTask("t")
+    task.output_options = options
+    with pytest.raises(encoders.EncodeError):
+        encoders.resolve_options(task=task)
+
+
+def test_valid_levels_accepted():
+    options = encoders.resolve_options({'png_compression': 0}, None)
+    assert options['png_compression'] == 0
+    task = BlendTask("t")
+    task.output_options = {'format': "jpg", 'jpeg_quality': 100}
+    assert encoders.resolve_options(task=task)['jpeg_quality'] == 100
+
+
+def two_layer_task(paths):
+    # 两层各占一半权重，结果为两张贴图的平均值
+    task = BlendTask("t")
+    for index, path in enumerate(paths):
+        item = BlendItem(f"layer{index}", str(path))
+        item.weight = 0.5
+        task.items.append(item)
+    return task
+
+
+def read_back(path):
+    if path.suffix == ".npy":
+        return np.load(path)
+    return cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+
+
+def require_exr(tmp_path):
+    if not cv2.haveImageWriter(str(tmp_path / "probe.exr")):
+        pytest.skip("当前 OpenCV 构建不支持 EXR")
+
+
+@pytest.mark.parametrize("fmt", ["png", "tif", "npy"])
+def test_16bit_round_trip(tmp_path, fmt):
+    rng = np.random.default_rng(0)
+    layers = [rng.integers(0, 65536, (12, 16, 4), dtype=np.uint16) for _ in range(2)]
+    paths = [tmp_path / f"layer{index}.png" for index in range(2)]
+    for path, layer in zip(paths, layers):
+        cv2.imwrite(str(path), layer)
+    
+    result = engine.blend_task(two_layer_task(paths), cache=image_cache.ImageCache(16),
+                               precision="16bit")
+    # 保留 16 位精度和 alpha：不是按 8 位量化后再放大的结果
+    assert result.dtype == np.uint16 and result.shape == (12, 16, 4)
+    expected = (layers[0].astype(np.float64) + layers[1]) / 2
+    assert np.abs(result - expected).max() <= 1
+    assert np.any(result % 257 != 0)
+    
+    output = tmp_path / f"out.{fmt}"
+    encoders.write_image(str(output), result, encoders.resolve_options(
+        {'format': fmt, 'precision': "16bit"}))
+    back = read_back(output)
+    assert back.dtype == np.uint16
+    assert np.array_equal(back, result)
+
+
+@pytest.mark.parametrize("input_ext", [".tif", ".exr"])
+@pytest.mark.parametrize("fmt", ["tif", "npy", "exr"])
+def test_float_round_trip(tmp_path, input_ext, fmt):
+    if ".exr" in (input_ext, "." + fmt):
+        require_exr(tmp_path)
+    rng = np.random.default_rng(1)
+    layers = [rng.random((12, 16, 3), dtype=np.float32) for _ in range(2)]
+    paths = [tmp_path / f"layer{index}{input_ext}" for index in range(2)]
+    for path, layer in zip(paths, layers):
+        assert cv2.imwrite(str(path), layer)
+    
+    result = engine.blend_task(two_layer_task(paths), cache=image_cache.ImageCache(16),
+                               precision="float")
+    assert result.dtype == np.float32
+    assert result.min() >= 0 and result.max() <= 1
+    np.testing.assert_allclose(result, (layers[0] + layers[1]) / 2, atol=1e-6)
+    
+    output = tmp_path / f"out.{fmt}"
+    encoders.write_image(str(output), result, encoders.resolve_options(
+        {'format': fmt, 'precision': "float"}))
+    back = read_back(output)
+    assert back.dtype == np.float32
+    assert np.array_equal(back, result)
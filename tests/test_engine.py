@@ -0,0 +1,67 @@
+"""engine 模块的遮罩缓存"""
+import os
+
+import cv2
+import numpy as np
+
+import engine
+import image_cache
+import scheduler
+from models import BlendItem, BlendTask
+
+
+def masked_task(tmp_path):
+    rng = np.random.default_rng(2)
+    task = BlendTask("t")
+    for index, mode in enumerate(["Normal", "Multiply", "Overlay"]):
+        path = str(tmp_path / f"layer{index}.png")
+        cv2.imwrite(path, rng.integers(0, 256, (40, 60, 3), dtype=np.uint8))
+        item = BlendItem(f"layer{index}", path)
+        item.blend_mode = mode
+        item.mask = str(tmp_path / "mask.png")
+        task.items.append(item)
+    task.items[2].weight = 0.5
+    write_mask(tmp_path, 0)
+    return task
+
+
+def write_mask(tmp_path, seed):
+    path = str(tmp_path / "mask.png")
+    mask = np.random.default_rng(seed).integers(0, 256, (20, 30), dtype=np.uint8)
+    cv2.imwrite(path, mask)
+    # 修改时间不同，缓存才能发现文件已改变
+    os.utime(path, ns=(seed * 10**9, seed * 10**9))
+
+
+def test_masks_reused_from_cache(tmp_path):
+    task = masked_task(tmp_path)
+    cache = image_cache.ImageCache(64)
+    first = engine.blend_task(task, cache=cache)
+    misses = cache.misses
+    
+    # 只调整权重时遮罩和它与贴图的乘积都直接取自缓存
+    task.items[1].weight = 0.3
+    reweighted = engine.blend_task(task, cache=cache)
+    assert cache.misses == misses
+    item = task.items[1]
+    img = cache.get(item.path)
+    masks = [engine.layer_mask(cache, item, img, cv2.IMREAD_COLOR, (60, 40)) for _ in range(2)]
+    assert masks[0].product is masks[1].product
+    assert masks[0].broadcast is masks[1].broadcast
+    assert np.array_equal(reweighted, engine.blend_task(task, cache=image_cache.ImageCache(64)))
+    
+    # 遮罩文件改变后重新计算
+    task.items[1].weight = 1.0
+    write_mask(tmp_path, 1)
+    changed = engine.blend_task(task, cache=cache)
+    assert not np.array_equal(changed, first)
+    assert np.array_equal(changed, engine.blend_task(task, cache=image_cache.ImageCache(64)))
+
+
+def test_shared_cache_releases_masks(tmp_path):
+    task = masked_task(tmp_path)
+    cache = scheduler.SharedInputCache([task])
+    expected = engine.blend_task(task, cache=image_cache.ImageCache(64))
+    assert np.array_equal(engine.blend_task(task, cache=cache), expected)
+    cache.release(task)
+    assert cache.current_bytes == 0
@@ -0,0 +1,63 @@
+"""exporter 模块的批量导出"""
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import exporter
+from models import BlendItem, BlendTask
+
+SIZE = 256
+LAYERS = 3
+
+
+def build_groups(tmp_path, count):
+    """count 组可批量混合的作业：每组两个任务，组内输入相同、权重不同，各组输入不同"""
+    rng = np.random.default_rng(0)
+    tmp_path.mkdir(exist_ok=True)
+    jobs = []
+    for group in range(count):
+        paths = []
+        for layer in range(LAYERS):
+            path = tmp_path / f"g{group}_{layer}.png"
+            cv2.imwrite(str(path), rng.integers(0, 256, (SIZE, SIZE, 3), dtype=np.uint8))
+            paths.append(str(path))
+        for variant in range(2):
+            task = BlendTask(f"g{group}-{variant}")
+            for layer, path in enumerate(paths):
+                item = BlendItem(f"layer{layer}", path)
+                item.weight = 0.5 + 0.25 * variant
+                task.items.append(item)
+            jobs.append((task, str(tmp_path / f"{task.name}.npy")))
+    return jobs
+
+
+def export_peak(jobs):
+    """导出 jobs，返回 tracemalloc 记录的峰值内存（字节）"""
+    tracemalloc.start()
+    try:
+        results = list(exporter.export_batch(jobs, export_options={'format': "npy"}))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert all(written and error is None for _, written, error in results)
+    return peak
+
+
+def test_batch_groups_released_after_last_member(tmp_path):
+    # 每组堆叠的输入约为 LAYERS * SIZE * SIZE * 3 * 4 字节，组的结果全部取出后应被释放，
+    # 峰值内存不随组数增长
+    few = export_peak(build_groups(tmp_path / "few", 2))
+    many = export_peak(build_groups(tmp_path / "many", 12))
+    group_bytes = LAYERS * SIZE * SIZE * 3 * 4
+    assert many < few + 2 * group_bytes
+
+
+def test_batch_results_match_individual_export(tmp_path):
+    jobs = build_groups(tmp_path, 2)
+    assert all(error is None for _, _, error in exporter.export_batch(
+        jobs, export_options={'format': "npy"}))
+    for task, path in jobs:
+        single = str(tmp_path / f"single-{task.name}.npy")
+        assert exporter.export_task(task, single, export_options={'format': "npy"})
+        assert np.abs(np.load(path).astype(int) - np.load(single).astype(int)).max() <= 1
@@ -0,0 +1,141 @@
+"""kernels 模块的逐像素权重（遮罩）"""
+import numpy as np
+import pytest
+
+import kernels
+from models import BLEND_MODES
+
+SHAPE = (16, 20)
+
+
+def layers(channels, dtype=np.uint8, count=3, seed=0):
+    info = np.iinfo(dtype)
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, info.max, SHAPE + (channels,)).astype(dtype) for _ in range(count)]
+
+
+@pytest.mark.parametrize("channels", [3, 4])
+@pytest.mark.parametrize("blend_mode", BLEND_MODES)
+def test_zero_mask_leaves_result_unchanged(channels, blend_mode):
+    base, detail, top = layers(channels)
+    result = np.zeros(SHAPE + (channels,), dtype=np.float32)
+    scratch = kernels.Scratch()
+    total = kernels.apply_layer(result, base, "Normal", 1.0, 0, scratch)
+    total = kernels.apply_layer(result, detail, "Overlay", 0.5, total, scratch)
+    before = result.copy()
+    
+    # 左半边遮罩为 0，右半边为 1
+    plane = np.zeros(SHAPE, dtype=np.float32)
+    plane[:, SHAPE[1] // 2:] = 1
+    total = kernels.apply_layer(result, top, blend_mode, 0.8, total, scratch,
+                                kernels.LayerMask(plane, top))
+    left = slice(None, SHAPE[1] // 2)
+    assert np.array_equal(result[:, left], before[:, left])
+    assert np.all(total[:, left] == 1.5)
+
+
+@pytest.mark.parametrize("channels", [3, 4])
+@pytest.mark.parametrize("blend_mode", BLEND_MODES)
+def test_full_mask_matches_scalar_weight(channels, blend_mode):
+    images = layers(channels, np.uint16)
+    expected = np.zeros(SHAPE + (channels,), dtype=np.float32)
+    masked = expected.copy()
+    scratch = kernels.Scratch()
+    plane = np.ones(SHAPE, dtype=np.float32)
+    scalar_total = masked_total = 0
+    for img, mode in zip(images, ["Normal", blend_mode, blend_mode]):
+        scalar_total = kernels.apply_layer(expected, img, mode, 0.7, scalar_total, scratch)
+        masked_total = kernels.apply_layer(masked, img, mode, 0.7, masked_total, scratch,
+                                           kernels.LayerMask(plane, img))
+    np.testing.assert_allclose(kernels.normalize(masked, masked_total, "float"),
+                               kernels.normalize(expected, scalar_total, "float"), atol=1e-4)
+
+
+# 法线贴图模式：与按公式直接计算的结果比较。贴图的 B、G、R 通道依次为法线的 z、y、x
+
+def random_normals(seed):
+    rng = np.random.default_rng(seed)
+    normals = rng.uniform(-0.7, 0.7, SHAPE + (3,))
+    normals[..., 2] = rng.uniform(0.3, 1.0, SHAPE)
+    return normals / np.linalg.norm(normals, axis=-1, keepdims=True)
+
+
+def encode(normals):
+    """(x, y, z) 法线 -> [0, 1] 的 BGR float32 贴图"""
+    return (normals[..., ::-1] * 0.5 + 0.5).astype(np.float32)
+
+
+def decode(img):
+    return img[..., ::-1].astype(np.float64) * 2 - 1
+
+
+def unit(vectors):
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def reference_udn(base, detail):
+    return unit(np.stack([base[..., 0] + detail[..., 0], base[..., 1] + detail[..., 1],
+                          base[..., 2]], axis=-1))
+
+
+def reference_whiteout(base, detail):
+    return unit(np.stack([base[..., 0] + detail[..., 0], base[..., 1] + detail[..., 1],
+                          base[..., 2] * detail[..., 2]], axis=-1))
+
+
+def reference_rnm(base, detail):
+    t = base + [0, 0, 1]
+    u = detail * [-1, -1, 1]
+    return unit(t * np.sum(t * u, axis=-1, keepdims=True) - u * t[..., 2:])
+
+
+REFERENCES = {"UDN": reference_udn, "Whiteout": reference_whiteout, "RNM": reference_rnm}
+
+
+def blend_normals(base, detail, blend_mode, weight=1.0, mask=None):
+    """base 按 Normal、detail 按 blend_mode 混合，返回解码后的法线"""
+    result = np.zeros(SHAPE + (3,), dtype=np.float32)
+    scratch = kernels.Scratch()
+    total = kernels.apply_layer(result, encode(base), "Normal", 1.0, 0, scratch)
+    img = encode(detail)
+    layer_mask = None if mask is None else kernels.LayerMask(mask.astype(np.float32), img)
+    total = kernels.apply_layer(result, img, blend_mode, weight, total, scratch, layer_mask)
+    return decode(kernels.normalize(result, total, "float"))
+
+
+@pytest.mark.parametrize("blend_mode", sorted(REFERENCES))
+def test_normal_map_formula(blend_mode):
+    base, detail = random_normals(1), random_normals(2)
+    np.testing.assert_allclose(blend_normals(base, detail, blend_mode),
+                               REFERENCES[blend_mode](base, detail), atol=1e-5)
+
+
+@pytest.mark.parametrize("blend_mode", sorted(REFERENCES))
+def test_flat_detail_is_identity(blend_mode):
+    base = random_normals(3)
+    flat = np.zeros(SHAPE + (3,))
+    flat[..., 2] = 1
+    np.testing.assert_allclose(blend_normals(base, flat, blend_mode), base, atol=1e-5)
+    if blend_mode != "UDN":
+        # RNM 和 Whiteout 在平坦的底图上得到细节法线本身（UDN 丢弃细节的 z）
+        detail = random_normals(4)
+        np.testing.assert_allclose(blend_normals(flat, detail, blend_mode), detail, atol=1e-5)
+
+
+@pytest.mark.parametrize("blend_mode", sorted(REFERENCES))
+def test_normal_map_partial_strength(blend_mode):
+    # 权重小于 1 时与原结果按强度插值后重新归一化
+    base, detail = random_normals(5), random_normals(6)
+    expected = unit(base + 0.4 * (REFERENCES[blend_mode](base, detail) - base))
+    np.testing.assert_allclose(blend_normals(base, detail, blend_mode, 0.4), expected, atol=1e-5)
+
+
+@pytest.mark.parametrize("blend_mode", sorted(REFERENCES))
+def test_masked_normal_map(blend_mode):
+    # 强度为 weight * mask，逐像素插值；遮罩为 0 的像素保持原结果
+    base, detail = random_normals(7), random_normals(8)
+    mask = np.random.default_rng(9).choice([0.0, 0.25, 0.5, 1.0], SHAPE)
+    strength = np.clip(0.8 * mask, 0, 1)[..., None]
+    expected = unit(base + strength * (REFERENCES[blend_mode](base, detail) - base))
+    np.testing.assert_allclose(blend_normals(base, detail, blend_mode, 0.8, mask), expected,
+                               atol=1e-5)
@@ -0,0 +1,154 @@
+"""JSON 与 .blendpack 配置、to_dict / from_dict 的往返一致性"""
+import struct
+import zlib
+
+import pytest
+
+import config
+import packed_config
+from models import BlendItem, BlendTask
+
+
+def build_tasks(base_dir):
+    """覆盖任务输出设置、禁用的任务和子项、遮罩和 alpha 权重的几个任务"""
+    textures = base_dir / "textures"
+    base = str(textures / "base.png")
+    detail = str(textures / "detail.png")
+    mask = str(textures / "mask.png")
+    
+    plain = BlendTask("plain")
+    plain.items.append(BlendItem("base.png", base))
+    
+    configured = BlendTask("configured")
+    configured.output_options = {'format': "tif", 'precision': "16bit",
+                                 'tiff_compression': "zstd", 'size': [640, 480]}
+    item = BlendItem("detail.png", detail)
+    item.weight = 0.35
+    item.blend_mode = "RNM"
+    configured.items.append(item)
+    
+    disabled = BlendTask("disabled")
+    disabled.enabled = False
+    item = BlendItem("base.png", base)
+    item.enabled = False
+    disabled.items.append(item)
+    disabled.items.append(BlendItem("detail.png", detail))
+    
+    masked = BlendTask("masked")
+    masked.items.append(BlendItem("base.png", base))
+    item = BlendItem("detail.png", detail)
+    item.blend_mode = "Overlay"
+    item.mask = mask
+    masked.items.append(item)
+    item = BlendItem("detail.png", detail)
+    item.alpha_weight = True
+    masked.items.append(item)
+    item = BlendItem("detail.png", detail)
+    item.mask = mask
+    item.alpha_weight = True
+    item.enabled = False
+    masked.items.append(item)
+    
+    return [plain, configured, disabled, masked, BlendTask("empty")]
+
+
+def dicts(tasks):
+    return [task.to_dict() for task in tasks]
+
+
+def test_dict_round_trip(tmp_path):
+    tasks = build_tasks(tmp_path)
+    assert dicts(BlendTask.from_dict(task.to_dict()) for task in tasks) == dicts(tasks)
+
+
+@pytest.mark.parametrize("suffix", [".json", config.PACKED_SUFFIX])
+def test_file_round_trip(tmp_path, suffix):
+    tasks = build_tasks(tmp_path)
+    path = tmp_path / f"tasks{suffix}"
+    config.save_config(tasks, str(path))
+    assert dicts(config.load_config(str(path))) == dicts(tasks)
+
+
+@pytest.mark.parametrize("first, second", [(".json", config.PACKED_SUFFIX),
+                                           (config.PACKED_SUFFIX, ".json")])
+def test_convert_between_formats(tmp_path, first, second):
+    tasks = build_tasks(tmp_path)
+    config.save_config(tasks, str(tmp_path / f"a{first}"))
+    config.save_config(config.load_config(str(tmp_path / f"a{first}")),
+                       str(tmp_path / f"b{second}"))
+    assert dicts(config.load_config(str(tmp_path / f"b{second}"))) == dicts(tasks)
+
+
+def test_paths_relative_to_config(tmp_path):
+    # 配置文件移动到其他目录（连同贴图）后路径仍然有效
+    tasks = build_tasks(tmp_path / "project")
+    (tmp_path / "project").mkdir()
+    for suffix in (".json", config.PACKED_SUFFIX):
+        config.save_config(tasks, str(tmp_path / "project" / f"tasks{suffix}"))
+    (tmp_path / "project").rename(tmp_path / "moved")
+    expected = dicts(build_tasks(tmp_path / "moved"))
+    for suffix in (".json", config.PACKED_SUFFIX):
+        assert dicts(config.load_config(str(tmp_path / "moved" / f"tasks{suffix}"))) == expected
+
+
+def write_version_1(tasks, path):
+    """写出版本 1 的 .blendpack：版本 2 去掉末尾的遮罩和 alpha 权重两列"""
+    packed_config.write(tasks, str(path))
+    body = path.read_bytes()[:-4]
+    item_count = sum(len(task.items) for task in tasks)
+    body = body[:4] + struct.pack("<H", 1) + body[6:len(body) - item_count * 5]
+    path.write_bytes(body + struct.pack("<I", zlib.crc32(body)))
+
+
+def test_read_version_1(tmp_path):
+    tasks = build_tasks(tmp_path)
+    path = tmp_path / "old.blendpack"
+    write_version_1(tasks, path)
+    
+    # 版本 1 没有遮罩和 alpha 权重，其余内容不变
+    for task in tasks:
+        for item in task.items:
+            item.mask = None
+            item.alpha_weight = False
+    assert dicts(packed_config.read(str(path))) == dicts(tasks)
+
+
+def test_newer_version_rejected(tmp_path):
+    path = tmp_path / "new.blendpack"
+    packed_config.write(build_tasks(tmp_path), str(path))
+    body = path.read_bytes()[:-4]
+    body = body[:4] + struct.pack("<H", packed_config.VERSION + 1) + body[6:]
+    path.write_bytes(body + struct.pack("<I", zlib.crc32(body)))
+    with pytest.raises(config.ConfigError):
+        config.load_config(str(path))
+
+
+def negative_weight(task):
+    task.items[0].weight = -0.5
+
+
+def unknown_output_key(task):
+    task.output_options = {'format': "png", 'quality': 3}
+
+
+@pytest.mark.parametrize("suffix", [".json", config.PACKED_SUFFIX])
+@pytest.mark.parametrize("invalidate", [negative_weight, unknown_output_key])
+def test_invalid_task_rejected(tmp_path, suffix, invalidate):
+    # 两种格式对同一组任务的检查相同
+    tasks = build_tasks(tmp_path)
+    invalidate(tasks[1])
+    path = tmp_path / f"tasks{suffix}"
+    config.save_config(tasks, str(path))
+    with pytest.raises(config.ConfigError, match="第 2 个任务 'configured'"):
+        config.load_config(str(path))
+
+
+def test_invalid_alpha_weight_rejected(tmp_path):
+    path = tmp_path / "tasks.blendpack"
+    packed_config.write(build_tasks(tmp_path), str(path))
+    # alpha 权重是校验前的最后一列，只允许 0 和 1
+    body = bytearray(path.read_bytes()[:-4])
+    body[-1] = 2
+    path.write_bytes(bytes(body) + struct.pack("<I", zlib.crc32(body)))
+    with pytest.raises(config.ConfigError):
+        config.load_config(str(path))
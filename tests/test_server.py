@@ -0,0 +1,132 @@
+"""server 模块的作业合并、状态和错误处理"""
+import http.client
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import config
+import encoders
+import engine
+import server
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = server.BlendService(str(tmp_path / "out"), workers=2, cache_mb=16)
+    os.makedirs(service.output_dir)
+    yield service
+    service.shutdown()
+
+
+def task_data(tmp_path, **output):
+    path = str(tmp_path / "base.png")
+    if not os.path.exists(path):
+        cv2.imwrite(path, np.random.default_rng(0).integers(0, 256, (16, 24, 3), dtype=np.uint8))
+    data = {'name': "t", 'items': [{'name': "base", 'path': path}]}
+    if output:
+        data['output'] = output
+    return data
+
+
+def wait_idle(service):
+    # 完成回调在工作线程中执行，可能晚于 future.result() 返回
+    deadline = time.monotonic() + 5
+    while service._in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_identical_tasks_coalesced(service, tmp_path, monkeypatch):
+    release = threading.Event()
+    blend = service._blend
+    
+    def blocked(*args):
+        release.wait(5)
+        return blend(*args)
+    
+    monkeypatch.setattr(service, "_blend", blocked)
+    first, first_coalesced = service.submit(task_data(tmp_path))
+    second, second_coalesced = service.submit(task_data(tmp_path))
+    assert second is first
+    assert (first_coalesced, second_coalesced) == (False, True)
+    
+    # 返回字节的请求不与写出文件的请求合并
+    as_bytes, bytes_coalesced = service.submit(task_data(tmp_path), to_file=False)
+    assert as_bytes is not first and not bytes_coalesced
+    
+    status = service.status()
+    assert status['queue_depth'] + status['in_flight'] == 2
+    assert status['coalesced'] == 1
+    
+    release.set()
+    result = first.result()
+    assert os.path.isabs(result['output_path']) and os.path.exists(result['output_path'])
+    assert not result['reused']
+    assert as_bytes.result()['data'] is not None
+    
+    # 完成后再次请求同一任务时直接返回已写出的文件
+    wait_idle(service)
+    again, coalesced = service.submit(task_data(tmp_path))
+    assert not coalesced
+    assert again.result() == dict(result, reused=True)
+    
+    status = service.status()
+    assert (status['queue_depth'], status['in_flight']) == (0, 0)
+    assert (status['completed'], status['failed'], status['reused']) == (3, 0, 1)
+    assert status['latency_ms']['count'] == 3
+
+
+@pytest.mark.parametrize("key", ["path", "mask"])
+def test_relative_paths_rejected(service, tmp_path, key):
+    data = task_data(tmp_path)
+    data['items'][0][key] = "textures/base.png"
+    with pytest.raises(config.ConfigError, match="绝对路径"):
+        service.submit(data)
+
+
+def test_failures_reported(service, tmp_path):
+    # 第一张贴图无法读取
+    data = task_data(tmp_path)
+    data['items'][0]['path'] = str(tmp_path / "missing.png")
+    with pytest.raises(engine.BlendError):
+        service.submit(data)[0].result()
+    
+    # 格式不支持该精度
+    with pytest.raises(encoders.EncodeError):
+        service.submit(task_data(tmp_path, format="exr", precision="8bit"))[0].result()
+    
+    wait_idle(service)
+    status = service.status()
+    assert (status['completed'], status['failed']) == (0, 2)
+
+
+def test_http_error_responses(service, tmp_path):
+    http_server = server.create_server(service, port=0)
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    
+    def post(body):
+        connection = http.client.HTTPConnection("127.0.0.1", http_server.server_address[1])
+        connection.request("POST", "/blend", body=json.dumps(body).encode('utf-8'))
+        response = connection.getresponse()
+        payload = json.loads(response.read())
+        connection.close()
+        return response.status, payload
+    
+    try:
+        relative = task_data(tmp_path)
+        relative['items'][0]['path'] = "base.png"
+        assert post(relative)[0] == 400
+        assert post([1, 2])[0] == 400
+        missing = task_data(tmp_path)
+        missing['items'][0]['path'] = str(tmp_path / "missing.png")
+        assert post(missing)[0] == 422
+        status, payload = post(task_data(tmp_path))
+        assert status == 200 and os.path.exists(payload['output_path'])
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
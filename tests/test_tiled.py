@@ -0,0 +1,71 @@
+"""tiled 模块的逐条带重采样与分块混合"""
+import cv2
+import numpy as np
+import pytest
+
+import encoders
+import engine
+import image_cache
+import tiled
+from models import BlendItem, BlendTask
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+@pytest.mark.parametrize("interpolation", [cv2.INTER_NEAREST, cv2.INTER_LINEAR, cv2.INTER_CUBIC,
+                                           cv2.INTER_LANCZOS4])
+@pytest.mark.parametrize("target", [(70, 30), (262, 194), (60, 150)])
+def test_strip_resample_matches_resize(dtype, interpolation, target):
+    # 噪声输入最容易暴露坐标和系数的差异
+    info = np.iinfo(dtype)
+    src = np.random.default_rng(0).integers(0, info.max, (97, 131, 3)).astype(dtype)
+    source = tiled.StripSource(src, False)
+    width, height = target
+    expected = cv2.resize(src, target, interpolation=interpolation).astype(np.int64)
+    strips = np.concatenate([source._resample_rows(y, min(height, y + 7), width, height,
+                                                   interpolation)
+                             for y in range(0, height, 7)]).astype(np.int64)
+    # 8 位最多相差 1 个色阶，16 位按 8 位色阶换算
+    assert np.abs(expected - strips).max() <= max(1, info.max // 255)
+
+
+@pytest.mark.parametrize("interpolation", ["auto", "linear", "lanczos", "area"])
+def test_downscaled_layers_match_engine(tmp_path, interpolation):
+    # 缩小的图层整体缩放，即使 Overlay 和 RNM 放大误差，结果也与内存中混合完全相同
+    rng = np.random.default_rng(1)
+    task = BlendTask("t")
+    for index, (size, mode) in enumerate([((150, 100), "Normal"), ((301, 203), "Overlay"),
+                                          ((400, 250), "RNM")]):
+        path = str(tmp_path / f"layer{index}.png")
+        cv2.imwrite(path, rng.integers(0, 256, size[::-1] + (3,), dtype=np.uint8))
+        item = BlendItem(f"layer{index}", path)
+        item.blend_mode = mode
+        task.items.append(item)
+    task.output_options = {'interpolation': interpolation}
+    
+    expected = engine.blend_task(task, cache=image_cache.ImageCache(64),
+                                 interpolation=interpolation)
+    output = str(tmp_path / "tiled.png")
+    tiled.blend_task_tiled(task, output, 0.05, options=encoders.resolve_options(task=task))
+    assert np.array_equal(cv2.imread(output), expected)
+
+
+def test_rgb_tiff_mask_matches_engine(tmp_path):
+    # 未压缩的 RGB TIFF 可以内存映射，遮罩仍应与 engine 一样按灰度读取，而不是取第一个通道
+    tifffile = pytest.importorskip("tifffile")
+    rng = np.random.default_rng(3)
+    task = BlendTask("t")
+    for index, mode in enumerate(["Normal", "Overlay"]):
+        path = str(tmp_path / f"layer{index}.png")
+        cv2.imwrite(path, rng.integers(0, 256, (60, 80, 3), dtype=np.uint8))
+        item = BlendItem(f"layer{index}", path)
+        item.blend_mode = mode
+        task.items.append(item)
+    mask_path = str(tmp_path / "mask.tif")
+    tifffile.imwrite(mask_path, rng.integers(0, 256, (60, 80, 3), dtype=np.uint8),
+                     photometric='rgb')
+    task.items[1].mask = mask_path
+    
+    expected = engine.blend_task(task, cache=image_cache.ImageCache(64))
+    output = str(tmp_path / "tiled.png")
+    tiled.blend_task_tiled(task, output, 0.05, options=encoders.resolve_options(task=task))
+    assert np.array_equal(cv2.imread(output), expected)
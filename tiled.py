@@ -0,0 +1,431 @@
+"""
+分块（条带）混合引擎
+
+按水平条带依次混合所有图层并逐条写出结果，峰值内存由 max_memory_mb 控制，
+用于超大贴图（例如 16K 地形法线贴图）的导出。
+
+输入读取方式：
+- .npy 文件直接内存映射
+- 未压缩的 TIFF 在安装了 tifffile 时直接内存映射
+- 其他格式（PNG、JPG 等）无法按条带解码，逐个完整解码后转存为磁盘上的临时 .npy
+  再内存映射，因此峰值内存额外包含一张输入图像的解码结果
+
+输入按 options['precision'] 对应的位深读取（见 encoders 模块），
+内存映射的 .npy 和 TIFF 始终保持原始位深。
+
+尺寸与输出不同的图层按 options['size'] 和 options['interpolation'] 缩放：
+- nearest 逐条带重采样，只读取所需的源行，结果与整体缩放相同
+- 缩小的图层（缩放后像素数不多于原图）和 area 插值的图层整体缩放一次后转存为临时 .npy，
+  结果与 engine.blend_task 相同，峰值内存额外包含该图层的原图和缩放结果
+- 放大的图层（linear、cubic、lanczos）逐条带重采样，每个输入与整体缩放最多相差 1 个色阶；
+  法线贴图模式在接近退化的像素（例如两层法线几乎相反）会放大这一差异，
+  需要与内存中混合逐位一致时不要使用分块引擎
+
+带遮罩的图层（见 engine.read_mask）的遮罩贴图和 alpha 同样按条带读取，
+逐像素累积权重只覆盖当前条带，条带行数按逐像素混合额外需要的缓冲区相应减少。
+
+输出写入方式：
+- png 使用流式 PNG 编码（8 位或 16 位），逐条压缩写出
+- npy 直接写入内存映射文件
+- 其他格式先写入临时内存映射文件，最后整体交给 encoders.write_image 编码
+"""
+import os
+import struct
+import tempfile
+import zlib
+
+import cv2
+import numpy as np
+from numpy.lib.format import open_memmap
+
+import encoders
+import engine
+import kernels
+import profiling
+
+# 默认峰值内存预算（MB）
+DEFAULT_TILE_MEMORY_MB = 256
+
+# 未指定 PNG 压缩级别时流式编码器使用的级别
+DEFAULT_PNG_COMPRESSION = 6
+
+# 每行像素估算的字节数系数：累积结果、Overlay 和法线贴图模式的临时数组、输入条带和重采样坐标
+_FLOAT_BUFFERS_PER_ROW = 7
+# 有带遮罩的图层时的系数：另有逐像素权重、它与贴图的乘积、累积权重和法线贴图模式的插值缓冲区
+_MASKED_FLOAT_BUFFERS_PER_ROW = 12
+
+# 逐条带重采样时在目标行对应的源行两侧多读取的行数（lanczos 的插值核半径为 4）
+_RESAMPLE_MARGIN = 4
+
+
+class StripSource:
+    """可按行读取的输入图像"""
+    
+    def __init__(self, array, is_rgb=False):
+        self.array = array
+        self.is_rgb = is_rgb
+        self.height, self.width = array.shape[:2]
+    
+    def read_rows(self, y0, y1, target_size, channels=3, interpolation=cv2.INTER_LINEAR):
+        """读取目标尺寸下第 y0 到 y1 行（不含 y1），返回 channels 个通道的 BGR(A) 数组
+        
+        interpolation 为 cv2 的插值方式，不支持 INTER_AREA（先用 resized() 整体缩放）。
+        """
+        return self._read(y0, y1, target_size, interpolation,
+                          lambda rows: self._to_bgr(rows, channels))
+    
+    def read_mask(self, y0, y1, target_size, channel=None, interpolation=cv2.INTER_LINEAR):
+        """与 read_rows 相同，但返回第 channel 个通道（None 为灰度）在 [0, 1] 的 float32 数组"""
+        return self._read(y0, y1, target_size, interpolation,
+                          lambda rows: engine.mask_plane(rows, channel))
+    
+    def _read(self, y0, y1, target_size, interpolation, convert):
+        target_width, target_height = target_size
+        if (self.width, self.height) == (target_width, target_height):
+            # 内存映射的数据在转换（convert）时才从磁盘读取
+            with profiling.stage("decode"):
+                return convert(np.asarray(self.array[y0:y1]))
+        with profiling.stage("resize"):
+            return convert(self._resample_rows(y0, y1, target_width, target_height,
+                                               interpolation))
+    
+    @property
+    def has_alpha(self):
+        return self.array.ndim == 3 and self.array.shape[2] > 3
+    
+    def _resample_rows(self, y0, y1, target_width, target_height, interpolation):
+        """重采样目标行，坐标映射与相同插值方式的 cv2.resize 一致"""
+        scale_y = self.height / target_height
+        scale_x = self.width / target_width
+        if interpolation == cv2.INTER_NEAREST:
+            # cv2.resize 的最近邻取 floor(目标坐标 * 缩放比例)
+            src_y = np.minimum(np.floor(np.arange(y0, y1) * scale_y), self.height - 1)
+            src_x = np.minimum(np.floor(np.arange(target_width) * scale_x), self.width - 1)
+            src_y = src_y.astype(np.float32)
+            src_x = src_x.astype(np.float32)
+        else:
+            src_y = (np.arange(y0, y1, dtype=np.float32) + 0.5) * scale_y - 0.5
+            src_x = (np.arange(target_width, dtype=np.float32) + 0.5) * scale_x - 0.5
+        
+        # 只读取覆盖这些目标行所需的源行
+        band_y0 = max(0, int(np.floor(src_y[0])) - _RESAMPLE_MARGIN)
+        band_y1 = min(self.height, int(np.ceil(src_y[-1])) + _RESAMPLE_MARGIN + 1)
+        band = np.ascontiguousarray(self.array[band_y0:band_y1])
+        if interpolation == cv2.INTER_LANCZOS4:
+            return _lanczos_rows(band, band_y0, src_y, target_width, self.height)
+        
+        map_x = np.tile(src_x, (y1 - y0, 1))
+        map_y = np.repeat((src_y - band_y0)[:, None], target_width, axis=1)
+        return cv2.remap(band, map_x, map_y, interpolation, borderMode=cv2.BORDER_REPLICATE)
+    
+    def resized(self, target_size, interpolation, temp_dir):
+        """整体缩放到 target_size=(宽, 高) 并转存到 temp_dir，返回新的 StripSource"""
+        with profiling.stage("resize"):
+            img = cv2.resize(np.asarray(self.array), tuple(target_size),
+                             interpolation=interpolation)
+            return StripSource(_spill(img, temp_dir), self.is_rgb)
+    
+    @property
+    def channels(self):
+        return engine.image_channels(self.array)
+    
+    def _to_bgr(self, rows, channels):
+        if rows.ndim == 3 and self.is_rgb and rows.shape[2] >= 3:
+            rows = rows[..., [2, 1, 0, 3][:rows.shape[2]]]
+        return np.ascontiguousarray(engine.match_channels(rows, channels))
+
+
+def _lanczos_rows(band, band_y0, src_y, target_width, height):
+    """Lanczos 重采样源行 band（从第 band_y0 行开始）中的目标行，src_y 为各目标行的源坐标
+    
+    cv2.remap 的坐标只精确到 1/32 像素，Lanczos 结果与 cv2.resize 可能相差数个色阶。
+    这里与 cv2.resize 一样分两步：水平方向直接用 cv2.resize（行数不变时竖直方向的系数为恒等），
+    竖直方向按 cv2 的 8 个采样点和系数（越界的行取边缘行）加权求和。
+    """
+    rows = cv2.resize(band.astype(np.float32), (target_width, band.shape[0]),
+                      interpolation=cv2.INTER_LANCZOS4)
+    base = np.floor(src_y)
+    offsets = np.arange(-3, 5)
+    distance = (src_y - base).astype(np.float64)[:, None] - offsets
+    weights = np.sinc(distance) * np.sinc(distance / 4)
+    weights /= weights.sum(axis=1, keepdims=True)
+    taps = np.clip(base.astype(np.int64)[:, None] + offsets, 0, height - 1) - band_y0
+    
+    shape = (len(src_y),) + (1,) * (rows.ndim - 1)
+    result = np.zeros((len(src_y),) + rows.shape[1:], dtype=np.float32)
+    for tap in range(len(offsets)):
+        result += weights[:, tap].astype(np.float32).reshape(shape) * rows[taps[:, tap]]
+    if np.issubdtype(band.dtype, np.integer):
+        info = np.iinfo(band.dtype)
+        result = np.clip(np.rint(result, out=result), info.min, info.max)
+    return result.astype(band.dtype)
+
+
+def _spill(img, temp_dir):
+    """将数组转存为 temp_dir 中的临时 .npy，返回其内存映射"""
+    fd, spill_path = tempfile.mkstemp(suffix='.npy', dir=temp_dir)
+    os.close(fd)
+    spilled = open_memmap(spill_path, mode='w+', dtype=img.dtype, shape=img.shape)
+    spilled[:] = img
+    spilled.flush()
+    del spilled
+    return np.load(spill_path, mmap_mode='r')
+
+
+def open_source(path, temp_dir, flags=cv2.IMREAD_COLOR):
+    """打开输入图像，无法读取时返回 None；flags 为非内存映射格式的 cv2.imread 读取方式
+    
+    flags 为 engine.MASK_FLAGS（遮罩）时，多通道的 .npy 和 TIFF 不做内存映射，
+    与 engine.read_mask 一样由 cv2.imread 转换为灰度（cv2 无法读取的 .npy 返回 None）。
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if profiling.enabled() and os.path.exists(path):
+        profiling.count("bytes_read", os.path.getsize(path))
+    array = None
+    is_rgb = False
+    try:
+        if ext == '.npy':
+            array = np.load(path, mmap_mode='r')
+        tifffile = encoders.load_tifffile() if ext in ('.tif', '.tiff') else None
+        if tifffile is not None:
+            array = tifffile.memmap(path, mode='r')
+            is_rgb = True
+    except (OSError, ValueError):
+        pass  # 压缩的 TIFF 等无法映射的文件按普通格式处理
+    if array is not None:
+        if flags != engine.MASK_FLAGS or array.ndim < 3 or array.shape[2] < 3:
+            return StripSource(array, is_rgb)
+        del array
+    
+    with profiling.stage("decode"):
+        img = cv2.imread(path, flags)
+        if img is None:
+            return None
+        
+        # 转存到磁盘后释放解码结果，避免同时持有所有输入图像
+        return StripSource(_spill(img, temp_dir))
+
+
+class PNGStreamWriter:
+    """逐行压缩写出的 8 位或 16 位 PNG 编码器"""
+    
+    COLOR_TYPES = {1: 0, 3: 2, 4: 6}  # 通道数 -> PNG 颜色类型
+    
+    def __init__(self, path, width, height, channels=3, compress_level=6, bit_depth=8):
+        self.channels = channels
+        self.bit_depth = bit_depth
+        self._file = open(path, 'wb')
+        self._compressor = zlib.compressobj(compress_level)
+        self._prev_row = np.zeros(width * channels * bit_depth // 8, dtype=np.uint8)
+        self._file.write(b'\x89PNG\r\n\x1a\n')
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, bit_depth,
+                                               self.COLOR_TYPES[channels], 0, 0, 0))
+    
+    def write_rows(self, rows):
+        """写出若干行 BGR(A) 像素（uint8 或 uint16，与 bit_depth 一致）"""
+        with profiling.stage("encode"):
+            if self.channels >= 3:
+                rows = rows[..., [2, 1, 0, 3][:self.channels]]
+            if self.bit_depth == 16:
+                # PNG 的 16 位采样为大端序；滤波按字节进行，与位深无关
+                rows = np.ascontiguousarray(rows, dtype='>u2').view(np.uint8)
+            flat = rows.reshape(rows.shape[0], -1)
+            
+            # 使用 Up 滤波（与上一行相减），法线贴图这类平滑图像压缩率更好
+            prev = np.vstack([self._prev_row[None], flat[:-1]])
+            filtered = np.empty((flat.shape[0], flat.shape[1] + 1), dtype=np.uint8)
+            filtered[:, 0] = 2
+            np.subtract(flat, prev, out=filtered[:, 1:], dtype=np.uint8)
+            self._prev_row = flat[-1].copy()
+            
+            data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._write_chunk(b'IDAT', data)
+    
+    def close(self):
+        with profiling.stage("encode"):
+            data = self._compressor.flush()
+        self._write_chunk(b'IDAT', data)
+        self._write_chunk(b'IEND', b'')
+        self._file.close()
+    
+    def abort(self):
+        self._file.close()
+    
+    def _write_chunk(self, chunk_type, data):
+        with profiling.stage("write"):
+            self._file.write(struct.pack('>I', len(data)))
+            self._file.write(chunk_type)
+            self._file.write(data)
+            self._file.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+        profiling.count("bytes_written", len(data) + 12)
+
+
+class MemmapWriter:
+    """写入内存映射的 .npy；输出格式不是 npy 时最后整体交给 encoders.write_image 编码"""
+    
+    def __init__(self, path, width, height, channels, options, temp_dir=None):
+        self.path = path
+        self.options = options
+        self._encode = options['format'] != "npy"
+        self._array_path = path
+        if self._encode:
+            fd, self._array_path = tempfile.mkstemp(suffix='.npy', dir=temp_dir)
+            os.close(fd)
+        dtype, _ = kernels.OUTPUT_DTYPES[options['precision']]
+        self._array = open_memmap(self._array_path, mode='w+', dtype=dtype,
+                                  shape=(height, width, channels))
+        self._row = 0
+    
+    def write_rows(self, rows):
+        with profiling.stage("write"):
+            self._array[self._row:self._row + rows.shape[0]] = rows
+        self._row += rows.shape[0]
+    
+    def close(self):
+        with profiling.stage("write"):
+            self._array.flush()
+        if self._encode:
+            encoders.write_image(self.path, self._array, self.options)
+        else:
+            profiling.count("bytes_written", self._array.nbytes)
+        del self._array
+    
+    def abort(self):
+        del self._array
+
+
+def open_writer(path, width, height, channels, options, temp_dir):
+    if options['format'] == "png":
+        level = options['png_compression']
+        return PNGStreamWriter(path, width, height, channels,
+                               DEFAULT_PNG_COMPRESSION if level is None else level,
+                               16 if options['precision'] == "16bit" else 8)
+    return MemmapWriter(path, width, height, channels, options, temp_dir)
+
+
+def rows_per_strip(width, channels, max_memory_mb, masked=False):
+    """根据内存预算计算每个条带的行数，masked 表示有带遮罩的图层"""
+    buffers = _MASKED_FLOAT_BUFFERS_PER_ROW if masked else _FLOAT_BUFFERS_PER_ROW
+    bytes_per_row = width * channels * 4 * buffers
+    return max(1, int(max_memory_mb * 1024 * 1024) // bytes_per_row)
+
+
+def blend_task_tiled(task, output_path, max_memory_mb=DEFAULT_TILE_MEMORY_MB, temp_dir=None,
+                     options=None):
+    """按条带混合任务并直接写出到 output_path
+    
+    混合规则与 engine.blend_task 相同（所有混合模式都是逐像素的），
+    区别是不在内存中保留整张结果。options 为编码设置（默认按任务设置解析）。
+    返回是否写出了文件。
+    """
+    task = engine.as_task(task)
+    if options is None:
+        options = encoders.resolve_options(task=task)
+    if not task.items:
+        return False
+    
+    precision = options['precision']
+    flags = engine.READ_FLAGS[precision]
+    with tempfile.TemporaryDirectory(dir=temp_dir) as spill_dir:
+        sources = {}  # (路径, 读取方式[, 整体缩放的插值方式]) -> StripSource
+        
+        def source(path, read_flags=flags):
+            key = (path, read_flags)
+            if key not in sources:
+                sources[key] = open_source(path, spill_dir, read_flags)
+            return sources[key]
+        
+        # 参考图层确定通道数（8 位与 engine.blend_task 一致，固定为三通道），尺寸按尺寸策略确定
+        reference = engine.reference_item(task)
+        first = source(reference.path)
+        if first is None:
+            raise engine.BlendError(f"无法读取图像: {reference.path}")
+        
+        layers = [(item, source(item.path)) for item in task.items if item.enabled]
+        layers = [(item, src) for item, src in layers if src is not None]
+        width, height = engine.target_size(
+            [(first.width, first.height)] + [(src.width, src.height) for _, src in layers],
+            options['size'])
+        
+        def resampled(path, read_flags=flags):
+            """(来源, 插值方式)，无法读取时来源为 None
+            
+            area 插值和缩小的来源先整体缩放（只缩放一次），放大的来源逐条带重采样。
+            """
+            src = source(path, read_flags)
+            if src is None:
+                return None, None
+            flag = engine.resample_flag(options['interpolation'], (src.width, src.height),
+                                        (width, height))
+            if (src.width, src.height) == (width, height) or flag == cv2.INTER_NEAREST:
+                return src, flag
+            if flag != cv2.INTER_AREA and width * height > src.width * src.height:
+                return src, flag
+            key = (path, read_flags, flag)
+            if key not in sources:
+                sources[key] = src.resized((width, height), flag, spill_dir)
+            return sources[key], flag
+        
+        def mask_sources(item):
+            """子项的遮罩 [(来源, 插值方式, 通道)]，没有遮罩时为 None，遮罩贴图无法读取时为 False"""
+            if not engine.has_mask(item):
+                return None
+            masks = []
+            if item.mask is not None:
+                src, flag = resampled(item.mask, engine.MASK_FLAGS)
+                if src is None:
+                    return False
+                masks.append((src, flag, None))
+            if item.alpha_weight:
+                src, flag = resampled(item.path, cv2.IMREAD_UNCHANGED)
+                if src is not None and src.has_alpha:
+                    masks.append((src, flag, 3))
+            return masks
+        
+        # 与 engine.blend_task 相同，遮罩贴图无法读取的图层被跳过
+        layers = [(item,) + resampled(item.path) + (mask_sources(item),) for item, _ in layers]
+        layers = [layer for layer in layers if layer[3] is not False]
+        
+        channels = 3 if precision == "8bit" else first.channels
+        strip_rows = rows_per_strip(width, channels, max_memory_mb,
+                                    any(masks is not None for *_, masks in layers))
+        writer = open_writer(output_path, width, height, channels, options, spill_dir)
+        try:
+            scratch = kernels.Scratch()
+            strip = np.empty((strip_rows, width, channels), dtype=np.float32)
+            for y0 in range(0, height, strip_rows):
+                y1 = min(height, y0 + strip_rows)
+                result = strip[:y1 - y0]
+                result.fill(0)
+                total_weight = 0
+                strip_masks = {}  # 遮罩 -> 本条带的 (plane, broadcast)，多个图层共用的遮罩只读取一次
+                for item, src, flag, masks in layers:
+                    img = src.read_rows(y0, y1, (width, height), channels, flag)
+                    mask = None
+                    if masks is not None:
+                        key = tuple((id(mask_src), channel) for mask_src, _, channel in masks)
+                        if key not in strip_masks:
+                            plane = np.ones((y1 - y0, width), dtype=np.float32)
+                            for mask_src, mask_flag, channel in masks:
+                                plane *= mask_src.read_mask(y0, y1, (width, height), channel,
+                                                            mask_flag)
+                            strip_masks[key] = (plane, kernels.mask_broadcast(plane, channels))
+                        plane, broadcast = strip_masks[key]
+                        mask = kernels.LayerMask(plane, img, broadcast)
+                    total_weight = kernels.apply_layer(result, img, item.blend_mode,
+                                                       item.weight, total_weight, scratch, mask)
+                
+                writer.write_rows(kernels.normalize(result, total_weight, precision))
+            writer.close()
+        except BaseException:
+            writer.abort()
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+        finally:
+            # Windows 上需要先释放内存映射才能删除临时文件
+            sources.clear()
+            layers.clear()
+            first = None
+    return True
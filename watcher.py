@@ -0,0 +1,206 @@
+"""
+监视输入贴图，在其改变时找出需要重新导出的任务
+
+由 cli.py 的 --watch 使用：按导出作业建立 输入路径 -> 作业 的反向索引，只监视这些文件
+（以及任务配置文件本身）。文件改变后要等 debounce 秒内没有新的改变才报告
+（美术软件保存时常常分几次写入，或先写临时文件再改名），
+之后只重新混合用到这些文件的任务，而不是重新导出全部任务。
+
+安装了 watchdog 时使用系统的文件通知（Linux 上为 inotify），
+否则每隔 poll_interval 秒比较一次各文件的修改时间和大小。
+"""
+import os
+import queue
+import time
+
+import image_cache
+
+try:
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+# 文件最后一次改变之后等待的秒数
+DEFAULT_DEBOUNCE = 1.0
+# 轮询的间隔（秒）；使用文件通知时为检查 stop_event 的间隔
+DEFAULT_POLL_INTERVAL = 1.0
+
+# 表示文件内容可能改变的 watchdog 事件（读取输入时产生的 opened 等事件不算）
+_CHANGE_EVENTS = frozenset(("created", "modified", "moved", "deleted", "closed"))
+
+
+def normalize_path(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def build_index(jobs):
+    """(task, output_path) 作业列表 -> {规范化的输入路径: 使用它的作业序号列表}
+    
+    只包含启用的子项（贴图和遮罩），禁用的图层改变时不影响输出。
+    """
+    index = {}
+    for position, (task, _) in enumerate(jobs):
+        paths = dict.fromkeys(normalize_path(path) for item in task.items if item.enabled
+                              for path in item.input_paths())
+        for path in paths:
+            index.setdefault(path, []).append(position)
+    return index
+
+
+class _PollingBackend:
+    """定期比较文件的修改时间和大小"""
+    
+    name = "轮询"
+    
+    def __init__(self, interval):
+        self.interval = interval
+        self._snapshot = {}
+        self._next_poll = time.monotonic() + interval
+    
+    def set_paths(self, paths):
+        self._snapshot = {path: image_cache.file_key(path) for path in paths}
+        return []
+    
+    def changes(self, timeout):
+        wait = self._next_poll - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return set()
+        if wait > 0:
+            time.sleep(wait)
+        self._next_poll = time.monotonic() + self.interval
+        
+        changed = set()
+        for path, key in self._snapshot.items():
+            current = image_cache.file_key(path)
+            if current != key:
+                self._snapshot[path] = current
+                changed.add(path)
+        return changed
+    
+    def close(self):
+        pass
+
+
+class _NotifyBackend:
+    """watchdog 的文件系统通知，监视输入文件所在的各个目录（不递归）"""
+    
+    name = "文件通知"
+    
+    def __init__(self):
+        self._events = queue.Queue()
+        self._paths = frozenset()
+        self._observer = Observer()
+        self._observer.start()
+    
+    def set_paths(self, paths):
+        """更换监视的文件，返回因目录不存在而无法监视的目录列表"""
+        self._paths = frozenset(paths)
+        self._observer.unschedule_all()
+        missing = []
+        for directory in sorted({os.path.dirname(path) for path in self._paths}):
+            if os.path.isdir(directory):
+                self._observer.schedule(self, directory, recursive=False)
+            else:
+                missing.append(directory)
+        return missing
+    
+    def dispatch(self, event):
+        # 在 watchdog 的线程中调用；先写临时文件再改名保存时，dest_path 为被替换的文件
+        if event.is_directory or event.event_type not in _CHANGE_EVENTS:
+            return
+        for path in (event.src_path, getattr(event, 'dest_path', '')):
+            if path:
+                path = normalize_path(os.fsdecode(path))
+                if path in self._paths:
+                    self._events.put(path)
+    
+    def changes(self, timeout):
+        changed = set()
+        try:
+            changed.add(self._events.get(timeout=timeout))
+            while True:
+                changed.add(self._events.get_nowait())
+        except queue.Empty:
+            pass
+        return changed
+    
+    def close(self):
+        self._observer.stop()
+        self._observer.join()
+
+
+class TaskWatcher:
+    """监视作业的输入文件和配置文件
+    
+    用法：
+    
+        watcher = TaskWatcher(jobs, config_paths)
+        for paths, affected in watcher.changes():
+            if affected is None:  # 配置文件改变
+                jobs = ...  # 重新读取配置
+                watcher.set_jobs(jobs)
+                affected = jobs
+            ...  # 重新导出 affected
+    """
+    
+    def __init__(self, jobs, config_paths=(), debounce=DEFAULT_DEBOUNCE,
+                 poll_interval=DEFAULT_POLL_INTERVAL, polling=False):
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        if polling or Observer is None:
+            self._backend = _PollingBackend(poll_interval)
+        else:
+            self._backend = _NotifyBackend()
+        self.config_paths = frozenset(normalize_path(path) for path in config_paths)
+        self.jobs = []
+        self.index = {}
+        self.unwatched = []
+        self.set_jobs(jobs)
+    
+    @property
+    def backend_name(self):
+        return self._backend.name
+    
+    def set_jobs(self, jobs):
+        """更换作业（例如重新读取配置后），重建反向索引和监视的文件"""
+        self.jobs = list(jobs)
+        self.index = build_index(self.jobs)
+        self.unwatched = self._backend.set_paths(self.config_paths | self.index.keys())
+    
+    def affected_jobs(self, paths):
+        """paths 中的文件改变后需要重新导出的作业（保持原顺序）"""
+        positions = sorted({position for path in paths for position in self.index.get(path, ())})
+        return [self.jobs[position] for position in positions]
+    
+    def changes(self, stop_event=None):
+        """持续产出 (改变的文件集合, 需要重新导出的作业列表)
+        
+        配置文件改变时作业列表为 None，由调用方重新读取配置并调用 set_jobs。
+        stop_event（threading.Event）被设置后结束，否则一直运行。
+        """
+        pending = {}  # 路径 -> 最后一次改变的时间
+        while stop_event is None or not stop_event.is_set():
+            now = time.monotonic()
+            wait = min((changed_at + self.debounce - now for changed_at in pending.values()),
+                       default=self.poll_interval)
+            for path in self._backend.changes(max(0.0, wait)):
+                pending[path] = time.monotonic()
+            
+            now = time.monotonic()
+            ready = {path for path, changed_at in pending.items()
+                     if now - changed_at >= self.debounce}
+            if not ready:
+                continue
+            for path in ready:
+                del pending[path]
+            
+            if ready & self.config_paths:
+                yield ready, None
+                continue
+            affected = self.affected_jobs(ready)
+            if affected:
+                yield ready, affected
+    
+    def close(self):
+        self._backend.close()